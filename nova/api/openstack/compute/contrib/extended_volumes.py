@@ -28,13 +28,22 @@ class ExtendedVolumesController(wsgi.Controller):
         super(ExtendedVolumesController, self).__init__(*args, **kwargs)
         self.compute_api = compute.API()
 
-    def _extend_server(self, context, server, instance):
-        bdms = block_device_obj.BlockDeviceMappingList.get_by_instance_uuid(
-                context, instance['uuid'])
+    def _extend_server(self, context, server, instance, bdms=None):
+        if bdms is None:
+            bdms = (block_device_obj.BlockDeviceMappingList.
+                    get_by_instance_uuid(context, instance['uuid']))
         volume_ids = [bdm.volume_id for bdm in bdms if bdm.volume_id]
         key = "%s:volumes_attached" % Extended_volumes.alias
         server[key] = [{'id': volume_id} for volume_id in volume_ids]
 
+    def _get_bdms_by_instance(self, context, instances):
+        """Fetch the block device mappings of all the instances at once."""
+        bdms = dict((instance['uuid'], []) for instance in instances)
+        for bdm in (block_device_obj.BlockDeviceMappingList.
+                    get_by_instance_uuids(context, bdms.keys())):
+            bdms[bdm.instance_uuid].append(bdm)
+        return bdms
+
     @wsgi.extends
     def show(self, req, resp_obj, id):
         context = req.environ['nova.context']
@@ -54,11 +63,14 @@ class ExtendedVolumesController(wsgi.Controller):
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedVolumesServersTemplate())
             servers = list(resp_obj.obj['servers'])
-            for server in servers:
-                db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+            # server['id'] is guaranteed to be in the cache due to
+            # the core API adding it in its 'detail' method.
+            instances = [req.get_db_instance(server['id'])
+                         for server in servers]
+            bdms = self._get_bdms_by_instance(context, instances)
+            for server, instance in zip(servers, instances):
+                self._extend_server(context, server, instance,
+                                    bdms[instance['uuid']])
 
 
 class Extended_volumes(extensions.ExtensionDescriptor):
@@ -45,13 +45,22 @@ class ExtendedVolumesController(wsgi.Controller):
         self.compute_api = compute.API()
         self.volume_api = volume.API()
 
-    def _extend_server(self, context, server, instance):
-        bdms = block_device_obj.BlockDeviceMappingList.get_by_instance_uuid(
-                context, instance['uuid'])
+    def _extend_server(self, context, server, instance, bdms=None):
+        if bdms is None:
+            bdms = (block_device_obj.BlockDeviceMappingList.
+                    get_by_instance_uuid(context, instance['uuid']))
         volume_ids = [bdm['volume_id'] for bdm in bdms if bdm['volume_id']]
         key = "%s:volumes_attached" % ExtendedVolumes.alias
         server[key] = [{'id': volume_id} for volume_id in volume_ids]
 
+    def _get_bdms_by_instance(self, context, instances):
+        """Fetch the block device mappings of all the instances at once."""
+        bdms = dict((instance['uuid'], []) for instance in instances)
+        for bdm in (block_device_obj.BlockDeviceMappingList.
+                    get_by_instance_uuids(context, bdms.keys())):
+            bdms[bdm.instance_uuid].append(bdm)
+        return bdms
+
     @extensions.expected_errors((400, 404, 409))
     @wsgi.action('swap_volume_attachment')
     @validation.schema(extended_volumes.swap_volume_attachment)
@@ -116,11 +125,14 @@ class ExtendedVolumesController(wsgi.Controller):
         context = req.environ['nova.context']
         if authorize(context):
             servers = list(resp_obj.obj['servers'])
-            for server in servers:
-                db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+            # server['id'] is guaranteed to be in the cache due to
+            # the core API adding it in its 'detail' method.
+            instances = [req.get_db_instance(server['id'])
+                         for server in servers]
+            bdms = self._get_bdms_by_instance(context, instances)
+            for server, instance in zip(servers, instances):
+                self._extend_server(context, server, instance,
+                                    bdms[instance['uuid']])
 
     @extensions.expected_errors((400, 404, 409))
     @wsgi.response(202)
@@ -148,3 +148,32 @@ def get_instance_availability_zone(context, instance):
         az = get_host_availability_zone(elevated, host)
         cache.set(cache_key, az, AZ_CACHE_SECONDS)
     return az
+
+
+def get_instances_availability_zones(context, instances):
+    """Return availability zones of a list of instances keyed by uuid.
+
+    Hosts missing from the cache are all looked up with one query instead
+    of one query per host.
+    """
+    cache = _get_cache()
+    host_azs = {}
+    for instance in instances:
+        host = str(instance.get('host'))
+        if host and host not in host_azs:
+            host_azs[host] = cache.get(_make_cache_key(host))
+
+    missing = [host for host, az in host_azs.iteritems() if not az]
+    if missing:
+        metadata = db.aggregate_host_get_by_metadata_key(
+            context.elevated(), key='availability_zone')
+        for host in missing:
+            if host in metadata:
+                az = list(metadata[host])[0]
+            else:
+                az = CONF.default_availability_zone
+            cache.set(_make_cache_key(host), az, AZ_CACHE_SECONDS)
+            host_azs[host] = az
+
+    return dict((instance['uuid'], host_azs.get(str(instance.get('host'))))
+                for instance in instances)
@@ -22,6 +22,7 @@ from nova import config
 from nova import objects
 from nova.openstack.common import log as logging
 from nova.openstack.common.report import guru_meditation_report as gmr
+from nova import periodic_task_stats
 from nova import service
 from nova import utils
 from nova import version
@@ -37,6 +38,8 @@ def main():
     utils.monkey_patch()
 
     gmr.TextGuruMeditation.setup_autorun(version)
+    gmr.TextGuruMeditation.register_section(
+        'Periodic Tasks', periodic_task_stats.PeriodicTaskReportGenerator())
 
     server = service.Service.create(binary='nova-conductor',
                                     topic=CONF.conductor.topic,
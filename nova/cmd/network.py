@@ -29,6 +29,7 @@ from nova.objects import base as objects_base
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common.report import guru_meditation_report as gmr
+from nova import periodic_task_stats
 from nova import service
 from nova import utils
 from nova import version
@@ -59,6 +60,8 @@ def main():
     utils.monkey_patch()
 
     gmr.TextGuruMeditation.setup_autorun(version)
+    gmr.TextGuruMeditation.register_section(
+        'Periodic Tasks', periodic_task_stats.PeriodicTaskReportGenerator())
 
     if not CONF.conductor.use_local:
         block_db_access()
@@ -43,3 +43,4 @@ UNRESCUE = 'unrescue'
 CHANGE_PASSWORD = 'changePassword'
 SHELVE = 'shelve'
 UNSHELVE = 'unshelve'
+LIVE_MIGRATION = 'live-migration'
@@ -35,10 +35,13 @@ import traceback
 import uuid
 
 import eventlet.event
+from eventlet import greenpool
 from eventlet import greenthread
 import eventlet.timeout
+from keystoneclient.v2_0 import client as keystone_client
 from oslo.config import cfg
 from oslo import messaging
+import six
 
 from nova import block_device
 from nova.cells import rpcapi as cells_rpcapi
@@ -105,6 +108,12 @@ compute_opts = [
                 help='Whether to batch up the application of IPTables rules'
                      ' during a host restart and apply all at the end of the'
                      ' init phase'),
+    cfg.IntOpt('init_host_concurrency',
+               default=1,
+               help='Number of instances to initialize at the same time '
+                    'when the compute service starts. Raising it makes '
+                    'restarts of hosts with many instances faster, if the '
+                    'virt driver can handle concurrent requests'),
     cfg.StrOpt('instances_path',
                default=paths.state_path_def('instances'),
                help='Where instances are stored on disk'),
@@ -139,10 +148,31 @@ interval_opts = [
                     'Setting this to 0 will disable, but this will change in '
                     'Juno to mean "run at the default rate".'),
     # TODO(gilliard): Clean the above message after the K release
+    cfg.BoolOpt('sync_power_state_from_events',
+                default=False,
+                help='Rely on hypervisor lifecycle events to keep instance '
+                     'power states current. The periodic power state sync '
+                     'then only looks at instances whose last event could '
+                     'not be handled, and does a full sync when the driver '
+                     'reports lost events or every '
+                     'sync_power_state_full_interval seconds. Only used with '
+                     'drivers which number their events, such as libvirt.'),
+    cfg.IntOpt('sync_power_state_full_interval',
+               default=3600,
+               help='Interval in seconds between full power state syncs '
+                    'when sync_power_state_from_events is enabled. These '
+                    'act as a safety net for lost events, and skip '
+                    'instances which had an event within the last '
+                    'sync_power_state_interval seconds.'),
     cfg.IntOpt("heal_instance_info_cache_interval",
                default=60,
                help="Number of seconds between instance info_cache self "
                     "healing updates"),
+    cfg.IntOpt("heal_instance_info_cache_batch_size",
+               default=10,
+               help="Maximum number of instances whose info_cache is "
+                    "refreshed on each self healing update. Instances with "
+                    "the least recently updated info_cache go first."),
     cfg.IntOpt('reclaim_instance_interval',
                default=0,
                help='Interval in seconds for reclaiming deleted instances'),
@@ -226,6 +256,14 @@ CONF.import_opt('enabled', 'nova.spice', group='spice')
 CONF.import_opt('enable', 'nova.cells.opts', group='cells')
 CONF.import_opt('image_cache_subdirectory_name', 'nova.virt.imagecache')
 CONF.import_opt('image_cache_manager_interval', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_interval', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_images', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_popular_count', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_admin_username', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_admin_password', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_admin_tenant_name', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_admin_auth_url', 'nova.virt.imagecache')
+CONF.import_opt('auth_strategy', 'nova.api.auth')
 CONF.import_opt('enabled', 'nova.rdp', group='rdp')
 CONF.import_opt('html5_proxy_base_url', 'nova.rdp', group='rdp')
 
@@ -497,6 +535,117 @@ class InstanceEvents(object):
         return _clear_events()
 
 
+class LifecycleEventTracker(object):
+    """Keeps track of the lifecycle events received from the virt driver.
+
+    Drivers which number their events let us tell when some went missing,
+    in which case the next power state sync has to look at every instance
+    again. Until then, only instances whose last event could not be handled
+    need to be checked.
+    """
+
+    def __init__(self):
+        self._generation = None
+        self._sequence = None
+        self._last_event = {}
+        self._failed = set()
+        self._full_sync_requested = True
+        self._last_full_sync = None
+        self.missed_events = 0
+
+    def record_event(self, event):
+        """Record a lifecycle event and check it for gaps.
+
+        :param event: the nova.virt.event.LifecycleEvent that arrived
+        """
+        sequence = event.get_sequence()
+        if sequence is None:
+            # Without a sequence number nothing can be said about events
+            # which might have been lost before this one.
+            return
+        generation = event.get_generation()
+        if generation != self._generation:
+            if self._generation is not None:
+                LOG.info(_("Lifecycle events restarted at generation "
+                           "%(generation)s, events may have been lost. "
+                           "Requesting a full power state sync."),
+                         {'generation': generation})
+            self._full_sync_requested = True
+        elif sequence != self._sequence + 1:
+            LOG.warn(_("Expected lifecycle event %(expected)d but got "
+                       "%(sequence)d. Requesting a full power state sync."),
+                     {'expected': self._sequence + 1, 'sequence': sequence})
+            self.missed_events += max(sequence - self._sequence - 1, 1)
+            self._full_sync_requested = True
+        self._generation = generation
+        self._sequence = sequence
+
+        instance_uuid = event.get_instance_uuid()
+        self._last_event[instance_uuid] = event.get_timestamp()
+        self._failed.discard(instance_uuid)
+
+    def record_failure(self, instance_uuid):
+        """Note that the last event for an instance could not be handled."""
+        self._failed.add(instance_uuid)
+        self._last_event.pop(instance_uuid, None)
+
+    def record_sync(self, instance_uuid):
+        """Note that an instance had its power state synced."""
+        self._failed.discard(instance_uuid)
+
+    @property
+    def failed_instances(self):
+        return frozenset(self._failed)
+
+    def full_sync_due(self, interval):
+        """Check whether the next power state sync has to be a full one.
+
+        :param interval: seconds after which a full sync is always due
+        """
+        return (self._full_sync_requested or
+                self._last_full_sync is None or
+                time.time() - self._last_full_sync >= interval)
+
+    def start_full_sync(self, instance_uuids):
+        """Note that a full sync of the given instances is starting.
+
+        Any gap detected from now on requests another full sync. Tracking
+        data for instances which are no longer on the host is dropped.
+        """
+        self._full_sync_requested = False
+        self._last_full_sync = time.time()
+        instance_uuids = set(instance_uuids)
+        for instance_uuid in list(self._last_event):
+            if instance_uuid not in instance_uuids:
+                del self._last_event[instance_uuid]
+        self._failed &= instance_uuids
+
+    def had_event_since(self, instance_uuid, timestamp):
+        last_event = self._last_event.get(instance_uuid)
+        return last_event is not None and last_event >= timestamp
+
+
+class StartupTimer(object):
+    """Measures how long each phase of the service startup takes."""
+
+    def __init__(self):
+        self.phases = []
+        self._started_at = time.time()
+        self._phase_started_at = self._started_at
+
+    def end_phase(self, name):
+        now = time.time()
+        self.phases.append((name, now - self._phase_started_at))
+        self._phase_started_at = now
+
+    @property
+    def total(self):
+        return sum(duration for _name, duration in self.phases)
+
+    def __str__(self):
+        return ', '.join('%s: %.2fs' % phase for phase in self.phases)
+
+
 class ComputeVirtAPI(virtapi.VirtAPI):
     def __init__(self, compute):
         super(ComputeVirtAPI, self).__init__()
@@ -597,6 +746,7 @@ class ComputeManager(manager.Manager):
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         self._resource_tracker_dict = {}
         self.instance_events = InstanceEvents()
+        self.lifecycle_events = LifecycleEventTracker()
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -628,13 +778,25 @@ class ComputeManager(manager.Manager):
         instance_ref = self.conductor_api.instance_update(context,
                                                           instance_uuid,
                                                           **kwargs)
-        if (instance_ref['host'] == self.host and
-                self.driver.node_is_available(instance_ref['node'])):
-            rt = self._get_resource_tracker(instance_ref.get('node'))
-            rt.update_usage(context, instance_ref)
-
+        self._update_resource_tracker(context, instance_ref)
         return instance_ref
 
+    def _update_resource_tracker(self, context, instance):
+        """Let the resource tracker know that an instance has changed."""
+        if (instance['host'] == self.host and
+                self.driver.node_is_available(instance['node'])):
+            rt = self._get_resource_tracker(instance.get('node'))
+            rt.update_usage(context, instance)
+
+    def _release_resource_tracker(self, context, instance, nodename):
+        """Let the resource tracker of nodename know that an instance left
+        it, so its usage is released right away instead of at the next
+        resource audit.
+        """
+        rt = self._resource_tracker_dict.get(nodename)
+        if rt:
+            rt.release_instance(context, instance)
+
     def _set_instance_error_state(self, context, instance_uuid):
         try:
             self._instance_update(context, instance_uuid,
@@ -770,6 +932,10 @@ class ComputeManager(manager.Manager):
         if quotas:
             quotas.commit()
 
+        # release the usage right away instead of waiting for the next
+        # resource audit to notice the instance is gone
+        self._update_resource_tracker(context, instance)
+
         # ensure block device mappings are not leaked
         for bdm in bdms:
             bdm.destroy()
@@ -1027,17 +1193,27 @@ class ComputeManager(manager.Manager):
                         event.get_transition())
 
         if vm_power_state is not None:
-            self._sync_instance_power_state(context,
-                                            instance,
-                                            vm_power_state)
+            return self._sync_instance_power_state(context,
+                                                   instance,
+                                                   vm_power_state)
+        return True
 
     def handle_events(self, event):
         if isinstance(event, virtevent.LifecycleEvent):
+            self.lifecycle_events.record_event(event)
             try:
-                self.handle_lifecycle_event(event)
+                if not self.handle_lifecycle_event(event):
+                    # Skipped until the pending task is over, so the power
+                    # state sync has to check the instance again
+                    self.lifecycle_events.record_failure(
+                        event.get_instance_uuid())
             except exception.InstanceNotFound:
                 LOG.debug("Event %s arrived for non-existent instance. The "
                           "instance was probably deleted." % event)
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    self.lifecycle_events.record_failure(
+                        event.get_instance_uuid())
         else:
             LOG.debug("Ignoring event %s" % event)
 
@@ -1046,10 +1222,13 @@ class ComputeManager(manager.Manager):
 
     def init_host(self):
         """Initialization for a standalone compute service."""
+        timer = StartupTimer()
         self.driver.init_host(host=self.host)
+        timer.end_phase('driver')
         context = nova.context.get_admin_context()
         instances = instance_obj.InstanceList.get_by_host(
             context, self.host, expected_attrs=['info_cache'])
+        timer.end_phase('instance list')
 
         if CONF.defer_iptables_apply:
             self.driver.filter_defer_apply_on()
@@ -1059,11 +1238,48 @@ class ComputeManager(manager.Manager):
         try:
             # checking that instance was not already evacuated to other host
             self._destroy_evacuated_instances(context)
-            for instance in instances:
-                self._init_instance(context, instance)
+            timer.end_phase('evacuated instances')
+            self._init_instances(context, instances)
+            timer.end_phase('instances')
         finally:
             if CONF.defer_iptables_apply:
                 self.driver.filter_defer_apply_off()
+                timer.end_phase('firewall')
+
+        LOG.info(_('Initialized host with %(count)d instances in '
+                   '%(total).2fs (%(phases)s)'),
+                 {'count': len(instances), 'total': timer.total,
+                  'phases': timer})
+
+    def _init_instances(self, context, instances):
+        """Run _init_instance() for all the instances.
+
+        Up to CONF.init_host_concurrency instances are initialized at the
+        same time.  If any of them fails, the first error is raised once
+        all the others are done.
+        """
+        concurrency = CONF.init_host_concurrency
+        if concurrency <= 1:
+            for instance in instances:
+                self._init_instance(context, instance)
+            return
+
+        failures = []
+
+        def _init_instance(instance):
+            try:
+                self._init_instance(context, instance)
+            except Exception:
+                LOG.exception(_('Failed to initialize instance'),
+                              instance=instance)
+                failures.append(sys.exc_info())
+
+        pool = greenpool.GreenPool(concurrency)
+        for instance in instances:
+            pool.spawn_n(_init_instance, instance)
+        pool.waitall()
+        if failures:
+            six.reraise(*failures[0])
 
     def cleanup_host(self):
         self.driver.cleanup_host(host=self.host)
@@ -3153,6 +3369,10 @@ class ComputeManager(manager.Manager):
 
             rt = self._get_resource_tracker(migration.source_node)
             rt.drop_resize_claim(instance, prefix='old_')
+            if (migration.source_compute != migration.dest_compute or
+                    migration.source_node != migration.dest_node):
+                self._release_resource_tracker(context, instance,
+                                               migration.source_node)
 
             # NOTE(mriedem): The old_vm_state could be STOPPED but the user
             # might have manually powered up the instance to confirm the
@@ -3229,6 +3449,10 @@ class ComputeManager(manager.Manager):
 
             rt = self._get_resource_tracker(instance.node)
             rt.drop_resize_claim(instance)
+            if (migration.source_compute != migration.dest_compute or
+                    migration.source_node != migration.dest_node):
+                self._release_resource_tracker(context, instance,
+                                               instance.node)
 
             self.compute_rpcapi.finish_revert_resize(context, instance,
                     migration, migration.source_compute,
@@ -3854,6 +4078,7 @@ class ComputeManager(manager.Manager):
         self.driver.destroy(context, instance, network_info,
                 block_device_info)
 
+        nodename = instance.node
         instance.power_state = current_power_state
         instance.host = None
         instance.node = None
@@ -3861,6 +4086,7 @@ class ComputeManager(manager.Manager):
         instance.task_state = None
         instance.save(expected_task_state=[task_states.SHELVING,
                                            task_states.SHELVING_OFFLOADING])
+        self._release_resource_tracker(context, instance, nodename)
         self._notify_about_instance_usage(context, instance,
                 'shelve_offload.end')
 
@@ -4544,6 +4770,7 @@ class ComputeManager(manager.Manager):
         return pre_live_migration_data
 
     @wrap_exception()
+    @wrap_instance_event
     @wrap_instance_fault
     def live_migration(self, context, dest, instance, block_migration,
                        migrate_data):
@@ -4648,6 +4875,7 @@ class ComputeManager(manager.Manager):
         # pause/suspend/terminate do not work.
         self.compute_rpcapi.post_live_migration_at_destination(ctxt,
                 instance, block_migration, dest)
+        self._release_resource_tracker(ctxt, instance, instance['node'])
 
         # No instance booting at source host, but instance dir
         # must be deleted for preparing next block migration
@@ -4830,21 +5058,24 @@ class ComputeManager(manager.Manager):
         spacing=CONF.heal_instance_info_cache_interval)
     def _heal_instance_info_cache(self, context):
         """Called periodically.  On every call, try to update the
-        info_cache's network information for another instance by
-        calling to the network manager.
+        info_cache's network information for another batch of instances by
+        calling to the network API.
 
         This is implemented by keeping a cache of uuids of instances
-        that live on this host.  On each call, we pop one off of a
-        list, pull the DB record, and try the call to the network API.
-        If anything errors don't fail, as it's possible the instance
-        has been deleted, etc.
+        that live on this host, ordered so that the instances whose
+        info_cache was updated least recently come first.  On each call, we
+        pop up to heal_instance_info_cache_batch_size of them off the list,
+        pull their DB records in one query, and refresh them all with one
+        call to the network API.  If anything errors don't fail, as it's
+        possible the instance has been deleted, etc.
         """
         heal_interval = CONF.heal_instance_info_cache_interval
         if not heal_interval:
             return
 
+        batch_size = max(CONF.heal_instance_info_cache_batch_size, 1)
         instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
-        instance = None
+        instances = []
 
         LOG.debug('Starting heal instance info cache')
 
@@ -4852,7 +5083,9 @@ class ComputeManager(manager.Manager):
             # The list of instances to heal is empty so rebuild it
             LOG.debug('Rebuilding the list of instances to heal')
             db_instances = instance_obj.InstanceList.get_by_host(
-                context, self.host, expected_attrs=[], use_slave=True)
+                context, self.host, expected_attrs=['info_cache'],
+                use_slave=True)
+            candidates = []
             for inst in db_instances:
                 # We don't want to refersh the cache for instances
                 # which are building or deleting so don't put them
@@ -4866,27 +5099,21 @@ class ComputeManager(manager.Manager):
                     LOG.debug('Skipping network cache update for instance '
                                 'because it is being deleted.', instance=inst)
                     continue
+                candidates.append(inst)
 
-                if not instance:
-                    # Save the first one we find so we don't
-                    # have to get it again
-                    instance = inst
-                else:
-                    instance_uuids.append(inst['uuid'])
-
+            candidates.sort(key=self._info_cache_age)
+            instance_uuids = [inst.uuid for inst in candidates]
             self._instance_uuids_to_heal = instance_uuids
-        else:
-            # Find the next valid instance on the list
-            while instance_uuids:
-                try:
-                    inst = instance_obj.Instance.get_by_uuid(
-                            context, instance_uuids.pop(0),
-                            expected_attrs=['system_metadata', 'info_cache'],
-                            use_slave=True)
-                except exception.InstanceNotFound:
-                    # Instance is gone.  Try to grab another.
-                    continue
 
+        # Find the next valid instances on the list
+        while instance_uuids and len(instances) < batch_size:
+            uuids = instance_uuids[:batch_size - len(instances)]
+            del instance_uuids[:len(uuids)]
+            db_instances = instance_obj.InstanceList.get_by_filters(
+                context, {'uuid': uuids, 'deleted': False},
+                expected_attrs=['system_metadata', 'info_cache'],
+                use_slave=True)
+            for inst in db_instances:
                 # Check the instance hasn't been migrated
                 if inst.host != self.host:
                     LOG.debug('Skipping network cache update for instance '
@@ -4897,24 +5124,34 @@ class ComputeManager(manager.Manager):
                     LOG.debug('Skipping network cache update for instance '
                                 'because it is being deleted.', instance=inst)
                 else:
-                    instance = inst
-                    break
+                    instances.append(inst)
 
-        if instance:
-            # We have an instance now to refresh
+        if instances:
+            # We have instances now to refresh
             try:
                 # Call to network API to get instance info.. this will
-                # force an update to the instance's info_cache
-                self._get_instance_nw_info(context, instance, use_slave=True)
-                LOG.debug('Updated the network info_cache for instance',
-                          instance=instance)
+                # force an update to the instances' info_cache
+                nw_infos = self.network_api.get_instance_nw_info_for_instances(
+                    context, instances, use_slave=True)
+                LOG.debug('Updated the network info_cache for %(updated)d of '
+                          '%(total)d instances',
+                          {'updated': len(nw_infos),
+                           'total': len(instances)})
             except Exception:
                 LOG.error(_('An error occurred while refreshing the network '
-                            'cache.'), instance=instance, exc_info=True)
+                            'cache.'), exc_info=True)
         else:
             LOG.debug("Didn't find any instances for network info cache "
                         "update.")
 
+    @staticmethod
+    def _info_cache_age(instance):
+        """Sort key putting the least recently updated info_cache first."""
+        info_cache = instance.info_cache
+        if info_cache is None:
+            return (0, None)
+        return (1, info_cache.updated_at or info_cache.created_at)
+
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
         if CONF.reboot_timeout > 0:
@@ -5245,19 +5482,48 @@ class ComputeManager(manager.Manager):
         number of virtual machines known by the database, we proceed in a lazy
         loop, one database record at a time, checking if the hypervisor has the
         same power state as is in the database.
+
+        With sync_power_state_from_events enabled, lifecycle events keep the
+        power states current, so this only checks the instances whose last
+        event failed, unless events were lost or a periodic full sync is due.
+        A full sync skips instances which had an event since the last run.
         """
+        events = self.lifecycle_events
+        use_events = (CONF.sync_power_state_from_events and
+                      self.driver.capabilities['has_numbered_events'])
+        full_sync = (not use_events or
+                     events.full_sync_due(CONF.sync_power_state_full_interval))
+        if not full_sync and not events.failed_instances:
+            LOG.debug("No lifecycle events were lost or failed, skipping "
+                      "power state sync")
+            return
+
         db_instances = instance_obj.InstanceList.get_by_host(context,
                                                              self.host,
                                                              use_slave=True)
 
-        num_vm_instances = self.driver.get_num_instances()
-        num_db_instances = len(db_instances)
-
-        if num_vm_instances != num_db_instances:
-            LOG.warn(_("Found %(num_db_instances)s in the database and "
-                       "%(num_vm_instances)s on the hypervisor."),
-                     {'num_db_instances': num_db_instances,
-                      'num_vm_instances': num_vm_instances})
+        if full_sync:
+            num_vm_instances = self.driver.get_num_instances()
+            num_db_instances = len(db_instances)
+
+            if num_vm_instances != num_db_instances:
+                LOG.warn(_("Found %(num_db_instances)s in the database and "
+                           "%(num_vm_instances)s on the hypervisor."),
+                         {'num_db_instances': num_db_instances,
+                          'num_vm_instances': num_vm_instances})
+
+        if use_events:
+            if full_sync:
+                since = time.time() - CONF.sync_power_state_interval
+                events.start_full_sync(
+                    [db_instance.uuid for db_instance in db_instances])
+                db_instances = [db_instance for db_instance in db_instances
+                                if not events.had_event_since(
+                                    db_instance.uuid, since)]
+            else:
+                failed = events.failed_instances
+                db_instances = [db_instance for db_instance in db_instances
+                                if db_instance.uuid in failed]
 
         for db_instance in db_instances:
             if db_instance['task_state'] is not None:
@@ -5276,10 +5542,11 @@ class ComputeManager(manager.Manager):
                 # Note(maoy): the above get_info call might take a long time,
                 # for example, because of a broken libvirt driver.
                 try:
-                    self._sync_instance_power_state(context,
-                                                    db_instance,
-                                                    vm_power_state,
-                                                    use_slave=True)
+                    if self._sync_instance_power_state(context,
+                                                       db_instance,
+                                                       vm_power_state,
+                                                       use_slave=True):
+                        events.record_sync(db_instance.uuid)
                 except exception.InstanceNotFound:
                     # NOTE(hanlind): If the instance gets deleted during sync,
                     # silently ignore and move on to next instance.
@@ -5295,6 +5562,9 @@ class ComputeManager(manager.Manager):
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
+
+        Returns False when the instance has a pending task, in which case
+        the sync has to be run again in a later round, and True otherwise.
         """
 
         # We re-query the DB to get the latest instance info to minimize
@@ -5317,7 +5587,7 @@ class ComputeManager(manager.Manager):
                        {'src': self.host,
                         'dst': db_instance.host},
                      instance=db_instance)
-            return
+            return True
         elif db_instance.task_state is not None:
             # on the receiving end of nova-compute, it could happen
             # that the DB instance already report the new resident
@@ -5328,7 +5598,7 @@ class ComputeManager(manager.Manager):
                        "pending task (%(task)s). Skip."),
                      {'task': db_instance.task_state},
                      instance=db_instance)
-            return
+            return False
 
         if vm_power_state != db_power_state:
             # power_state is always updated from hypervisor to db
@@ -5423,6 +5693,7 @@ class ComputeManager(manager.Manager):
                 # _cleanup_running_deleted_instances().
                 LOG.warn(_("Instance is not (soft-)deleted."),
                          instance=db_instance)
+        return True
 
     @periodic_task.periodic_task
     def _reclaim_queued_deletes(self, context):
@@ -5671,13 +5942,20 @@ class ComputeManager(manager.Manager):
         # as when we're asked to update the instance's info_cache. If it's
         # not one of those, look for some thread(s) waiting for the event and
         # unblock them if so.
+        network_changed = []
         for event in events:
             instance = [inst for inst in instances
                         if inst.uuid == event.instance_uuid][0]
             if event.name == 'network-changed':
-                self.network_api.get_instance_nw_info(context, instance)
+                if instance not in network_changed:
+                    network_changed.append(instance)
             else:
                 self._process_instance_event(instance, event)
+        if network_changed:
+            # Neutron sends the events for many ports at once, refresh
+            # the caches of all the affected instances together.
+            self.network_api.get_instance_nw_info_for_instances(
+                context, network_changed)
 
     @compute_utils.periodic_task_spacing_warn("image_cache_manager_interval")
     @periodic_task.periodic_task(spacing=CONF.image_cache_manager_interval,
@@ -5707,6 +5985,62 @@ class ComputeManager(manager.Manager):
 
         self.driver.manage_image_cache(context, filtered_instances)
 
+    @periodic_task.periodic_task(spacing=CONF.image_preseed_interval,
+                                 external_process_ok=True)
+    def _run_image_preseed_pass(self, context):
+        """Download the images most used in the cell into the cache."""
+
+        if not self.driver.capabilities["has_imagecache"]:
+            return
+
+        preseed_context = self._get_image_preseed_context(context)
+        if preseed_context is None:
+            return
+
+        image_ids = list(CONF.image_preseed_images)
+        popular_count = CONF.image_preseed_popular_count
+        if popular_count > 0:
+            # The images listed in the configuration may be among the most
+            # used ones, so ask for enough to fill popular_count without them
+            popular = instance_obj.InstanceList.get_popular_image_refs(
+                context, popular_count + len(image_ids), use_slave=True)
+            popular = [image_id for image_id in popular
+                       if image_id not in image_ids]
+            image_ids.extend(popular[:popular_count])
+
+        self.driver.preseed_image_cache(preseed_context, image_ids)
+
+    def _get_image_preseed_context(self, context):
+        """Return a context glance accepts downloads with, or None.
+
+        Periodic tasks run with an admin context without a token, which
+        glance only accepts when nova does not use keystone. Otherwise a
+        token is fetched for image_preseed_admin_username.
+        """
+        if CONF.auth_strategy != 'keystone':
+            return context
+
+        if not CONF.image_preseed_admin_username:
+            LOG.warn(_('Skipping image pre-seeding: glance needs a keystone '
+                       'token and image_preseed_admin_username is not set'))
+            return None
+        try:
+            auth_ref = keystone_client.Client(
+                username=CONF.image_preseed_admin_username,
+                password=CONF.image_preseed_admin_password,
+                tenant_name=CONF.image_preseed_admin_tenant_name,
+                auth_url=CONF.image_preseed_admin_auth_url).auth_ref
+        except Exception:
+            LOG.exception(_('Skipping image pre-seeding: unable to get a '
+                            'keystone token'))
+            return None
+        return nova.context.RequestContext(auth_ref.user_id,
+                                           auth_ref.project_id,
+                                           is_admin=True,
+                                           roles=auth_ref.role_names,
+                                           auth_token=auth_ref.auth_token,
+                                           overwrite=False)
+
     @periodic_task.periodic_task(spacing=CONF.instance_delete_interval)
     def _run_pending_deletes(self, context):
         """Retry any pending instance file deletes."""
@@ -19,6 +19,9 @@ scheduler with useful information about availability through the ComputeNode
 model.
 """
 
+import copy
+import time
+
 from oslo.config import cfg
 
 from nova.compute import claims
@@ -48,7 +51,14 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.IntOpt('resource_audit_interval', default=0,
+               help='Interval in seconds between full audits of the resource '
+                    'usage of a compute node, which rebuild it from the '
+                    'instances and migrations in the database. In between, '
+                    'usage is tracked from claims and instance changes and '
+                    'only the hypervisor view is refreshed. Set to 0 to '
+                    'audit on every resource update.'),
 ]
 
 CONF = cfg.CONF
@@ -57,6 +67,11 @@ CONF.register_opts(resource_tracker_opts)
 LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
+# Compute node fields the tracker derives from the instances and migrations
+# on the node, rather than taking them from the hypervisor:
+TRACKED_USAGE_FIELDS = ('memory_mb_used', 'local_gb_used', 'vcpus_used',
+                        'current_workload', 'running_vms', 'stats')
+
 CONF.import_opt('my_ip', 'nova.netconf')
 
 
@@ -71,6 +86,8 @@ class ResourceTracker(object):
         self.pci_tracker = None
         self.nodename = nodename
         self.compute_node = None
+        self.stored_compute_node = {}
+        self.last_audit = None
         self.stats = importutils.import_object(CONF.compute_stats_class)
         self.tracked_instances = {}
         self.tracked_migrations = {}
@@ -256,6 +273,24 @@ class ResourceTracker(object):
             self._update_usage_from_instance(self.compute_node, instance)
             self._update(context.elevated(), self.compute_node)
 
+    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    def release_instance(self, context, instance):
+        """Release the usage of an instance which left this node, without
+        waiting for the next audit to notice it is gone.
+        """
+        if self.disabled:
+            return
+
+        tracked = self.tracked_instances.get(instance['uuid'])
+        if tracked is None:
+            return
+
+        # release what was tracked for the instance, which differs from
+        # its current flavor once a resize moved it away
+        tracked = dict(tracked, vm_state=vm_states.DELETED)
+        self._update_usage_from_instance(self.compute_node, tracked)
+        self._update(context.elevated(), self.compute_node)
+
     @property
     def disabled(self):
         return self.compute_node is None
@@ -310,6 +345,31 @@ class ResourceTracker(object):
             self.pci_tracker.set_hvdevs(jsonutils.loads(resources.pop(
                 'pci_passthrough_devices')))
 
+        if self._audit_due():
+            self._audit_usage(context, resources)
+        else:
+            self._update_usage_from_tracker(resources)
+
+        self._report_final_resource_view(resources)
+
+        metrics = self._get_host_metrics(context, self.nodename)
+        resources['metrics'] = jsonutils.dumps(metrics)
+        self._sync_compute_node(context, resources, force=True)
+
+    def _audit_due(self):
+        """Check whether usage has to be rebuilt from the database."""
+        interval = CONF.resource_audit_interval
+        return (self.compute_node is None or
+                self.last_audit is None or
+                interval <= 0 or
+                time.time() - self.last_audit >= interval)
+
+    def _audit_usage(self, context, resources):
+        """Rebuild resource usage from the instances and migrations on the
+        node and from any orphans found on the hypervisor.
+        """
+        self.last_audit = time.time()
+
         # Grab all instances assigned to this node:
         instances = instance_obj.InstanceList.get_by_host_and_node(
             context, self.host, self.nodename)
@@ -339,13 +399,22 @@ class ResourceTracker(object):
         else:
             resources['pci_stats'] = jsonutils.dumps([])
 
-        self._report_final_resource_view(resources)
-
-        metrics = self._get_host_metrics(context, self.nodename)
-        resources['metrics'] = jsonutils.dumps(metrics)
-        self._sync_compute_node(context, resources)
+    def _update_usage_from_tracker(self, resources):
+        """Carry the usage tracked since the last audit over to a fresh
+        hypervisor view of the node.
+        """
+        for field in TRACKED_USAGE_FIELDS:
+            resources[field] = self.compute_node[field]
+        resources['free_ram_mb'] = (resources['memory_mb'] -
+                                    resources['memory_mb_used'])
+        resources['free_disk_gb'] = (resources['local_gb'] -
+                                     resources['local_gb_used'])
+        if self.pci_tracker:
+            resources['pci_stats'] = jsonutils.dumps(self.pci_tracker.stats)
+        else:
+            resources['pci_stats'] = jsonutils.dumps([])
 
-    def _sync_compute_node(self, context, resources):
+    def _sync_compute_node(self, context, resources, force=False):
         """Create or update the compute node DB record."""
         if not self.compute_node:
             # we need a copy of the ComputeNode record:
@@ -359,6 +428,7 @@ class ResourceTracker(object):
                 for cn in compute_node_refs:
                     if cn.get('hypervisor_hostname') == self.nodename:
                         self.compute_node = cn
+                        self.stored_compute_node = copy.deepcopy(cn)
                         if self.pci_tracker:
                             self.pci_tracker.set_compute_node_id(cn['id'])
                         break
@@ -374,7 +444,7 @@ class ResourceTracker(object):
 
         else:
             # just update the record:
-            self._update(context, resources)
+            self._update(context, resources, force=force)
             LOG.info(_('Compute_service record updated for %(host)s:%(node)s')
                     % {'host': self.host, 'node': self.nodename})
 
@@ -383,6 +453,7 @@ class ResourceTracker(object):
         # initialize load stats from existing instances:
         self.compute_node = self.conductor_api.compute_node_create(context,
                                                                    values)
+        self.stored_compute_node = copy.deepcopy(self.compute_node)
 
     def _get_service(self, context):
         try:
@@ -441,12 +512,27 @@ class ResourceTracker(object):
         if 'pci_devices' in resources:
             LOG.audit(_("Free PCI devices: %s") % resources['pci_devices'])
 
-    def _update(self, context, values):
-        """Persist the compute node updates to the DB."""
+    def _get_changed_fields(self, values):
+        """Return the values which differ from the stored compute node."""
+        return dict((key, value) for key, value in values.iteritems()
+                    if key not in self.stored_compute_node or
+                    self.stored_compute_node[key] != value)
+
+    def _update(self, context, values, force=False):
+        """Persist the compute node updates to the DB.
+
+        Only the fields which changed since the last write are sent. Unless
+        force is set, nothing is written when no field changed; a forced
+        write still refreshes the record's updated_at, which the scheduler
+        relies on to notice the node's view is current.
+        """
         if "service" in self.compute_node:
             del self.compute_node['service']
-        self.compute_node = self.conductor_api.compute_node_update(
-            context, self.compute_node, values)
+        changes = self._get_changed_fields(values)
+        if changes or force:
+            self.compute_node = self.conductor_api.compute_node_update(
+                context, self.compute_node, changes)
+            self.stored_compute_node = copy.deepcopy(self.compute_node)
         if self.pci_tracker:
             self.pci_tracker.save(context)
 
@@ -743,6 +743,12 @@ def instance_get_all_hung_in_rebooting(context, reboot_window):
     return IMPL.instance_get_all_hung_in_rebooting(context, reboot_window)
 
 
+def instance_get_popular_image_refs(context, limit, use_slave=False):
+    """Get the image refs used by most non-deleted instances, most first."""
+    return IMPL.instance_get_popular_image_refs(context, limit,
+                                                use_slave=use_slave)
+
+
 def instance_update(context, instance_uuid, values, update_cells=True):
     """Set the given properties on an instance and update it.
 
@@ -1237,6 +1243,13 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid,
                                                          use_slave)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids,
+                                                   use_slave=False):
+    """Get all block device mapping belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(
+        context, instance_uuids, use_slave)
+
+
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
     """Get block device mapping for a given volume."""
@@ -21,6 +21,7 @@ import collections
 import copy
 import datetime
 import functools
+import random
 import sys
 import time
 import uuid
@@ -68,6 +69,17 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.IntOpt('fixed_ip_allocation_candidates',
+               default=64,
+               help='How many free fixed IPs of a network to read when '
+                    'allocating one. One of them is picked at random and '
+                    'claimed, so concurrent allocations rarely go for the '
+                    'same address'),
+    cfg.BoolOpt('fixed_ip_allocation_cache',
+                default=False,
+                help='Keep the free fixed IPs of each network in memory and '
+                     'allocate from them, only reading them from the '
+                     'database again once they have all been handed out'),
 ]
 
 connection_opts = [
@@ -1133,39 +1145,89 @@ def fixed_ip_associate(context, address, instance_uuid, network_id=None,
     return fixed_ip_ref
 
 
+# network id -> [(fixed ip id, network id)] of the fixed IPs that were free
+# when last read, see fixed_ip_associate_pool
+_free_fixed_ips = {}
+
+
+def _free_fixed_ip_query(context, network_id, session):
+    network_or_none = or_(models.FixedIp.network_id == network_id,
+                          models.FixedIp.network_id == None)
+    return model_query(context, models.FixedIp.id, models.FixedIp.network_id,
+                       base_model=models.FixedIp, session=session,
+                       read_deleted="no").\
+                   filter(network_or_none).\
+                   filter_by(reserved=False).\
+                   filter_by(instance_uuid=None).\
+                   filter_by(host=None)
+
+
+def _claim_fixed_ip(context, fixed_ip_id, fixed_ip_network_id, network_id,
+                    instance_uuid, host, session):
+    """Claim a fixed IP if it is still free.
+
+    Returns whether the IP was claimed; False means a concurrent
+    allocation got it first.
+    """
+    values = {}
+    if instance_uuid:
+        values['instance_uuid'] = instance_uuid
+    if host:
+        values['host'] = host
+    if fixed_ip_network_id is None:
+        values['network_id'] = network_id
+    if not values:
+        return True
+    with session.begin():
+        rows = model_query(context, models.FixedIp, session=session,
+                           read_deleted="no").\
+                       filter_by(id=fixed_ip_id).\
+                       filter_by(network_id=fixed_ip_network_id).\
+                       filter_by(reserved=False).\
+                       filter_by(instance_uuid=None).\
+                       filter_by(host=None).\
+                       update(values, synchronize_session=False)
+    return rows == 1
+
+
 @require_admin_context
 def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                             host=None):
+    """Allocate a free fixed IP of a network without locking any rows.
+
+    A candidate is picked at random among the free IPs and claimed with
+    an UPDATE that only matches while it is still free. When a concurrent
+    allocation claimed it first, another candidate is tried.
+    """
     if instance_uuid and not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
 
     session = get_session()
-    with session.begin():
-        network_or_none = or_(models.FixedIp.network_id == network_id,
-                              models.FixedIp.network_id == None)
-        fixed_ip_ref = model_query(context, models.FixedIp, session=session,
-                                   read_deleted="no").\
-                               filter(network_or_none).\
-                               filter_by(reserved=False).\
-                               filter_by(instance_uuid=None).\
-                               filter_by(host=None).\
-                               with_lockmode('update').\
-                               first()
-        # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
-        #             then this has concurrency issues
-        if not fixed_ip_ref:
-            raise exception.NoMoreFixedIps()
-
-        if fixed_ip_ref['network_id'] is None:
-            fixed_ip_ref['network'] = network_id
-
-        if instance_uuid:
-            fixed_ip_ref['instance_uuid'] = instance_uuid
-
-        if host:
-            fixed_ip_ref['host'] = host
-        session.add(fixed_ip_ref)
-    return fixed_ip_ref
+    if CONF.fixed_ip_allocation_cache:
+        candidates = _free_fixed_ips.setdefault(network_id, [])
+    else:
+        candidates = []
+
+    while True:
+        if not candidates:
+            query = _free_fixed_ip_query(context, network_id, session)
+            if not CONF.fixed_ip_allocation_cache:
+                query = query.limit(CONF.fixed_ip_allocation_candidates)
+            candidates.extend(query.all())
+            if not candidates:
+                raise exception.NoMoreFixedIps()
+
+        index = random.randrange(len(candidates))
+        candidates[index], candidates[-1] = candidates[-1], candidates[index]
+        fixed_ip_id, fixed_ip_network_id = candidates.pop()
+        if _claim_fixed_ip(context, fixed_ip_id, fixed_ip_network_id,
+                           network_id, instance_uuid, host, session):
+            return model_query(context, models.FixedIp, session=session,
+                               read_deleted="no").\
+                           filter_by(id=fixed_ip_id).\
+                           first()
+        LOG.debug('Fixed IP %s was allocated concurrently, trying another '
+                  'one', fixed_ip_id)
 
 
 @require_context
@@ -2182,6 +2244,21 @@ def instance_get_all_hung_in_rebooting(context, reboot_window):
         manual_joins=[])
 
 
+@require_admin_context
+def instance_get_popular_image_refs(context, limit, use_slave=False):
+    count = func.count(models.Instance.id)
+    result = model_query(context, models.Instance.image_ref, count,
+                         base_model=models.Instance, read_deleted="no",
+                         use_slave=use_slave).\
+                filter(models.Instance.image_ref != None).\
+                filter(models.Instance.image_ref != '').\
+                group_by(models.Instance.image_ref).\
+                order_by(count.desc(), models.Instance.image_ref).\
+                limit(limit).\
+                all()
+    return [image_ref for image_ref, _count in result]
+
+
 @require_context
 def instance_update(context, instance_uuid, values):
     instance_ref = _instance_update(context, instance_uuid, values)[1]
@@ -3566,6 +3643,17 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid,
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids,
+                                                   use_slave=False):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context, use_slave=use_slave).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                     instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
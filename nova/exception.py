@@ -1442,6 +1442,11 @@ class ImageDownloadModuleConfigurationError(ImageDownloadModuleError):
     msg_fmt = _("The module %(module)s is misconfigured: %(reason)s.")
 
 
+class ImageChecksumMismatch(NovaException):
+    msg_fmt = _("The data downloaded for image %(image_id)s has checksum "
+                "%(actual)s, expected %(expected)s.")
+
+
 class ResourceMonitorError(NovaException):
     msg_fmt = _("Error when creating resource monitor: %(monitor)s")
 
@@ -13,8 +13,60 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+
 from nova import exception
 
+# Image data is written in multiples of this many bytes
+BLOCK_SIZE = 4096
+
+
+class ImageWriter(object):
+    """Writes image data to a file object while computing its MD5.
+
+    Data is buffered and written in blocks of buffer_size bytes, rounded
+    up to a multiple of BLOCK_SIZE, so that every write but the last one
+    is large and starts at an aligned offset.
+    """
+
+    def __init__(self, image_id, data, buffer_size, checksum=None):
+        self.image_id = image_id
+        self.data = data
+        self.checksum = checksum
+        self.buffer_size = max(
+            (buffer_size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE,
+            BLOCK_SIZE)
+        self._md5 = hashlib.md5()
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, chunk):
+        self._md5.update(chunk)
+        self._buffer.append(chunk)
+        self._buffered += len(chunk)
+        if self._buffered >= self.buffer_size:
+            buf = ''.join(self._buffer)
+            end = len(buf) - len(buf) % self.buffer_size
+            self.data.write(buf[:end])
+            self._buffer = [buf[end:]]
+            self._buffered = len(buf) - end
+
+    def close(self):
+        """Write out any buffered data and verify the checksum.
+
+        :raises: ImageChecksumMismatch if a checksum was given and the data
+                 written does not match it.
+        """
+        if self._buffered:
+            self.data.write(''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+        actual = self._md5.hexdigest()
+        if self.checksum and actual != self.checksum:
+            raise exception.ImageChecksumMismatch(image_id=self.image_id,
+                                                  actual=actual,
+                                                  expected=self.checksum)
+
 
 class TransferBase(object):
 
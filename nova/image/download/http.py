@@ -0,0 +1,249 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import httplib
+import json
+import os
+import sys
+
+from eventlet import greenpool
+from oslo.config import cfg
+import six
+
+from nova import exception
+import nova.image.download.base as xfer_base
+from nova.openstack.common import excutils
+from nova.openstack.common import fileutils
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.openstack.common import units
+
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+http_opts = [
+    cfg.IntOpt('range_workers',
+               default=4,
+               help='Number of byte ranges of an image that are fetched at '
+                    'the same time'),
+    cfg.IntOpt('range_size_mb',
+               default=64,
+               help='Size in MB of each byte range fetched'),
+    cfg.IntOpt('min_ranged_size_mb',
+               default=256,
+               help='Images smaller than this many MB, or served by a '
+                    'server that does not accept byte ranges, are fetched '
+                    'with a single request'),
+]
+CONF.register_opts(http_opts, group='image_http_url')
+CONF.import_opt('glance_download_buffer_size_kb', 'nova.image.glance')
+
+
+#  This module downloads images from the http:// or https:// URL of their
+#  location, when that scheme is in allowed_direct_url_schemes.
+#
+#  Large images are fetched as several byte ranges in parallel, when the
+#  server advertises "Accept-Ranges: bytes".  The ranges are written into
+#  <dst_path>.part, and the ranges already written are recorded in
+#  <dst_path>.progress, so that a download interrupted by a restart of the
+#  compute service resumes where it stopped.  The MD5 of a ranged download
+#  is verified once all the ranges are written; the MD5 of a download done
+#  with a single request is verified as the data streams in.
+
+
+class HttpTransfer(xfer_base.TransferBase):
+
+    def _request(self, url_parts, method, headers=None):
+        if url_parts.scheme == 'https':
+            conn = httplib.HTTPSConnection(url_parts.netloc)
+        else:
+            conn = httplib.HTTPConnection(url_parts.netloc)
+        path = url_parts.path
+        if url_parts.query:
+            path += '?' + url_parts.query
+        conn.request(method, path, headers=headers or {})
+        return conn, conn.getresponse()
+
+    def _check_status(self, resp, expected, url_parts):
+        if resp.status != expected:
+            msg = (_('Unexpected response %(status)s from %(url)s') %
+                   {'status': resp.status, 'url': url_parts.geturl()})
+            raise exception.ImageDownloadModuleError(reason=msg,
+                                                     module=str(self))
+
+    def _head(self, url_parts):
+        conn, resp = self._request(url_parts, 'HEAD')
+        try:
+            self._check_status(resp, httplib.OK, url_parts)
+            size = int(resp.getheader('content-length', 0))
+            accepts_ranges = resp.getheader('accept-ranges', '') == 'bytes'
+        finally:
+            conn.close()
+        return size, accepts_ranges
+
+    def _download_stream(self, url_parts, dst_path, image_id, checksum,
+                         buffer_size):
+        conn, resp = self._request(url_parts, 'GET')
+        try:
+            self._check_status(resp, httplib.OK, url_parts)
+            with open(dst_path, 'wb') as f:
+                writer = xfer_base.ImageWriter(image_id, f, buffer_size,
+                                               checksum=checksum)
+                for chunk in iter(lambda: resp.read(buffer_size), b''):
+                    writer.write(chunk)
+                writer.close()
+        except exception.ImageChecksumMismatch:
+            with excutils.save_and_reraise_exception():
+                fileutils.delete_if_exists(dst_path)
+        finally:
+            conn.close()
+
+    def _load_progress(self, progress_path, part_path, url, size):
+        """Return the start offsets of the ranges already downloaded.
+
+        Returns None if there is no usable partial download.
+        """
+        if not (os.path.exists(progress_path) and
+                os.path.exists(part_path)):
+            return None
+        try:
+            with open(progress_path) as f:
+                progress = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if (progress.get('url') != url or progress.get('size') != size or
+                os.path.getsize(part_path) != size):
+            return None
+        return set(progress.get('done', []))
+
+    def _save_progress(self, progress_path, url, size, done):
+        tmp_path = progress_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'url': url, 'size': size, 'done': sorted(done)}, f)
+        os.rename(tmp_path, progress_path)
+
+    def _fetch_range(self, url_parts, part_path, start, end, buffer_size):
+        headers = {'Range': 'bytes=%d-%d' % (start, end)}
+        conn, resp = self._request(url_parts, 'GET', headers)
+        try:
+            self._check_status(resp, httplib.PARTIAL_CONTENT, url_parts)
+            remaining = end - start + 1
+            with open(part_path, 'r+b') as f:
+                f.seek(start)
+                while remaining > 0:
+                    chunk = resp.read(min(buffer_size, remaining))
+                    if not chunk:
+                        msg = (_('Short read of range %(start)d-%(end)d '
+                                 'from %(url)s') %
+                               {'start': start, 'end': end,
+                                'url': url_parts.geturl()})
+                        raise exception.ImageDownloadModuleError(
+                            reason=msg, module=str(self))
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        finally:
+            conn.close()
+        return start
+
+    def _verify_file(self, path, image_id, checksum, buffer_size):
+        if not checksum:
+            return
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(buffer_size), b''):
+                md5.update(chunk)
+        if md5.hexdigest() != checksum:
+            raise exception.ImageChecksumMismatch(image_id=image_id,
+                                                  actual=md5.hexdigest(),
+                                                  expected=checksum)
+
+    def _download_ranges(self, url_parts, dst_path, size, image_id, checksum,
+                         buffer_size):
+        url = url_parts.geturl()
+        part_path = dst_path + '.part'
+        progress_path = dst_path + '.progress'
+
+        done = self._load_progress(progress_path, part_path, url, size)
+        if done is None:
+            done = set()
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+            self._save_progress(progress_path, url, size, done)
+        else:
+            LOG.info(_('Resuming download of %(url)s, %(count)d ranges '
+                       'already done'), {'url': url, 'count': len(done)})
+
+        range_size = max(CONF.image_http_url.range_size_mb, 1) * units.Mi
+        ranges = [(start, min(start + range_size, size) - 1)
+                  for start in xrange(0, size, range_size)
+                  if start not in done]
+
+        failures = []
+
+        def fetch(byte_range):
+            if failures:
+                # Leave the ranges not started yet for when the download
+                # is resumed
+                return
+            try:
+                self._fetch_range(url_parts, part_path, byte_range[0],
+                                  byte_range[1], buffer_size)
+            except Exception:
+                failures.append(sys.exc_info())
+                return
+            done.add(byte_range[0])
+            self._save_progress(progress_path, url, size, done)
+
+        # The ranges being fetched when one of them fails still complete
+        # and are recorded, so that they are not fetched again when the
+        # download is resumed
+        pool = greenpool.GreenPool(max(CONF.image_http_url.range_workers, 1))
+        for byte_range in ranges:
+            pool.spawn_n(fetch, byte_range)
+        pool.waitall()
+        if failures:
+            exc_type, exc_value, exc_tb = failures[0]
+            six.reraise(exc_type, exc_value, exc_tb)
+
+        try:
+            self._verify_file(part_path, image_id, checksum, buffer_size)
+        except exception.ImageChecksumMismatch:
+            with excutils.save_and_reraise_exception():
+                fileutils.delete_if_exists(part_path)
+                fileutils.delete_if_exists(progress_path)
+
+        os.rename(part_path, dst_path)
+        fileutils.delete_if_exists(progress_path)
+
+    def download(self, context, url_parts, dst_path, metadata, image_id=None,
+                 checksum=None, **kwargs):
+        buffer_size = CONF.glance_download_buffer_size_kb * units.Ki
+        size, accepts_ranges = self._head(url_parts)
+        min_ranged_size = CONF.image_http_url.min_ranged_size_mb * units.Mi
+        if accepts_ranges and size and size >= min_ranged_size:
+            self._download_ranges(url_parts, dst_path, size, image_id,
+                                  checksum, buffer_size)
+        else:
+            self._download_stream(url_parts, dst_path, image_id, checksum,
+                                  buffer_size)
+        LOG.info(_('Downloaded %(url)s using %(module_str)s'),
+                 {'url': url_parts.geturl(), 'module_str': str(self)})
+
+
+def get_download_handler(**kwargs):
+    return HttpTransfer()
+
+
+def get_schemes():
+    return ['http', 'https']
@@ -32,9 +32,13 @@ import six.moves.urllib.parse as urlparse
 
 from nova import exception
 import nova.image.download as image_xfers
+import nova.image.download.base as xfer_base
+from nova.openstack.common import excutils
+from nova.openstack.common import fileutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import processutils
 from nova.openstack.common import timeutils
 from nova import utils
 
@@ -66,7 +70,15 @@ glance_opts = [
                 default=[],
                 help='A list of url scheme that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
-                     '[file].'),
+                     '[file, http, https].'),
+    cfg.IntOpt('glance_download_buffer_size_kb',
+               default=4096,
+               help='Size in KB of the writes done when downloading an '
+                    'image. It is rounded up to a multiple of 4KB'),
+    cfg.BoolOpt('glance_download_preallocate',
+                default=False,
+                help='Preallocate the disk space of images being downloaded '
+                     'to a file, using fallocate'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -288,7 +300,21 @@ class GlanceImageService(object):
         return
 
     def download(self, context, image_id, data=None, dst_path=None):
-        """Calls out to Glance for data and writes data."""
+        """Calls out to Glance for data and writes data.
+
+        When the data is written to a file object or dst_path, its MD5 is
+        checked against the checksum glance has for the image while it
+        streams in.
+        """
+        checksum = size = None
+        if data is not None or dst_path is not None:
+            try:
+                image = self._client.call(context, 1, 'get', image_id)
+            except Exception:
+                _reraise_translated_image_exception(image_id)
+            checksum = getattr(image, 'checksum', None)
+            size = getattr(image, 'size', None)
+
         if CONF.allowed_direct_url_schemes and dst_path is not None:
             locations = _get_locations(self._client, context, image_id)
             for entry in locations:
@@ -298,7 +324,9 @@ class GlanceImageService(object):
                 xfer_mod = self._get_transfer_module(o.scheme)
                 if xfer_mod:
                     try:
-                        xfer_mod.download(context, o, dst_path, loc_meta)
+                        xfer_mod.download(context, o, dst_path, loc_meta,
+                                          image_id=image_id,
+                                          checksum=checksum, size=size)
                         msg = _("Successfully transferred "
                                 "using %s") % o.scheme
                         LOG.info(msg)
@@ -315,16 +343,29 @@ class GlanceImageService(object):
         if data is None and dst_path:
             data = open(dst_path, 'wb')
             close_file = True
+            if size and CONF.glance_download_preallocate:
+                _preallocate(dst_path, size)
 
         if data is None:
             return image_chunks
         else:
+            writer = xfer_base.ImageWriter(
+                image_id, data, CONF.glance_download_buffer_size_kb * 1024,
+                checksum=checksum)
             try:
-                for chunk in image_chunks:
-                    data.write(chunk)
-            finally:
-                if close_file:
-                    data.close()
+                try:
+                    for chunk in image_chunks:
+                        writer.write(chunk)
+                    writer.close()
+                finally:
+                    if close_file:
+                        data.close()
+            except exception.ImageChecksumMismatch:
+                with excutils.save_and_reraise_exception():
+                    LOG.error(_('Checksum verification failed while '
+                                'downloading image %s'), image_id)
+                    if close_file:
+                        fileutils.delete_if_exists(dst_path)
 
     def create(self, context, image_meta, data=None):
         """Store the image data and return the new image object."""
@@ -376,6 +417,15 @@ class GlanceImageService(object):
         return True
 
 
+def _preallocate(path, size):
+    """Reserve size bytes of disk space for a file, if possible."""
+    try:
+        utils.execute('fallocate', '-n', '-l', size, path)
+    except (processutils.ProcessExecutionError, OSError) as e:
+        LOG.debug('Could not preallocate %(path)s: %(error)s',
+                  {'path': path, 'error': e})
+
+
 def _get_locations(client, context, image_id):
     """Returns the direct url representing the backend storage location,
     or None if this attribute is not shown by Glance.
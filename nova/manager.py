@@ -51,15 +51,38 @@ This module provides Manager, a base class for managers.
 
 """
 
+import random
+import time
+
+from eventlet import greenpool
+from eventlet import greenthread
 from oslo.config import cfg
 
 from nova.db import base
+from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
+from nova import periodic_task_stats
 from nova import rpc
 
 
+periodic_opts = [
+    cfg.IntOpt('periodic_task_pool_size',
+               default=1,
+               help='Maximum number of periodic tasks of a service that can '
+                    'run at the same time. With 1, tasks run one after the '
+                    'other. With more, each task runs in its own green '
+                    'thread, and a task that is still running from its '
+                    'previous run is skipped.'),
+    cfg.FloatOpt('periodic_task_jitter',
+                 default=0.0,
+                 help='Maximum number of seconds to randomly delay the '
+                      'start of each periodic task run. Only used when '
+                      'periodic_task_pool_size is greater than 1.'),
+]
+
 CONF = cfg.CONF
+CONF.register_opts(periodic_opts)
 CONF.import_opt('host', 'nova.netconf')
 LOG = logging.getLogger(__name__)
 
@@ -74,12 +97,105 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         self.service_name = service_name
         self.notifier = rpc.get_notifier(self.service_name, self.host)
         self.additional_endpoints = []
+        self._periodic_pool = None
+        self._periodic_running = set()
+        self._periodic_threads = None
+        self._periodic_raise_on_error = False
+        # NOTE: run_periodic_tasks() still decides which tasks are due,
+        # the wrappers time each run and, with a pool, spawn it
+        self._periodic_tasks = [(name, self._wrap_periodic_task(name, task))
+                                for name, task in self._periodic_tasks]
         super(Manager, self).__init__(db_driver)
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
         return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
 
+    def run_periodic_tasks(self, context, raise_on_error=False):
+        """Run the periodic tasks that are due.
+
+        With a periodic_task_pool_size greater than 1 the tasks run in a
+        green pool and this returns once they are spawned, unless
+        raise_on_error is set: then it waits for them and raises the
+        first error.
+        """
+        pool_size = CONF.periodic_task_pool_size
+        if pool_size <= 1:
+            return super(Manager, self).run_periodic_tasks(
+                context, raise_on_error=raise_on_error)
+
+        if self._periodic_pool is None:
+            self._periodic_pool = greenpool.GreenPool(pool_size)
+        self._periodic_threads = []
+        self._periodic_raise_on_error = raise_on_error
+        try:
+            idle_for = super(Manager, self).run_periodic_tasks(context)
+            threads = self._periodic_threads
+        finally:
+            self._periodic_threads = None
+        if raise_on_error:
+            for thread in threads:
+                thread.wait()
+        return idle_for
+
+    def _wrap_periodic_task(self, task_name, task):
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+
+        def run(manager, context):
+            if self._periodic_threads is None:
+                self._time_periodic_task(context, task, full_task_name)
+            else:
+                self._spawn_periodic_task(context, task_name, task,
+                                          full_task_name)
+
+        return run
+
+    def _time_periodic_task(self, context, task, full_task_name):
+        failed = True
+        start = time.time()
+        try:
+            task(self, context)
+            failed = False
+        finally:
+            periodic_task_stats.get(full_task_name).record(
+                time.time() - start, failed)
+
+    def _spawn_periodic_task(self, context, task_name, task, full_task_name):
+        if task_name in self._periodic_running:
+            LOG.debug(_("Skipping periodic task %(full_task_name)s because "
+                        "its previous run is still in progress"),
+                      {"full_task_name": full_task_name})
+            periodic_task_stats.get(full_task_name).skipped += 1
+            return
+
+        raise_on_error = self._periodic_raise_on_error
+        self._periodic_running.add(task_name)
+
+        def _run():
+            try:
+                self._time_periodic_task(context, task, full_task_name)
+            except Exception as e:
+                if raise_on_error:
+                    raise
+                LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                              {"full_task_name": full_task_name, "e": e})
+            finally:
+                self._periodic_running.discard(task_name)
+
+        def _run_after(delay):
+            # The jitter is waited out before taking a pool slot, so that
+            # it does not hold up the other tasks
+            greenthread.sleep(delay)
+            return self._periodic_pool.spawn(_run).wait()
+
+        jitter = CONF.periodic_task_jitter
+        if jitter > 0:
+            thread = greenthread.spawn(_run_after,
+                                       random.uniform(0, jitter))
+        else:
+            thread = self._periodic_pool.spawn(_run)
+        self._periodic_threads.append(thread)
+
     def init_host(self):
         """Hook to do additional manager initialization when one requests
         the service be started.  This is called before any service record
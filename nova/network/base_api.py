@@ -231,6 +231,28 @@ class NetworkAPI(base.Base):
         """Returns all network info related to an instance."""
         raise NotImplementedError()
 
+    def get_instance_nw_info_for_instances(self, context, instances,
+                                           use_slave=False):
+        """Refresh the network info cache of several instances at once.
+
+        Returns a dict of instance uuid to network info for the instances
+        that were refreshed successfully.  A failure for one instance is
+        logged and does not stop the others from being refreshed.
+
+        This default calls get_instance_nw_info() once per instance;
+        drivers that can look up several instances in one request should
+        override it.
+        """
+        nw_infos = {}
+        for instance in instances:
+            try:
+                nw_infos[instance['uuid']] = self.get_instance_nw_info(
+                    context, instance, use_slave=use_slave)
+            except Exception:
+                LOG.exception(_('Failed to refresh network info cache'),
+                              instance=instance)
+        return nw_infos
+
     def validate_networks(self, context, requested_networks, num_instances):
         """validate the networks passed at the time of creating
         the server.
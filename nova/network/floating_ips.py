@@ -82,6 +82,7 @@ class FloatingIP(object):
         except exception.NotFound:
             return
 
+        to_add = []
         for floating_ip in floating_ips:
             if floating_ip.fixed_ip_id:
                 try:
@@ -91,14 +92,25 @@ class FloatingIP(object):
                     LOG.debug(msg)
                     continue
                 interface = CONF.public_interface or floating_ip.interface
-                try:
-                    self.l3driver.add_floating_ip(floating_ip.address,
-                                                  fixed_ip.address,
-                                                  interface,
-                                                  fixed_ip.network)
-                except processutils.ProcessExecutionError:
-                    LOG.debug('Interface %s not found', interface)
-                    raise exception.NoFloatingIpInterface(interface=interface)
+                to_add.append((floating_ip.address, fixed_ip.address,
+                               interface, fixed_ip.network))
+        if not to_add:
+            return
+
+        try:
+            self.l3driver.add_floating_ips(to_add)
+            return
+        except processutils.ProcessExecutionError:
+            # Add them one at a time to find out which interface is missing
+            LOG.debug('Bulk setup of %d floating ips failed, retrying '
+                      'one by one', len(to_add))
+        for address, fixed_address, interface, network in to_add:
+            try:
+                self.l3driver.add_floating_ip(address, fixed_address,
+                                              interface, network)
+            except processutils.ProcessExecutionError:
+                LOG.debug('Interface %s not found', interface)
+                raise exception.NoFloatingIpInterface(interface=interface)
 
     def allocate_for_instance(self, context, **kwargs):
         """Handles allocating the floating IP resources for an instance.
@@ -55,6 +55,17 @@ class L3Driver(object):
         """
         raise NotImplementedError()
 
+    def add_floating_ips(self, floating_ips):
+        """Add many floating IPs at once, e.g. when a host starts.
+
+           floating_ips is a list of (floating_ip, fixed_ip,
+           l3_interface_id, network) tuples. Drivers that can program
+           them in bulk should override this.
+        """
+        for floating_ip, fixed_ip, l3_interface_id, network in floating_ips:
+            self.add_floating_ip(floating_ip, fixed_ip, l3_interface_id,
+                                 network)
+
     def remove_floating_ip(self, floating_ip, fixed_ip, l3_interface_id,
                            network=None):
         raise NotImplementedError()
@@ -113,6 +124,12 @@ class LinuxNetL3(L3Driver):
                                           l3_interface_id, network)
         linux_net.bind_floating_ip(floating_ip, l3_interface_id)
 
+    def add_floating_ips(self, floating_ips):
+        linux_net.ensure_floating_forwards(floating_ips)
+        linux_net.bind_floating_ips(
+            [(floating_ip, l3_interface_id)
+             for floating_ip, _fixed, l3_interface_id, _net in floating_ips])
+
     def remove_floating_ip(self, floating_ip, fixed_ip, l3_interface_id,
                            network=None):
         linux_net.unbind_floating_ip(floating_ip, l3_interface_id)
@@ -161,6 +178,9 @@ class NullL3(L3Driver):
                         network=None):
         pass
 
+    def add_floating_ips(self, floating_ips):
+        pass
+
     def remove_floating_ip(self, floating_ip, fixed_ip, l3_interface_id,
                            network=None):
         pass
@@ -18,10 +18,12 @@
 """Implements vlans, bridges, and iptables rules using linux utilities."""
 
 import calendar
+import collections
 import inspect
 import os
 import re
 
+from eventlet import greenthread
 import netaddr
 from oslo.config import cfg
 import six
@@ -64,6 +66,11 @@ linux_net_opts = [
     cfg.IntOpt('dhcp_lease_time',
                default=120,
                help='Lifetime of a DHCP lease in seconds'),
+    cfg.IntOpt('dhcp_reload_delay',
+               default=0,
+               help='Seconds to wait before reloading dnsmasq after fixed '
+                    'IPs were allocated, so a burst of allocations causes '
+                    'one reload. 0 reloads it right away'),
     cfg.MultiStrOpt('dns_server',
                     default=[],
                     help='If set, uses specific DNS server for dnsmasq. Can'
@@ -122,6 +129,11 @@ linux_net_opts = [
                default='DROP',
                help=('The table that iptables to jump to when a packet is '
                      'to be dropped.')),
+    cfg.BoolOpt('iptables_restore_noflush',
+                default=False,
+                help='Only load the chains that changed, using '
+                     'iptables-restore --noflush, instead of reloading every '
+                     'table on each apply'),
     cfg.IntOpt('ovs_vsctl_timeout',
                default=120,
                help='Amount of time, in seconds, that ovs_vsctl should wait '
@@ -172,6 +184,9 @@ class IptablesRule(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash((self.chain, self.rule, self.wrap, self.top))
+
     def __str__(self):
         if self.wrap:
             chain = '%s-%s' % (binary_name, self.chain)
@@ -186,6 +201,8 @@ class IptablesTable(object):
 
     def __init__(self):
         self.rules = []
+        # Hashed view of self.rules for the duplicate check in add_rule
+        self._rule_index = set()
         self.remove_rules = []
         self.chains = set()
         self.unwrapped_chains = set()
@@ -237,7 +254,7 @@ class IptablesTable(object):
         chain_set.remove(name)
         if not wrap:
             self.remove_rules += filter(lambda r: r.chain == name, self.rules)
-        self.rules = filter(lambda r: r.chain != name, self.rules)
+        self._set_rules(filter(lambda r: r.chain != name, self.rules))
 
         if wrap:
             jump_snippet = '-j %s-%s' % (binary_name, name)
@@ -247,7 +264,12 @@ class IptablesTable(object):
         if not wrap:
             self.remove_rules += filter(lambda r: jump_snippet in r.rule,
                                         self.rules)
-        self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+        self._set_rules(filter(lambda r: jump_snippet not in r.rule,
+                               self.rules))
+
+    def _set_rules(self, rules):
+        self.rules = rules
+        self._rule_index = set(rules)
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -267,10 +289,11 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         rule_obj = IptablesRule(chain, rule, wrap, top)
-        if rule_obj in self.rules:
+        if rule_obj in self._rule_index:
             LOG.debug("Skipping duplicate iptables rule addition")
         else:
-            self.rules.append(IptablesRule(chain, rule, wrap, top))
+            self.rules.append(rule_obj)
+            self._rule_index.add(rule_obj)
             self.dirty = True
 
     def _wrap_target_chain(self, s):
@@ -288,6 +311,7 @@ class IptablesTable(object):
         """
         try:
             self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            self._rule_index.discard(IptablesRule(chain, rule, wrap, top))
             if not wrap:
                 self.remove_rules.append(IptablesRule(chain, rule, wrap, top))
             self.dirty = True
@@ -302,7 +326,27 @@ class IptablesTable(object):
         if isinstance(regex, six.string_types):
             regex = re.compile(regex)
         num_rules = len(self.rules)
-        self.rules = filter(lambda r: not regex.match(str(r)), self.rules)
+        self._set_rules(filter(lambda r: not regex.match(str(r)), self.rules))
+        removed = num_rules - len(self.rules)
+        if removed > 0:
+            self.dirty = True
+        return removed
+
+    def remove_rules_for_addresses(self, addresses):
+        """Remove all rules that mention any of addresses.
+
+        An address matches as a whole word, alone or with a /32 suffix,
+        so a single pass replaces one remove_rules_regex per address.
+        """
+        addresses = set(str(address) for address in addresses)
+        addresses.update([address + '/32' for address in addresses])
+
+        def mentions_address(rule):
+            return not addresses.isdisjoint(str(rule).split())
+
+        num_rules = len(self.rules)
+        self._set_rules([rule for rule in self.rules
+                         if not mentions_address(rule)])
         removed = num_rules - len(self.rules)
         if removed > 0:
             self.dirty = True
@@ -314,8 +358,8 @@ class IptablesTable(object):
                               if rule.chain == chain and rule.wrap == wrap]
         if chained_rules:
             self.dirty = True
-        for rule in chained_rules:
-            self.rules.remove(rule)
+            self._set_rules([rule for rule in self.rules
+                             if rule.chain != chain or rule.wrap != wrap])
 
 
 class IptablesManager(object):
@@ -437,6 +481,10 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        With iptables_restore_noflush only the chains whose rules changed
+        are sent to iptables-restore --noflush, everything else is left
+        as it is in the kernel.
+
         """
         s = [('iptables', self.ipv4)]
         if CONF.use_ipv6:
@@ -447,16 +495,94 @@ class IptablesManager(object):
                                                 run_as_root=True,
                                                 attempts=5)
             all_lines = all_tables.split('\n')
+            changed_lines = []
             for table_name, table in tables.iteritems():
                 start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                        all_lines[start:end], table, table_name)
+                current_lines = all_lines[start:end]
+                new_lines = self._modify_rules(current_lines, table,
+                                               table_name)
+                if CONF.iptables_restore_noflush:
+                    changed_lines += self._changed_chains(current_lines,
+                                                          new_lines,
+                                                          table_name)
+                all_lines[start:end] = new_lines
                 table.dirty = False
-            self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
-                         process_input='\n'.join(all_lines),
-                         attempts=5)
+            if not CONF.iptables_restore_noflush:
+                self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
+                             process_input='\n'.join(all_lines),
+                             attempts=5)
+            elif changed_lines:
+                self.execute('%s-restore' % (cmd,), '-c', '--noflush',
+                             run_as_root=True,
+                             process_input='\n'.join(changed_lines + ['']),
+                             attempts=5)
         LOG.debug("IPTablesManager.apply completed with success")
 
+    @staticmethod
+    def _parse_chains(lines):
+        """Split an iptables-save table into its chains.
+
+        Returns the rule lines of each chain and the policy each chain
+        was declared with, '-' for user defined chains.
+
+        """
+        chains = collections.OrderedDict()
+        policies = {}
+        for line in lines:
+            if line.startswith(':'):
+                name, policy = line[1:].split()[:2]
+                chains.setdefault(name, [])
+                policies[name] = policy
+            elif line.startswith('['):
+                name = line.split(None, 3)[2]
+                chains.setdefault(name, []).append(line)
+            elif line.startswith('-A'):
+                name = line.split(None, 2)[1]
+                chains.setdefault(name, []).append(line)
+        return chains, policies
+
+    def _changed_chains(self, current_lines, new_lines, table_name):
+        """Build the iptables-restore --noflush input for one table.
+
+        Declaring a user defined chain flushes it and built-in chains are
+        flushed explicitly, so every chain whose rules differ is rewritten
+        completely, packet counters included. Chains that are gone are
+        flushed and deleted. Returns [] when nothing changed.
+
+        """
+        def _strip_counters(rules):
+            return [rule.split(']', 1)[1].strip() if rule.startswith('[')
+                    else rule.strip() for rule in rules]
+
+        current, current_policies = self._parse_chains(current_lines)
+        new, new_policies = self._parse_chains(new_lines)
+        policies = current_policies
+        policies.update(new_policies)
+
+        # Rules we keep carry their counters over from iptables-save, so
+        # most chains compare equal before the counters are even stripped
+        changed = [name for name in new
+                   if name not in current or
+                   (current[name] != new[name] and
+                    _strip_counters(current[name]) !=
+                    _strip_counters(new[name]))]
+        removed = [name for name in current if name not in new]
+        if not changed and not removed:
+            return []
+
+        lines = ['*%s' % table_name]
+        for name in changed:
+            if policies.get(name, '-') == '-':
+                lines.append(':%s - [0:0]' % name)
+        for name in changed:
+            if policies.get(name, '-') != '-':
+                lines.append('-F %s' % name)
+            lines += new[name]
+        lines += ['-F %s' % name for name in removed]
+        lines += ['-X %s' % name for name in removed]
+        lines.append('COMMIT')
+        return lines
+
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
             # length only <2 when fake iptables
@@ -492,17 +618,17 @@ class IptablesManager(object):
         if CONF.iptables_top_regex:
             regex = re.compile(CONF.iptables_top_regex)
             temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
+            temp_lines = set(line.strip() for line in temp_filter)
+            new_filter = filter(lambda s: s.strip() not in temp_lines,
+                                new_filter)
             top_rules = temp_filter
 
         if CONF.iptables_bottom_regex:
             regex = re.compile(CONF.iptables_bottom_regex)
             temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                    new_filter)
+            temp_lines = set(line.strip() for line in temp_filter)
+            new_filter = filter(lambda s: s.strip() not in temp_lines,
+                                new_filter)
             bottom_rules = temp_filter
 
         seen_chains = False
@@ -579,6 +705,11 @@ class IptablesManager(object):
                 seen_lines.add(line)
                 return True
 
+        # Index the removals by their text without [packet:byte] counts,
+        # so weeding them out is one lookup per line
+        remove_rule_strs = set(str(rule).split(' ', 1)[1].strip()
+                               for rule in remove_rules)
+
         def _weed_out_removes(line):
             # We need to find exact matches here
             if line.startswith(':'):
@@ -587,23 +718,17 @@ class IptablesManager(object):
                 line = line.split(':')[1]
                 line = line.split('- [')[0]
                 line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                if line in remove_chains:
+                    remove_chains.remove(line)
+                    return False
             elif line.startswith('['):
                 # it's a rule
                 # ignore [packet:byte] counts at beginning of lines
                 line = line.split(']', 1)[1]
                 line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
+                if line in remove_rule_strs:
+                    remove_rule_strs.remove(line)
+                    return False
 
             # Leave it alone
             return True
@@ -618,8 +743,7 @@ class IptablesManager(object):
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
 
         return new_filter
 
@@ -723,6 +847,32 @@ def bind_floating_ip(floating_ip, device):
         send_arp_for_ip(floating_ip, device, CONF.send_arp_for_ha_count)
 
 
+def bind_floating_ips(floating_ips):
+    """Bind many ips to their public interfaces with one ip -batch.
+
+    floating_ips is a list of (floating_ip, device) tuples. Addresses
+    that are already bound are ignored, like in bind_floating_ip, any
+    other failure raises ProcessExecutionError.
+    """
+    if not floating_ips:
+        return
+    commands = ''.join('addr add %s/32 dev %s\n' % (floating_ip, device)
+                       for floating_ip, device in floating_ips)
+    out, err = _execute('ip', '-force', '-batch', '-',
+                        process_input=commands,
+                        run_as_root=True, check_exit_code=[0, 1])
+    errors = [line for line in err.splitlines()
+              if line and 'File exists' not in line and
+              not line.startswith('Command failed')]
+    if errors:
+        raise processutils.ProcessExecutionError(
+            stdout=out, stderr=err, exit_code=1, cmd='ip -force -batch -')
+
+    if CONF.send_arp_for_ha and CONF.send_arp_for_ha_count > 0:
+        for floating_ip, device in floating_ips:
+            send_arp_for_ip(floating_ip, device, CONF.send_arp_for_ha_count)
+
+
 def unbind_floating_ip(floating_ip, device):
     """Unbind a public ip from public interface."""
     _execute('ip', 'addr', 'del', str(floating_ip) + '/32',
@@ -769,6 +919,28 @@ def ensure_floating_forward(floating_ip, fixed_ip, device, network):
         ensure_ebtables_rules(*floating_ebtables_rules(fixed_ip, network))
 
 
+def ensure_floating_forwards(floating_ips):
+    """Ensure forwarding rules for many floating ips with one apply.
+
+    floating_ips is a list of (floating_ip, fixed_ip, device, network)
+    tuples, as passed to ensure_floating_forward.
+    """
+    nat = iptables_manager.ipv4['nat']
+    num_rules = nat.remove_rules_for_addresses(
+        floating_ip for floating_ip, _fixed, _device, _net in floating_ips)
+    if num_rules:
+        LOG.warn(_('Removed %d duplicate floating ip rules'), num_rules)
+    for floating_ip, fixed_ip, device, network in floating_ips:
+        for chain, rule in floating_forward_rules(floating_ip, fixed_ip,
+                                                  device):
+            nat.add_rule(chain, rule)
+    iptables_manager.apply()
+    for floating_ip, fixed_ip, device, network in floating_ips:
+        if device != network['bridge']:
+            ensure_ebtables_rules(*floating_ebtables_rules(fixed_ip,
+                                                           network))
+
+
 def remove_floating_forward(floating_ip, fixed_ip, device, network):
     """Remove forwarding for floating ip."""
     for chain, rule in floating_forward_rules(floating_ip, fixed_ip, device):
@@ -891,20 +1063,29 @@ def get_dhcp_leases(context, network_ref):
     return '\n'.join(hosts)
 
 
-def get_dhcp_hosts(context, network_ref):
-    """Get network's hosts config in dhcp-host format."""
-    hosts = []
+def _get_dhcp_fixed_ips(context, network_ref):
+    """Return the fixed IPs dnsmasq serves for a network on this host."""
     host = None
     if network_ref['multi_host']:
         host = CONF.host
+    return fixed_ip_obj.FixedIPList.get_by_network(context, network_ref,
+                                                   host=host)
+
+
+def _dhcp_host_lines(fixedips):
+    hosts = []
     macs = set()
-    for fixedip in fixed_ip_obj.FixedIPList.get_by_network(context,
-                                                           network_ref,
-                                                           host=host):
+    for fixedip in fixedips:
         if fixedip.virtual_interface.address not in macs:
             hosts.append(_host_dhcp(fixedip))
             macs.add(fixedip.virtual_interface.address)
-    return '\n'.join(hosts)
+    return hosts
+
+
+def get_dhcp_hosts(context, network_ref):
+    """Get network's hosts config in dhcp-host format."""
+    return '\n'.join(_dhcp_host_lines(_get_dhcp_fixed_ips(context,
+                                                          network_ref)))
 
 
 def get_dns_hosts(context, network_ref):
@@ -960,42 +1141,150 @@ def _remove_dhcp_mangle_rule(dev):
     iptables_manager.apply()
 
 
+def _dhcp_opts_lines(context, fixedips, default_gw_vifs):
+    """Return the dhcp-opts lines for a network's fixed IPs.
+
+    default_gw_vifs caches the virtual interface that gets the default
+    gateway for each instance, along with the interfaces the instance has
+    on this network. An instance is only looked up again when the latter
+    changed.
+
+    """
+    network_vifs = collections.defaultdict(set)
+    for fixedip in fixedips:
+        network_vifs[fixedip.instance_uuid].add(fixedip.virtual_interface_id)
+
+    for instance_uuid in default_gw_vifs.keys():
+        if instance_uuid not in network_vifs:
+            del default_gw_vifs[instance_uuid]
+    for instance_uuid, vif_ids in network_vifs.iteritems():
+        cached = default_gw_vifs.get(instance_uuid)
+        if cached and cached[0] == vif_ids:
+            continue
+        vifs = vif_obj.VirtualInterfaceList.get_by_instance_uuid(context,
+                instance_uuid)
+        #offer a default gateway to the first virtual interface
+        default_gw_vifs[instance_uuid] = (vif_ids,
+                                          vifs[0].id if vifs else None)
+
+    hosts = []
+    for fixedip in fixedips:
+        default_gw_vif = default_gw_vifs[fixedip.instance_uuid][1]
+        # we don't want default gateway for this fixed ip
+        if (default_gw_vif is not None and
+                default_gw_vif != fixedip.virtual_interface_id):
+            hosts.append(_host_dhcp_opts(fixedip))
+    return hosts
+
+
 def get_dhcp_opts(context, network_ref):
     """Get network's hosts config in dhcp-opts format."""
-    hosts = []
-    host = None
-    if network_ref['multi_host']:
-        host = CONF.host
-    fixedips = fixed_ip_obj.FixedIPList.get_by_network(context, network_ref,
-                                                       host=host)
-    if fixedips:
-        instance_set = set([fixedip.instance_uuid for fixedip in fixedips])
-        default_gw_vif = {}
-        for instance_uuid in instance_set:
-            vifs = vif_obj.VirtualInterfaceList.get_by_instance_uuid(context,
-                    instance_uuid)
-            if vifs:
-                #offer a default gateway to the first virtual interface
-                default_gw_vif[instance_uuid] = vifs[0].id
-
-        for fixedip in fixedips:
-            instance_uuid = fixedip.instance_uuid
-            if instance_uuid in default_gw_vif:
-                # we don't want default gateway for this fixed ip
-                if (default_gw_vif[instance_uuid] !=
-                        fixedip.virtual_interface_id):
-                    hosts.append(_host_dhcp_opts(fixedip))
-    return '\n'.join(hosts)
+    fixedips = _get_dhcp_fixed_ips(context, network_ref)
+    return '\n'.join(_dhcp_opts_lines(context, fixedips, {}))
 
 
 def release_dhcp(dev, address, mac_address):
     utils.execute('dhcp_release', dev, address, mac_address, run_as_root=True)
 
 
+class _DhcpHosts(object):
+    """What nova last wrote to the dnsmasq files of one device."""
+
+    def __init__(self):
+        # lines of the dhcp-hosts and dhcp-opts files, None until written
+        self.hosts = None
+        self.opts = None
+        # see _dhcp_opts_lines
+        self.default_gw_vifs = {}
+
+
+# dev -> _DhcpHosts
+_dhcp_hosts = {}
+
+# dev -> [greenthread, context, network_ref] of a delayed dnsmasq restart
+_pending_dhcp_restarts = {}
+
+
+def _patch_file(path, old_lines, new_lines):
+    """Update a file holding old_lines so it holds new_lines.
+
+    Entries keep the position they were first written at, so new ones
+    are appended and the file is only rewritten when entries went away.
+    Returns the lines now in the file and whether any were added and
+    removed.
+
+    """
+    if old_lines is None or not os.path.exists(path):
+        write_to_file(path, '\n'.join(new_lines))
+        return new_lines, True, True
+
+    wanted = set(new_lines)
+    kept = [line for line in old_lines if line in wanted]
+    kept_set = set(kept)
+    added = [line for line in new_lines if line not in kept_set]
+    if len(kept) < len(old_lines):
+        lines = kept + added
+        write_to_file(path, '\n'.join(lines))
+        return lines, bool(added), True
+    if added:
+        write_to_file(path, '\n'.join(([''] if old_lines else []) + added),
+                      mode='a')
+    return old_lines + added, bool(added), False
+
+
+def _cancel_restart_dhcp(dev):
+    pending = _pending_dhcp_restarts.pop(dev, None)
+    if pending:
+        pending[0].cancel()
+
+
+def _delayed_restart_dhcp(dev):
+    _thread, context, network_ref = _pending_dhcp_restarts.pop(dev)
+    try:
+        restart_dhcp(context, dev, network_ref)
+    except Exception:
+        LOG.exception(_('Failed to reload dnsmasq for %s'), dev)
+
+
+def _schedule_restart_dhcp(context, dev, network_ref):
+    """Restart dnsmasq once dhcp_reload_delay has passed.
+
+    Restarts requested in the meantime are merged into this one.
+
+    """
+    pending = _pending_dhcp_restarts.get(dev)
+    if pending:
+        pending[1:] = [context, network_ref]
+    else:
+        thread = greenthread.spawn_after(CONF.dhcp_reload_delay,
+                                         _delayed_restart_dhcp, dev)
+        _pending_dhcp_restarts[dev] = [thread, context, network_ref]
+
+
 def update_dhcp(context, dev, network_ref):
+    """Bring dnsmasq's dhcp-hosts file for a network up to date.
+
+    Only the entries that changed since the last update are written, and
+    dnsmasq is left alone when there are none, unless it is not running.
+    New entries are picked up after dhcp_reload_delay, removed ones right
+    away so that a released address can't be leased again.
+
+    """
     conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, get_dhcp_hosts(context, network_ref))
-    restart_dhcp(context, dev, network_ref)
+    table = _dhcp_hosts.setdefault(dev, _DhcpHosts())
+    host_lines = _dhcp_host_lines(_get_dhcp_fixed_ips(context, network_ref))
+    table.hosts, added, removed = _patch_file(conffile, table.hosts,
+                                              host_lines)
+    if removed or (added and not CONF.dhcp_reload_delay):
+        _cancel_restart_dhcp(dev)
+        restart_dhcp(context, dev, network_ref)
+    elif added:
+        _schedule_restart_dhcp(context, dev, network_ref)
+    elif not _dnsmasq_running(dev):
+        LOG.debug('dnsmasq for %s is not running, starting it', dev)
+        restart_dhcp(context, dev, network_ref)
+    else:
+        LOG.debug('dhcp hosts of %s unchanged, not reloading dnsmasq', dev)
 
 
 def update_dns(context, dev, network_ref):
@@ -1007,9 +1296,12 @@ def update_dns(context, dev, network_ref):
 def update_dhcp_hostfile_with_text(dev, hosts_text):
     conffile = _dhcp_file(dev, 'conf')
     write_to_file(conffile, hosts_text)
+    _dhcp_hosts.pop(dev, None)
 
 
 def kill_dhcp(dev):
+    _cancel_restart_dhcp(dev)
+    _dhcp_hosts.pop(dev, None)
     pid = _dnsmasq_pid_for(dev)
     if pid:
         # Check that the process exists and looks like a dnsmasq process
@@ -1039,9 +1331,14 @@ def restart_dhcp(context, dev, network_ref):
 
     if CONF.use_single_default_gateway:
         # NOTE(vish): this will have serious performance implications if we
-        #             are not in multi_host mode.
+        #             are not in multi_host mode. The interfaces of each
+        #             instance are remembered to keep it down.
         optsfile = _dhcp_file(dev, 'opts')
-        write_to_file(optsfile, get_dhcp_opts(context, network_ref))
+        table = _dhcp_hosts.setdefault(dev, _DhcpHosts())
+        fixedips = _get_dhcp_fixed_ips(context, network_ref)
+        table.opts = _patch_file(optsfile, table.opts,
+                                 _dhcp_opts_lines(context, fixedips,
+                                                  table.default_gw_vifs))[0]
         os.chmod(optsfile, 0o644)
 
     _add_dhcp_mangle_rule(dev)
@@ -1244,6 +1541,16 @@ def _dnsmasq_pid_for(dev):
             return None
 
 
+def _dnsmasq_running(dev):
+    """Return whether the dnsmasq of a bridge/device is running."""
+    pid = _dnsmasq_pid_for(dev)
+    if not pid:
+        return False
+    out, _err = _execute('cat', '/proc/%d/cmdline' % pid,
+                         check_exit_code=False)
+    return _dhcp_file(dev, 'conf').split('/')[-1] in out
+
+
 def _ra_pid_for(dev):
     """Returns the pid for prior radvd instance for a bridge/device.
 
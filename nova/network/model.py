@@ -381,6 +381,101 @@ class NetworkInfo(list):
         return jsonutils.dumps(self)
 
 
+def _hydrate_first(method):
+    """Wraps a list method of LazyNetworkInfo to hydrate all VIFs first."""
+    def wrapper(self, *args, **kwargs):
+        self._hydrate_all()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class LazyNetworkInfo(NetworkInfo):
+    """NetworkInfo that only hydrates the VIFs that are used.
+
+    The list holds the VIF dicts as they were decoded from JSON, and each
+    one is turned into a VIF model the first time it is read through the
+    list interface. fixed_ips() and floating_ips() only build the IP
+    models and leave the VIFs alone. Since the list items are plain dicts
+    until then, json() still produces the same document.
+    """
+
+    @classmethod
+    def hydrate(cls, network_info):
+        if isinstance(network_info, six.string_types):
+            network_info = jsonutils.loads(network_info)
+        return cls(network_info)
+
+    def _hydrate_vif(self, index):
+        vif = list.__getitem__(self, index)
+        if not isinstance(vif, VIF):
+            vif = VIF.hydrate(vif)
+            list.__setitem__(self, index, vif)
+        return vif
+
+    def _hydrate_all(self):
+        for index in xrange(len(self)):
+            self._hydrate_vif(index)
+
+    @staticmethod
+    def _raw_fixed_ips(vif):
+        network = vif.get('network') or {}
+        return [ip for subnet in network.get('subnets', [])
+                   for ip in subnet.get('ips', [])]
+
+    def fixed_ips(self):
+        """Returns all fixed_ips without floating_ips attached."""
+        ips = []
+        for vif in list.__iter__(self):
+            if isinstance(vif, VIF):
+                ips.extend(vif.fixed_ips())
+            else:
+                ips.extend(FixedIP.hydrate(ip)
+                           for ip in self._raw_fixed_ips(vif))
+        return ips
+
+    def floating_ips(self):
+        """Returns all floating_ips."""
+        ips = []
+        for vif in list.__iter__(self):
+            if isinstance(vif, VIF):
+                ips.extend(vif.floating_ips())
+            else:
+                ips.extend(IP.hydrate(floating_ip)
+                           for ip in self._raw_fixed_ips(vif)
+                           for floating_ip in ip.get('floating_ips', []))
+        return ips
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            self._hydrate_all()
+            return super(LazyNetworkInfo, self).__getitem__(index)
+        return self._hydrate_vif(index)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self._hydrate_vif(index)
+
+    def __eq__(self, other):
+        self._hydrate_all()
+        if isinstance(other, LazyNetworkInfo):
+            other._hydrate_all()
+        return list.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __getslice__ = _hydrate_first(list.__getslice__)
+    __contains__ = _hydrate_first(list.__contains__)
+    __reversed__ = _hydrate_first(list.__reversed__)
+    __repr__ = _hydrate_first(list.__repr__)
+    count = _hydrate_first(list.count)
+    index = _hydrate_first(list.index)
+    pop = _hydrate_first(list.pop)
+    remove = _hydrate_first(list.remove)
+    sort = _hydrate_first(list.sort)
+
+
 class NetworkInfoAsyncWrapper(NetworkInfo):
     """Wrapper around NetworkInfo that allows retrieving NetworkInfo
     in an async manner.
@@ -13,18 +13,124 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
+import httplib2
+from neutronclient import client as neutron_http
 from neutronclient.common import exceptions
 from neutronclient.v2_0 import client as clientv20
 from oslo.config import cfg
+import requests
 
 from nova.openstack.common import local
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova import utils
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+# Process wide state shared by all the neutron clients
+_session = None
+_admin_auth = {}
+_stats = collections.Counter()
 
-def _get_client(token=None):
+
+def _get_session():
+    """Return the requests session all the neutron clients send through."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=CONF.neutron_connection_pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def get_connection_stats():
+    """Return counters showing how well HTTP connections are reused.
+
+    'requests' is the number of HTTP requests sent, 'connections' the
+    number of connections that had to be opened for them and
+    'admin_authentications' the number of admin tokens fetched.
+    """
+    stats = {'requests': _stats['requests'], 'connections': 0,
+             'admin_authentications': _stats['admin_authentications']}
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                stats['connections'] += getattr(pools[key],
+                                                'num_connections', 0)
+    return stats
+
+
+def _get_token_expiry(httpclient):
+    """Return when the token httpclient authenticated with expires.
+
+    The keystone response is kept in the service catalog of the client.
+    None is returned when it does not tell.
+    """
+    try:
+        catalog = httpclient.service_catalog.catalog
+        expires = catalog['access']['token']['expires']
+    except (AttributeError, KeyError, TypeError):
+        return None
+    return timeutils.parse_isotime(expires)
+
+
+class _PooledHTTPClient(neutron_http.HTTPClient):
+    """HTTPClient that reuses connections and the shared admin token."""
+
+    def __init__(self, shares_admin_token=False, **kwargs):
+        super(_PooledHTTPClient, self).__init__(**kwargs)
+        self.shares_admin_token = shares_admin_token
+
+    def request(self, url, method, body=None, headers=None, **kwargs):
+        """Send a request through the process wide session.
+
+        This replaces httplib2.Http.request, which HTTPClient inherits and
+        which gets a new connection for every request, as HTTPClient
+        clears the connections of the client after each of them.  The
+        response is returned as httplib2 would, as HTTPClient reads its
+        status from there.
+        """
+        content_type = kwargs.pop('content_type', None) or 'application/json'
+        headers = headers or {}
+        headers.setdefault('Accept', content_type)
+        if body:
+            headers.setdefault('Content-Type', content_type)
+        headers['User-Agent'] = self.USER_AGENT
+        if self.disable_ssl_certificate_validation:
+            verify = False
+        else:
+            verify = self.ca_certs or True
+        _stats['requests'] += 1
+        resp = _get_session().request(method, url, data=body,
+                                      headers=headers, verify=verify,
+                                      timeout=self.timeout, **kwargs)
+        info = dict(resp.headers)
+        info['status'] = resp.status_code
+        return httplib2.Response(info), resp.content
+
+    def authenticate_and_fetch_endpoint_url(self):
+        if self.shares_admin_token:
+            self.auth_token = _get_admin_token(self)
+        super(_PooledHTTPClient, self).authenticate_and_fetch_endpoint_url()
+
+    def authenticate(self):
+        super(_PooledHTTPClient, self).authenticate()
+        if self.shares_admin_token:
+            # This also runs when neutron rejected the shared token and
+            # the client had to get a new one
+            _admin_auth['token'] = self.auth_token
+            _admin_auth['expires'] = _get_token_expiry(self)
+            _stats['admin_authentications'] += 1
+
+
+def _get_params(token=None):
     params = {
         'endpoint_url': CONF.neutron_url,
         'timeout': CONF.neutron_url_timeout,
@@ -43,7 +149,32 @@ def _get_client(token=None):
             params['tenant_name'] = CONF.neutron_admin_tenant_name
         params['password'] = CONF.neutron_admin_password
         params['auth_url'] = CONF.neutron_admin_auth_url
-    return clientv20.Client(**params)
+    return params
+
+
+@utils.synchronized('neutron-admin-token')
+def _get_admin_token(httpclient):
+    """Return the admin token shared by the process.
+
+    httpclient authenticates to get a new one when there is none yet or
+    when it expires in less than neutron_admin_token_refresh seconds.
+    """
+    token = _admin_auth.get('token')
+    expires = _admin_auth.get('expires')
+    if token and (expires is None or
+                  not timeutils.is_soon(expires,
+                                        CONF.neutron_admin_token_refresh)):
+        return token
+    httpclient.authenticate()
+    return httpclient.auth_token
+
+
+def _get_client(token=None):
+    params = _get_params(token)
+    client = clientv20.Client(**params)
+    client.httpclient = _PooledHTTPClient(shares_admin_token=not token,
+                                          **params)
+    return client
 
 
 def get_client(context, admin=False):
@@ -56,10 +187,8 @@ def get_client(context, admin=False):
         # NOTE(dims): We need to use admin token, let us cache a
         # thread local copy for re-using this client
         # multiple times and to avoid excessive calls
-        # to neutron to fetch tokens. Some of the hackiness in this code
-        # will go away once BP auth-plugins is implemented.
-        # That blue print will ensure that tokens can be shared
-        # across clients as well
+        # to neutron to fetch tokens. The token itself and the HTTP
+        # connections are shared by all the clients of the process.
         if not hasattr(local.strong_store, 'neutron_client'):
             local.strong_store.neutron_client = _get_client(token=None)
         return local.strong_store.neutron_client
@@ -78,6 +78,14 @@ neutron_opts = [
     cfg.StrOpt('neutron_ca_certificates_file',
                 help='Location of CA certificates file to use for '
                      'neutron client requests.'),
+    cfg.IntOpt('neutron_connection_pool_size',
+               default=10,
+               help='Number of HTTP connections to neutron and keystone '
+                    'that are kept open for reuse by this process'),
+    cfg.IntOpt('neutron_admin_token_refresh',
+               default=60,
+               help='Number of seconds before the shared admin token '
+                    'expires at which a new one is fetched'),
    ]
 
 CONF = cfg.CONF
@@ -103,7 +111,7 @@ class API(base_api.NetworkAPI):
         """Setup or teardown the network structures."""
 
     def _get_available_networks(self, context, project_id,
-                                net_ids=None, neutron=None):
+                                net_ids=None, neutron=None, shared=None):
         """Return a network list available for the tenant.
         The list contains networks owned by the tenant and public networks.
         If net_ids specified, it searches networks with requested IDs only.
@@ -111,7 +119,9 @@ class API(base_api.NetworkAPI):
         if not neutron:
             neutron = neutronv2.get_client(context)
 
-        if net_ids:
+        if net_ids and shared is not None:
+            nets = shared.get_networks(net_ids)
+        elif net_ids:
             # If user has specified to attach instance only to specific
             # networks then only add these to **search_opts. This search will
             # also include 'shared' networks.
@@ -468,17 +478,67 @@ class API(base_api.NetworkAPI):
                                                     result, update_cells=False)
         return result
 
+    def get_instance_nw_info_for_instances(self, context, instances,
+                                           use_slave=False):
+        """Refresh the network info cache of several instances at once.
+
+        The ports of all the instances are fetched with a single
+        list_ports() call filtered on the set of device ids, instead of
+        one call per instance. The networks, subnets, DHCP ports and
+        floating IPs of those ports are then fetched once for the whole
+        batch as well.
+        """
+        nw_infos = {}
+        if not instances:
+            return nw_infos
+        client = neutronv2.get_client(context, admin=True)
+        data = client.list_ports(
+            device_id=[instance['uuid'] for instance in instances])
+        ports_by_device = {}
+        for port in data.get('ports', []):
+            ports_by_device.setdefault(port['device_id'], []).append(port)
+
+        instance_ports = {}
+        net_ids = set()
+        for instance in instances:
+            instance_ports[instance['uuid']] = [
+                port for port in ports_by_device.get(instance['uuid'], [])
+                if port['tenant_id'] == instance['project_id']]
+            net_ids.update(
+                vif['network']['id'] for vif in
+                compute_utils.get_nw_info_for_instance(instance) or [])
+        shared = _SharedResources(
+            context, client,
+            [port for instance in instances
+             for port in instance_ports[instance['uuid']]],
+            net_ids)
+
+        for instance in instances:
+            try:
+                result = self._get_instance_nw_info(
+                    context, instance, ports=instance_ports[instance['uuid']],
+                    shared=shared)
+                base_api.update_instance_cache_with_nw_info(
+                    self, context, instance, result, update_cells=False)
+            except Exception:
+                LOG.exception(_('Failed to refresh network info cache'),
+                              instance=instance)
+                continue
+            nw_infos[instance['uuid']] = result
+        return nw_infos
+
     def _get_instance_nw_info(self, context, instance, networks=None,
-                              port_ids=None):
+                              port_ids=None, ports=None, shared=None):
         # keep this caching-free version of the get_instance_nw_info method
         # because it is used by the caching logic itself.
         LOG.debug('get_instance_nw_info() for %s', instance['display_name'])
         nw_info = self._build_network_info_model(context, instance, networks,
-                                                 port_ids)
+                                                 port_ids, ports=ports,
+                                                 shared=shared)
         return network_model.NetworkInfo.hydrate(nw_info)
 
     def _gather_port_ids_and_networks(self, context, instance, networks=None,
-                                      port_ids=None):
+                                      port_ids=None, shared=None):
         """Return an instance's complete list of port_ids and networks."""
 
         if ((networks is None and port_ids is not None) or
@@ -497,7 +557,7 @@ class API(base_api.NetworkAPI):
         if networks is None:
             networks = self._get_available_networks(context,
                                                     instance['project_id'],
-                                                    net_ids)
+                                                    net_ids, shared=shared)
         # an interface was added/removed from instance.
         else:
             # Since networks does not contain the existing networks on the
@@ -1019,12 +1079,16 @@ class API(base_api.NetworkAPI):
         """Force add a network to the project."""
         raise NotImplementedError()
 
-    def _nw_info_get_ips(self, client, port):
+    def _nw_info_get_ips(self, client, port, shared=None):
         network_IPs = []
         for fixed_ip in port['fixed_ips']:
             fixed = network_model.FixedIP(address=fixed_ip['ip_address'])
-            floats = self._get_floating_ips_by_fixed_and_port(
-                client, fixed_ip['ip_address'], port['id'])
+            if shared is not None:
+                floats = shared.get_floating_ips(fixed_ip['ip_address'],
+                                                 port['id'])
+            else:
+                floats = self._get_floating_ips_by_fixed_and_port(
+                    client, fixed_ip['ip_address'], port['id'])
             for ip in floats:
                 fip = network_model.IP(address=ip['floating_ip_address'],
                                        type='floating')
@@ -1032,8 +1096,8 @@ class API(base_api.NetworkAPI):
             network_IPs.append(fixed)
         return network_IPs
 
-    def _nw_info_get_subnets(self, context, port, network_IPs):
-        subnets = self._get_subnets_from_port(context, port)
+    def _nw_info_get_subnets(self, context, port, network_IPs, shared=None):
+        subnets = self._get_subnets_from_port(context, port, shared=shared)
         for subnet in subnets:
             subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
                              if fixed_ip.is_in_subnet(subnet)]
@@ -1089,7 +1153,7 @@ class API(base_api.NetworkAPI):
         return network, ovs_interfaceid
 
     def _build_network_info_model(self, context, instance, networks=None,
-                                  port_ids=None):
+                                  port_ids=None, ports=None, shared=None):
         """Return list of ordered VIFs attached to instance.
 
         :param context - request context.
@@ -1101,16 +1165,22 @@ class API(base_api.NetworkAPI):
                           instance in order of attachment. If value is None
                           this value will be populated from the existing
                           cached value.
+        :param ports - List of the instance's current neutron ports. If
+                       value is None they are looked up in neutron.
+        :param shared - _SharedResources to read networks, subnets and
+                        floating IPs from instead of asking neutron.
         """
 
-        search_opts = {'tenant_id': instance['project_id'],
-                       'device_id': instance['uuid'], }
         client = neutronv2.get_client(context, admin=True)
-        data = client.list_ports(**search_opts)
+        if ports is None:
+            search_opts = {'tenant_id': instance['project_id'],
+                           'device_id': instance['uuid'], }
+            data = client.list_ports(**search_opts)
+            ports = data.get('ports', [])
 
-        current_neutron_ports = data.get('ports', [])
+        current_neutron_ports = ports
         networks, port_ids = self._gather_port_ids_and_networks(
-                context, instance, networks, port_ids)
+                context, instance, networks, port_ids, shared=shared)
         nw_info = network_model.NetworkInfo()
 
         current_neutron_port_map = {}
@@ -1127,10 +1197,12 @@ class API(base_api.NetworkAPI):
                     vif_active = True
 
                 network_IPs = self._nw_info_get_ips(client,
-                                                    current_neutron_port)
+                                                    current_neutron_port,
+                                                    shared=shared)
                 subnets = self._nw_info_get_subnets(context,
                                                     current_neutron_port,
-                                                    network_IPs)
+                                                    network_IPs,
+                                                    shared=shared)
 
                 devname = "tap" + current_neutron_port['id']
                 devname = devname[:network_model.NIC_NAME_LEN]
@@ -1151,7 +1223,7 @@ class API(base_api.NetworkAPI):
 
         return nw_info
 
-    def _get_subnets_from_port(self, context, port):
+    def _get_subnets_from_port(self, context, port, shared=None):
         """Return the subnets for a given port."""
 
         fixed_ips = port['fixed_ips']
@@ -1162,9 +1234,13 @@ class API(base_api.NetworkAPI):
         # related to the port. To avoid this, the method returns here.
         if not fixed_ips:
             return []
-        search_opts = {'id': [ip['subnet_id'] for ip in fixed_ips]}
-        data = neutronv2.get_client(context).list_subnets(**search_opts)
-        ipam_subnets = data.get('subnets', [])
+        if shared is not None:
+            ipam_subnets = shared.get_subnets(ip['subnet_id']
+                                              for ip in fixed_ips)
+        else:
+            search_opts = {'id': [ip['subnet_id'] for ip in fixed_ips]}
+            data = neutronv2.get_client(context).list_subnets(**search_opts)
+            ipam_subnets = data.get('subnets', [])
         subnets = []
 
         for subnet in ipam_subnets:
@@ -1175,10 +1251,13 @@ class API(base_api.NetworkAPI):
             }
 
             # attempt to populate DHCP server field
-            search_opts = {'network_id': subnet['network_id'],
-                           'device_owner': 'network:dhcp'}
-            data = neutronv2.get_client(context).list_ports(**search_opts)
-            dhcp_ports = data.get('ports', [])
+            if shared is not None:
+                dhcp_ports = shared.get_dhcp_ports(subnet['network_id'])
+            else:
+                search_opts = {'network_id': subnet['network_id'],
+                               'device_owner': 'network:dhcp'}
+                data = neutronv2.get_client(context).list_ports(**search_opts)
+                dhcp_ports = data.get('ports', [])
             for p in dhcp_ports:
                 for ip_pair in p['fixed_ips']:
                     if ip_pair['subnet_id'] == subnet['id']:
@@ -1238,3 +1317,77 @@ def _ensure_requested_network_ordering(accessor, unordered, preferred):
     """Sort a list with respect to the preferred network ordering."""
     if preferred:
         unordered.sort(key=lambda i: preferred.index(accessor(i)))
+
+
+class _SharedResources(object):
+    """Neutron resources shared by one bulk network info refresh.
+
+    Instances in the same batch usually sit on the same networks and
+    subnets, so get_instance_nw_info_for_instances() looks all of them
+    up here with one request per resource type instead of asking neutron
+    again for every port.
+    """
+
+    def __init__(self, context, admin_client, ports, net_ids):
+        client = neutronv2.get_client(context)
+
+        self.networks = {}
+        if net_ids:
+            data = client.list_networks(id=sorted(net_ids))
+            for network in data.get('networks', []):
+                self.networks[network['id']] = network
+
+        self.subnets = {}
+        subnet_ids = set(ip['subnet_id'] for port in ports
+                         for ip in port.get('fixed_ips', []))
+        if subnet_ids:
+            data = client.list_subnets(id=sorted(subnet_ids))
+            for subnet in data.get('subnets', []):
+                self.subnets[subnet['id']] = subnet
+
+        self.dhcp_ports = {}
+        network_ids = set(subnet['network_id']
+                          for subnet in self.subnets.values())
+        if network_ids:
+            data = client.list_ports(network_id=sorted(network_ids),
+                                     device_owner='network:dhcp')
+            for port in data.get('ports', []):
+                self.dhcp_ports.setdefault(port['network_id'], []).append(
+                    port)
+
+        self.floating_ips = {}
+        if ports:
+            for fip in self._list_floating_ips(
+                    admin_client, [port['id'] for port in ports]):
+                key = (fip['fixed_ip_address'], fip['port_id'])
+                self.floating_ips.setdefault(key, []).append(fip)
+
+    @staticmethod
+    def _list_floating_ips(client, port_ids):
+        try:
+            return client.list_floatingips(
+                port_id=port_ids).get('floatingips', [])
+        # If a neutron plugin does not implement the L3 API a 404 from
+        # list_floatingips will be raised.
+        except neutronv2.exceptions.NeutronClientException as e:
+            if e.status_code == 404:
+                return []
+            raise
+
+    def get_networks(self, net_ids):
+        return [self.networks[net_id] for net_id in set(net_ids)
+                if net_id in self.networks]
+
+    def get_subnets(self, subnet_ids):
+        subnets = []
+        for subnet_id in subnet_ids:
+            subnet = self.subnets.get(subnet_id)
+            if subnet is not None and subnet not in subnets:
+                subnets.append(subnet)
+        return subnets
+
+    def get_dhcp_ports(self, network_id):
+        return self.dhcp_ports.get(network_id, [])
+
+    def get_floating_ips(self, fixed_ip, port_id):
+        return self.floating_ips.get((fixed_ip, port_id), [])
@@ -176,7 +176,8 @@ class BlockDeviceMappingList(base.ObjectListBase, base.NovaObject):
     # Version 1.0: Initial version
     # Version 1.1: BlockDeviceMapping <= version 1.1
     # Version 1.2: Added use_slave to get_by_instance_uuid
-    VERSION = '1.2'
+    # Version 1.3: Added get_by_instance_uuids
+    VERSION = '1.3'
 
     fields = {
         'objects': fields.ListOfObjectsField('BlockDeviceMapping'),
@@ -185,6 +186,7 @@ class BlockDeviceMappingList(base.ObjectListBase, base.NovaObject):
         '1.0': '1.0',
         '1.1': '1.1',
         '1.2': '1.1',
+        '1.3': '1.1',
     }
 
     @base.remotable_classmethod
@@ -194,6 +196,13 @@ class BlockDeviceMappingList(base.ObjectListBase, base.NovaObject):
         return base.obj_make_list(
                 context, cls(), BlockDeviceMapping, db_bdms or [])
 
+    @base.remotable_classmethod
+    def get_by_instance_uuids(cls, context, instance_uuids, use_slave=False):
+        db_bdms = db.block_device_mapping_get_all_by_instance_uuids(
+                context, instance_uuids, use_slave=use_slave)
+        return base.obj_make_list(
+                context, cls(), BlockDeviceMapping, db_bdms or [])
+
     def root_bdm(self):
         try:
             return (bdm_obj for bdm_obj in self if bdm_obj.is_root).next()
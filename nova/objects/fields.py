@@ -425,7 +425,7 @@ class NetworkModel(FieldType):
             return value
         elif isinstance(value, six.string_types):
             # Hmm, do we need this?
-            return network_model.NetworkInfo.hydrate(value)
+            return network_model.LazyNetworkInfo.hydrate(value)
         else:
             raise ValueError(_('A NetworkModel is required here'))
 
@@ -435,7 +435,7 @@ class NetworkModel(FieldType):
 
     @staticmethod
     def from_primitive(obj, attr, value):
-        return network_model.NetworkInfo.hydrate(value)
+        return network_model.LazyNetworkInfo.hydrate(value)
 
 
 class AutoTypedField(Field):
@@ -604,7 +604,8 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 1.4: Instance <= version 1.12
     # Version 1.5: Added method get_active_by_window_joined.
     # Version 1.6: Instance <= version 1.13
-    VERSION = '1.6'
+    # Version 1.7: Added get_popular_image_refs
+    VERSION = '1.7'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -617,6 +618,7 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         '1.4': '1.12',
         '1.5': '1.12',
         '1.6': '1.13',
+        '1.7': '1.13',
         }
 
     @base.remotable_classmethod
@@ -661,6 +663,12 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
+    @base.remotable_classmethod
+    def get_popular_image_refs(cls, context, limit, use_slave=False):
+        """Return the image refs used by most instances, most used first."""
+        return db.instance_get_popular_image_refs(context, limit,
+                                                  use_slave=use_slave)
+
     @base.remotable_classmethod
     def _get_active_by_window_joined(cls, context, begin, end=None,
                                     project_id=None, host=None,
@@ -0,0 +1,87 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Run statistics of the periodic tasks of the managers of a service."""
+
+from nova.openstack.common.report.models import with_default_views as mwdv
+
+
+class TaskTimings(object):
+    """Run statistics and a duration histogram for one periodic task."""
+
+    # Upper bounds, in seconds, of the histogram buckets.  Runs longer
+    # than the last one are counted in an extra, unbounded bucket.
+    BUCKETS = (0.1, 1, 10, 60, 300)
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.last = None
+        self.histogram = [0] * (len(self.BUCKETS) + 1)
+
+    def record(self, duration, failed=False):
+        self.runs += 1
+        if failed:
+            self.failures += 1
+        self.total += duration
+        self.longest = max(self.longest, duration)
+        self.last = duration
+        for i, bound in enumerate(self.BUCKETS):
+            if duration < bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def to_dict(self):
+        labels = ['< %ss' % bound for bound in self.BUCKETS]
+        labels.append('>= %ss' % self.BUCKETS[-1])
+        return {'runs': self.runs,
+                'failures': self.failures,
+                'skipped': self.skipped,
+                'last': self.last,
+                'mean': self.total / self.runs if self.runs else None,
+                'longest': self.longest,
+                'histogram': dict(zip(labels, self.histogram))}
+
+
+_task_timings = {}
+
+
+def get(full_task_name):
+    """Return the TaskTimings of a task, creating it on first use."""
+    return _task_timings.setdefault(full_task_name, TaskTimings())
+
+
+def get_task_timings():
+    """Return the run statistics of all the periodic tasks run so far.
+
+    The result maps the full name of each task to a dict of its number
+    of runs, failures and skipped runs, its last, mean and longest
+    durations, and a histogram of its durations.
+    """
+    return dict((name, timings.to_dict())
+                for name, timings in _task_timings.items())
+
+
+class PeriodicTaskReportGenerator(object):
+    """Guru Meditation report generator for the periodic task statistics.
+
+    The model maps the name of each periodic task run so far to the
+    statistics returned by :func:`get_task_timings`.
+    """
+
+    def __call__(self):
+        return mwdv.ModelWithDefaultViews(get_task_timings())
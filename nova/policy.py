@@ -16,12 +16,14 @@
 """Policy Engine For Nova."""
 
 import os.path
+import weakref
 
 from oslo.config import cfg
 
 from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import policy
+from nova.openstack.common import timeutils
 from nova import utils
 
 
@@ -32,6 +34,10 @@ policy_opts = [
     cfg.StrOpt('policy_default_rule',
                default='default',
                help=_('Rule checked when requested rule is not found')),
+    cfg.IntOpt('policy_file_check_interval',
+               default=1,
+               help=_('Seconds between checks of the policy file for '
+                      'changes. 0 checks it on every policy enforcement')),
     ]
 
 CONF = cfg.CONF
@@ -40,12 +46,27 @@ CONF.register_opts(policy_opts)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
 
+# The rules the callables in _COMPILED_RULES were compiled from.
+# _RULES_GENERATION changes every time they are, so results remembered
+# for request contexts are not used with newer rules.
+_COMPILED_FROM = None
+_COMPILED_RULES = {}
+_RULES_GENERATION = 0
+
+# Results of rules that only depend on roles and is_admin, kept for as
+# long as the request context they were evaluated for.
+_CONTEXT_RESULTS = weakref.WeakKeyDictionary()
+
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _COMPILED_FROM
+    global _COMPILED_RULES
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _COMPILED_FROM = None
+    _COMPILED_RULES = {}
     policy.reset()
 
 
@@ -58,8 +79,14 @@ def init():
             _POLICY_PATH = CONF.find_file(_POLICY_PATH)
         if not _POLICY_PATH:
             raise exception.ConfigNotFound(path=CONF.policy_file)
+    now = timeutils.utcnow_ts()
+    if 'checked_at' in _POLICY_CACHE:
+        elapsed = now - _POLICY_CACHE['checked_at']
+        if 0 <= elapsed < CONF.policy_file_check_interval:
+            return
     utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
                            reload_func=_set_rules)
+    _POLICY_CACHE['checked_at'] = now
 
 
 def _set_rules(data):
@@ -91,14 +118,10 @@ def enforce(context, action, target, do_raise=True):
     """
     init()
 
-    credentials = context.to_dict()
-
-    # Add the exception arguments if asked to do a raise
-    extra = {}
-    if do_raise:
-        extra.update(exc=exception.PolicyNotAuthorized, action=action)
-
-    return policy.check(action, target, credentials, **extra)
+    result = _check(context, action, target)
+    if do_raise and result is False:
+        raise exception.PolicyNotAuthorized(action=action)
+    return result
 
 
 def check_is_admin(context):
@@ -108,10 +131,121 @@ def check_is_admin(context):
     init()
 
     #the target is user-self
-    credentials = context.to_dict()
-    target = credentials
+    return _check(context, 'context_is_admin', None)
+
 
-    return policy.check('context_is_admin', target, credentials)
+def _check(context, action, target):
+    """Evaluate the compiled rule for action.
+
+    Rules that only look at the roles and is_admin of the credentials are
+    evaluated once per request context; a target of None stands for the
+    credentials themselves.
+    """
+    rule, ignores_target = _get_compiled_rule(action)
+    if not ignores_target:
+        credentials = context.to_dict()
+        if target is None:
+            target = credentials
+        return rule(target, credentials)
+
+    credentials = {'roles': context.roles, 'is_admin': context.is_admin}
+    try:
+        results = _CONTEXT_RESULTS.setdefault(context, {})
+    except TypeError:
+        # Not a context we can keep a weak reference to
+        return rule(target, credentials)
+    key = (_RULES_GENERATION, action, tuple(context.roles), context.is_admin)
+    if key not in results:
+        results[key] = rule(target, credentials)
+    return results[key]
+
+
+def _get_compiled_rule(action):
+    """Return the compiled rule for action.
+
+    Rules are compiled again whenever the policy rules are replaced.
+    """
+    global _COMPILED_FROM
+    global _COMPILED_RULES
+    global _RULES_GENERATION
+    rules = policy._rules
+    if rules is not _COMPILED_FROM:
+        _COMPILED_FROM = rules
+        _COMPILED_RULES = {}
+        _RULES_GENERATION += 1
+    if action not in _COMPILED_RULES:
+        try:
+            # No rules to reference means we're going to fail closed
+            rule = rules[action] if rules else policy.FalseCheck()
+        except KeyError:
+            rule = policy.FalseCheck()
+        _COMPILED_RULES[action] = _compile(rule, rules, frozenset())
+    return _COMPILED_RULES[action]
+
+
+def _allow(target, creds):
+    return True
+
+
+def _deny(target, creds):
+    return False
+
+
+def _compile(check, rules, seen):
+    """Flatten a check tree into a single callable.
+
+    rule: references are resolved up front, so evaluating the result does
+    not go back to the rules. Returns the callable and whether it only
+    depends on the roles and is_admin of the credentials.
+    """
+    if isinstance(check, policy.TrueCheck):
+        return _allow, True
+    if isinstance(check, policy.FalseCheck):
+        return _deny, True
+    if isinstance(check, policy.RuleCheck):
+        if check.match in seen:
+            # A rule referring to itself is left to RuleCheck
+            return check, False
+        try:
+            rule = rules[check.match]
+        except KeyError:
+            # We don't have any matching rule; fail closed
+            return _deny, True
+        return _compile(rule, rules, seen | set([check.match]))
+    if isinstance(check, policy.RoleCheck):
+        role = check.match.lower()
+
+        def role_check(target, creds):
+            return role in [x.lower() for x in creds['roles']]
+        return role_check, True
+    if isinstance(check, IsAdminCheck):
+        return check, True
+    if isinstance(check, policy.NotCheck):
+        inner, ignores_target = _compile(check.rule, rules, seen)
+
+        def not_check(target, creds):
+            return not inner(target, creds)
+        return not_check, ignores_target
+    if isinstance(check, (policy.AndCheck, policy.OrCheck)):
+        compiled = [_compile(sub, rules, seen) for sub in check.rules]
+        checks = tuple(sub for sub, _ignores in compiled)
+        ignores_target = all(ignores for _sub, ignores in compiled)
+        if isinstance(check, policy.AndCheck):
+            def and_check(target, creds):
+                for sub in checks:
+                    if not sub(target, creds):
+                        return False
+                return True
+            return and_check, ignores_target
+
+        def or_check(target, creds):
+            for sub in checks:
+                if sub(target, creds):
+                    return True
+            return False
+        return or_check, ignores_target
+    # Generic, http and any other registered checks are used as they are
+    return check, False
 
 
 @policy.register('is_admin')
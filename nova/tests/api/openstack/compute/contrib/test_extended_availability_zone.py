@@ -73,6 +73,10 @@ def fake_get_no_host_availability_zone(context, host):
     return None
 
 
+def fake_aggregate_host_get_by_metadata_key(context, key):
+    return {'all-host': set(['all-host'])}
+
+
 class ExtendedAvailabilityZoneTest(test.TestCase):
     content_type = 'application/json'
     prefix = 'OS-EXT-AZ:'
@@ -85,6 +89,8 @@ class ExtendedAvailabilityZoneTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(availability_zones, 'get_host_availability_zone',
                        fake_get_host_availability_zone)
+        self.stubs.Set(db, 'aggregate_host_get_by_metadata_key',
+                       fake_aggregate_host_get_by_metadata_key)
         return_server = fakes.fake_instance_get()
         self.stubs.Set(db, 'instance_get_by_uuid', return_server)
 
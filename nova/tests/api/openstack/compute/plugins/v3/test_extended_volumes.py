@@ -44,20 +44,29 @@ def fake_compute_get_not_found(*args, **kwargs):
 
 
 def fake_compute_get_all(*args, **kwargs):
-    db_list = [fakes.stub_instance(1), fakes.stub_instance(2)]
+    db_list = [fakes.stub_instance(1, uuid=UUID1),
+               fakes.stub_instance(2, uuid=UUID2)]
     fields = instance_obj.INSTANCE_DEFAULT_FIELDS
     return instance_obj._make_instance_list(args[1],
                                             instance_obj.InstanceList(),
                                             db_list, fields)
 
 
-def fake_bdms_get_all_by_instance(*args, **kwargs):
+def fake_bdms_get_all_by_instance(context, instance_uuid, use_slave=False):
     return [fake_block_device.FakeDbBlockDeviceDict(
             {'volume_id': UUID1, 'source_type': 'volume',
-             'destination_type': 'volume', 'id': 1}),
+             'destination_type': 'volume', 'id': 1,
+             'instance_uuid': instance_uuid}),
             fake_block_device.FakeDbBlockDeviceDict(
             {'volume_id': UUID2, 'source_type': 'volume',
-             'destination_type': 'volume', 'id': 2})]
+             'destination_type': 'volume', 'id': 2,
+             'instance_uuid': instance_uuid})]
+
+
+def fake_bdms_get_all_by_instance_uuids(context, instance_uuids,
+                                        use_slave=False):
+    return [bdm for instance_uuid in instance_uuids
+            for bdm in fake_bdms_get_all_by_instance(context, instance_uuid)]
 
 
 def fake_attach_volume(self, context, instance, volume_id,
@@ -138,6 +147,8 @@ class ExtendedVolumesTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(db, 'block_device_mapping_get_all_by_instance',
                        fake_bdms_get_all_by_instance)
+        self.stubs.Set(db, 'block_device_mapping_get_all_by_instance_uuids',
+                       fake_bdms_get_all_by_instance_uuids)
         self.stubs.Set(volume.cinder.API, 'get', fake_volume_get)
         self.stubs.Set(compute.api.API, 'detach_volume', fake_detach_volume)
         self.stubs.Set(compute.api.API, 'attach_volume', fake_attach_volume)
@@ -40,6 +40,7 @@ from nova import block_device
 from nova import compute
 from nova.compute import api as compute_api
 from nova.compute import flavors
+from nova.compute import instance_actions
 from nova.compute import manager as compute_manager
 from nova.compute import power_state
 from nova.compute import rpcapi as compute_rpcapi
@@ -5422,6 +5423,35 @@ class ComputeTestCase(BaseTestCase):
                 mock.call(c, instance, self.compute.host, teardown=True)])
             clear_events.assert_called_once_with(instance)
 
+    def test_post_live_migration_releases_resources(self):
+        c = context.get_admin_context()
+        instance = self._objectify(self._create_fake_instance({
+                                        'host': self.compute.host,
+                                        'task_state': task_states.MIGRATING,
+                                        'power_state': power_state.PAUSED}))
+        rt = mock.Mock()
+        other_rt = mock.Mock()
+        self.compute._resource_tracker_dict = {NODENAME: rt,
+                                               'othernode': other_rt}
+
+        with contextlib.nested(
+            mock.patch.object(self.compute.driver, 'post_live_migration'),
+            mock.patch.object(self.compute.driver, 'unfilter_instance'),
+            mock.patch.object(self.compute.network_api,
+                              'migrate_instance_start'),
+            mock.patch.object(self.compute.compute_rpcapi,
+                              'post_live_migration_at_destination'),
+            mock.patch.object(self.compute.driver, 'unplug_vifs'),
+            mock.patch.object(self.compute.network_api,
+                              'setup_networks_on_host'),
+            mock.patch.object(self.compute.instance_events,
+                              'clear_events_for_instance')
+        ):
+            self.compute._post_live_migration(c, instance, 'desthost')
+
+        rt.release_instance.assert_called_once_with(c, instance)
+        self.assertFalse(other_rt.release_instance.called)
+
     def test_post_live_migration_terminate_volume_connections(self):
         c = context.get_admin_context()
         instance = self._objectify(self._create_fake_instance({
@@ -5925,82 +5955,97 @@ class ComputeTestCase(BaseTestCase):
 
     def test_heal_instance_info_cache(self):
         # Update on every call for the test
-        self.flags(heal_instance_info_cache_interval=-1)
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=2)
         ctxt = context.get_admin_context()
 
         instance_map = {}
         instances = []
         for x in xrange(8):
             inst_uuid = 'fake-uuid-%s' % x
+            info_cache = None
+            if x != 7:
+                # Leave '7' without a cache so that it goes first, the
+                # others are ordered by the age of their cache.
+                info_cache = {'instance_uuid': inst_uuid,
+                              'network_info': None,
+                              'created_at': datetime.datetime(2014, 1, 1),
+                              'updated_at': datetime.datetime(2014, 1, 1,
+                                                              0, x),
+                              'deleted_at': None,
+                              'deleted': False}
             instance_map[inst_uuid] = fake_instance.fake_db_instance(
-                uuid=inst_uuid, host=CONF.host, created_at=None)
+                uuid=inst_uuid, host=CONF.host, created_at=None,
+                info_cache=info_cache)
             # These won't be in our instance since they're not requested
             instances.append(instance_map[inst_uuid])
 
-        call_info = {'get_all_by_host': 0, 'get_by_uuid': 0,
-                'get_nw_info': 0, 'expected_instance': None}
+        call_info = {'get_all_by_host': 0, 'get_by_filters': 0,
+                'get_nw_info': 0, 'expected_instances': None}
 
         def fake_instance_get_all_by_host(context, host,
                                           columns_to_join, use_slave=False):
             call_info['get_all_by_host'] += 1
-            self.assertEqual([], columns_to_join)
+            self.assertEqual(['info_cache'], columns_to_join)
             return instances[:]
 
-        def fake_instance_get_by_uuid(context, instance_uuid,
-                                      columns_to_join, use_slave=False):
-            if instance_uuid not in instance_map:
-                raise exception.InstanceNotFound(instance_id=instance_uuid)
-            call_info['get_by_uuid'] += 1
+        def fake_instance_get_all_by_filters(context, filters, sort_key,
+                                             sort_dir, limit=None,
+                                             marker=None,
+                                             columns_to_join=None,
+                                             use_slave=False):
+            call_info['get_by_filters'] += 1
             self.assertEqual(['system_metadata', 'info_cache'],
                              columns_to_join)
-            return instance_map[instance_uuid]
+            self.assertFalse(filters['deleted'])
+            return [instance_map[inst_uuid] for inst_uuid in filters['uuid']
+                    if inst_uuid in instance_map]
 
         # NOTE(comstud): Override the stub in setUp()
-        def fake_get_instance_nw_info(context, instance, use_slave=False):
+        def fake_get_instance_nw_info_for_instances(context, instances,
+                                                    use_slave=False):
             # Note that this exception gets caught in compute/manager
             # and is ignored.  However, the below increment of
             # 'get_nw_info' won't happen, and you'll get an assert
             # failure checking it below.
-            self.assertEqual(call_info['expected_instance']['uuid'],
-                             instance['uuid'])
+            self.assertEqual(
+                [inst['uuid'] for inst in call_info['expected_instances']],
+                [inst['uuid'] for inst in instances])
+            self.assertTrue(use_slave)
             call_info['get_nw_info'] += 1
+            return dict((inst['uuid'], 'fake-nw-info') for inst in instances)
 
         self.stubs.Set(db, 'instance_get_all_by_host',
                 fake_instance_get_all_by_host)
-        self.stubs.Set(db, 'instance_get_by_uuid',
-                fake_instance_get_by_uuid)
-        self.stubs.Set(self.compute, '_get_instance_nw_info',
-                fake_get_instance_nw_info)
+        self.stubs.Set(db, 'instance_get_all_by_filters',
+                fake_instance_get_all_by_filters)
+        self.stubs.Set(self.compute.network_api,
+                'get_instance_nw_info_for_instances',
+                fake_get_instance_nw_info_for_instances)
 
         # Make an instance appear to be still Building
         instances[0]['vm_state'] = vm_states.BUILDING
         # Make an instance appear to be Deleting
         instances[1]['task_state'] = task_states.DELETING
-        # '0', '1' should be skipped..
-        call_info['expected_instance'] = instances[2]
+        # '0', '1' should be skipped, '7' has no cache so it goes first..
+        call_info['expected_instances'] = [instances[7], instances[2]]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(0, call_info['get_by_uuid'])
+        self.assertEqual(1, call_info['get_by_filters'])
         self.assertEqual(1, call_info['get_nw_info'])
-
-        call_info['expected_instance'] = instances[3]
-        self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(1, call_info['get_by_uuid'])
-        self.assertEqual(2, call_info['get_nw_info'])
+        self.assertEqual(['fake-uuid-%s' % x for x in xrange(3, 7)],
+                         self.compute._instance_uuids_to_heal)
 
         # Make an instance switch hosts
-        instances[4]['host'] = 'not-me'
+        instances[3]['host'] = 'not-me'
         # Make an instance disappear
-        instance_map.pop(instances[5]['uuid'])
-        # Make an instance switch to be Deleting
-        instances[6]['task_state'] = task_states.DELETING
-        # '4', '5', and '6' should be skipped..
-        call_info['expected_instance'] = instances[7]
+        instance_map.pop(instances[4]['uuid'])
+        # '3' and '4' should be skipped and the batch filled up again..
+        call_info['expected_instances'] = [instances[5], instances[6]]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(4, call_info['get_by_uuid'])
-        self.assertEqual(3, call_info['get_nw_info'])
+        self.assertEqual(3, call_info['get_by_filters'])
+        self.assertEqual(2, call_info['get_nw_info'])
         # Should be no more left.
         self.assertEqual(0, len(self.compute._instance_uuids_to_heal))
 
@@ -6013,9 +6058,30 @@ class ComputeTestCase(BaseTestCase):
         # Should have called the list once more
         self.assertEqual(2, call_info['get_all_by_host'])
         # Stays the same because we remove invalid entries from the list
-        self.assertEqual(4, call_info['get_by_uuid'])
+        self.assertEqual(3, call_info['get_by_filters'])
         # Stays the same because we didn't find anything to process
-        self.assertEqual(3, call_info['get_nw_info'])
+        self.assertEqual(2, call_info['get_nw_info'])
+
+    def test_heal_instance_info_cache_network_error(self):
+        self.flags(heal_instance_info_cache_interval=-1)
+        ctxt = context.get_admin_context()
+        inst = fake_instance.fake_db_instance(uuid='fake-uuid',
+                                              host=CONF.host)
+        self.stubs.Set(db, 'instance_get_all_by_host',
+                       lambda *a, **k: [inst])
+        self.stubs.Set(db, 'instance_get_all_by_filters',
+                       lambda *a, **k: [inst])
+
+        def fake_get_instance_nw_info_for_instances(*args, **kwargs):
+            raise test.TestingException()
+
+        self.stubs.Set(self.compute.network_api,
+                'get_instance_nw_info_for_instances',
+                fake_get_instance_nw_info_for_instances)
+
+        # The error is logged and does not escape the periodic task
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual([], self.compute._instance_uuids_to_heal)
 
     @mock.patch('nova.objects.instance.InstanceList.get_by_filters')
     @mock.patch('nova.compute.api.API.unrescue')
@@ -9222,6 +9288,9 @@ class ComputeAPITestCase(BaseTestCase):
 
         instance.refresh()
         self.assertEqual(instance['task_state'], task_states.MIGRATING)
+        action = db.action_get_by_request_id(self.context, instance_uuid,
+                                             self.context.request_id)
+        self.assertEqual(instance_actions.LIVE_MIGRATION, action['action'])
 
     def test_evacuate(self):
         instance = jsonutils.to_primitive(self._create_fake_instance(
@@ -16,10 +16,12 @@ import contextlib
 import time
 
 from eventlet import event as eventlet_event
+from eventlet import greenthread
 import mock
 import mox
 from oslo.config import cfg
 
+from nova.compute import manager
 from nova.compute import power_state
 from nova.compute import task_states
 from nova.compute import utils as compute_utils
@@ -28,6 +30,7 @@ from nova.conductor import rpcapi as conductor_rpcapi
 from nova import context
 from nova import db
 from nova import exception
+from nova.image import glance
 from nova.network import model as network_model
 from nova.objects import base as obj_base
 from nova.objects import block_device as block_device_obj
@@ -42,6 +45,7 @@ from nova.tests import fake_block_device
 from nova.tests import fake_instance
 from nova.tests.objects import test_instance_fault
 from nova.tests.objects import test_instance_info_cache
+from nova.virt import event as virtevent
 
 
 CONF = cfg.CONF
@@ -213,6 +217,37 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.mox.VerifyAll()
         self.mox.UnsetStubs()
 
+    def test_init_instances_concurrently(self):
+        self.flags(init_host_concurrency=2)
+        instances = [{'uuid': 'fake-uuid-%d' % x} for x in xrange(3)]
+        running = []
+        max_running = []
+
+        def fake_init_instance(context, instance):
+            running.append(instance)
+            max_running.append(len(running))
+            greenthread.sleep(0)
+            running.remove(instance)
+            if instance['uuid'] == 'fake-uuid-1':
+                raise test.TestingException()
+
+        with mock.patch.object(self.compute, '_init_instance',
+                               side_effect=fake_init_instance) as mock_init:
+            self.assertRaises(test.TestingException,
+                              self.compute._init_instances, self.context,
+                              instances)
+            # A failure does not stop the other instances
+            self.assertEqual(3, mock_init.call_count)
+        self.assertEqual(2, max(max_running))
+
+    def test_startup_timer(self):
+        with mock.patch('time.time', side_effect=[10, 11, 13.5]):
+            timer = manager.StartupTimer()
+            timer.end_phase('driver')
+            timer.end_phase('instances')
+        self.assertEqual(3.5, timer.total)
+        self.assertEqual('driver: 1.00s, instances: 2.50s', str(timer))
+
     @mock.patch('nova.objects.instance.InstanceList')
     def test_cleanup_host(self, mock_instance_list):
         # just testing whether the cleanup_host method
@@ -799,6 +834,173 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                 self._test_sync_to_stop(power_state.RUNNING, vs, ps,
                                         stop=False)
 
+    def _lifecycle_event(self, uuid, sequence, generation=1):
+        return virtevent.LifecycleEvent(uuid,
+                                        virtevent.EVENT_LIFECYCLE_STOPPED,
+                                        generation=generation,
+                                        sequence=sequence)
+
+    def test_lifecycle_event_tracker_detects_gaps(self):
+        tracker = self.compute.lifecycle_events
+        tracker.record_event(self._lifecycle_event('uuid1', 1))
+        tracker.start_full_sync(['uuid1'])
+        tracker.record_event(self._lifecycle_event('uuid1', 2))
+        self.assertFalse(tracker.full_sync_due(3600))
+        tracker.record_event(self._lifecycle_event('uuid1', 5))
+        self.assertTrue(tracker.full_sync_due(3600))
+        self.assertEqual(2, tracker.missed_events)
+        tracker.start_full_sync(['uuid1'])
+        tracker.record_event(self._lifecycle_event('uuid1', 6, generation=2))
+        self.assertTrue(tracker.full_sync_due(3600))
+
+    def test_lifecycle_event_tracker_ignores_unnumbered_events(self):
+        tracker = self.compute.lifecycle_events
+        tracker.start_full_sync([])
+        tracker.record_event(virtevent.LifecycleEvent(
+            'uuid1', virtevent.EVENT_LIFECYCLE_STOPPED))
+        self.assertFalse(tracker.full_sync_due(3600))
+        self.assertFalse(tracker.had_event_since('uuid1', 0))
+
+    def test_handle_events_records_failure(self):
+        event = self._lifecycle_event('uuid1', 1)
+        with mock.patch.object(self.compute, 'handle_lifecycle_event',
+                               side_effect=test.TestingException):
+            self.assertRaises(test.TestingException,
+                              self.compute.handle_events, event)
+        self.assertEqual(frozenset(['uuid1']),
+                         self.compute.lifecycle_events.failed_instances)
+
+    def test_handle_events_pending_task_left_to_sync(self):
+        tracker = self.compute.lifecycle_events
+        tracker.start_full_sync([])
+        instance = fake_instance.fake_instance_obj(
+            self.context, uuid='uuid1', host=self.compute.host,
+            vm_state=vm_states.ACTIVE, power_state=power_state.RUNNING,
+            task_state=task_states.REBOOTING)
+        with contextlib.nested(
+            mock.patch.object(instance_obj.Instance, 'get_by_uuid',
+                              return_value=instance),
+            mock.patch.object(instance, 'refresh'),
+            mock.patch.object(instance, 'save')
+        ) as (get_by_uuid, refresh, save):
+            self.compute.handle_events(self._lifecycle_event('uuid1', 1))
+        self.assertFalse(save.called)
+        # The stopped guest is still seen by the next power state sync
+        self.assertEqual(frozenset(['uuid1']), tracker.failed_instances)
+        self.assertFalse(tracker.had_event_since('uuid1', 0))
+
+    def _test_sync_power_states_from_events(self, full_sync):
+        self.flags(sync_power_state_from_events=True)
+        tracker = self.compute.lifecycle_events
+        tracker.record_event(self._lifecycle_event('uuid1', 1))
+        tracker.start_full_sync(['uuid1', 'uuid2', 'uuid3'])
+        tracker.record_failure('uuid2')
+        if full_sync:
+            # A gap in the sequence makes the next sync a full one
+            tracker.record_event(self._lifecycle_event('uuid1', 3))
+        instances = [fake_instance.fake_instance_obj(
+                         self.context, uuid=uuid, task_state=None)
+                     for uuid in ('uuid1', 'uuid2', 'uuid3')]
+        with contextlib.nested(
+            mock.patch.dict(self.compute.driver.capabilities,
+                            has_numbered_events=True),
+            mock.patch.object(instance_obj.InstanceList, 'get_by_host',
+                              return_value=instances),
+            mock.patch.object(self.compute.driver, 'get_info',
+                              return_value={'state': power_state.RUNNING}),
+            mock.patch.object(self.compute, '_sync_instance_power_state')
+        ) as (capabilities, get_by_host, get_info, sync):
+            self.compute._sync_power_states(self.context)
+        synced = [call[0][1].uuid for call in sync.call_args_list]
+        self.assertEqual(frozenset(), tracker.failed_instances)
+        self.assertFalse(tracker.full_sync_due(3600))
+        return synced
+
+    def test_sync_power_states_from_events_failed_only(self):
+        synced = self._test_sync_power_states_from_events(False)
+        self.assertEqual(['uuid2'], synced)
+
+    def test_sync_power_states_from_events_full_sync(self):
+        synced = self._test_sync_power_states_from_events(True)
+        # uuid1 had a recent event, so even a full sync can skip it
+        self.assertEqual(['uuid2', 'uuid3'], synced)
+
+    def test_sync_power_states_from_events_nothing_to_do(self):
+        self.flags(sync_power_state_from_events=True)
+        self.compute.lifecycle_events.start_full_sync([])
+        with contextlib.nested(
+            mock.patch.dict(self.compute.driver.capabilities,
+                            has_numbered_events=True),
+            mock.patch.object(instance_obj.InstanceList, 'get_by_host')
+        ) as (capabilities, get_by_host):
+            self.compute._sync_power_states(self.context)
+        self.assertFalse(get_by_host.called)
+
+    def test_complete_deletion_updates_resource_tracker(self):
+        instance = fake_instance.fake_instance_obj(
+            self.context, vm_state=vm_states.DELETED)
+        with contextlib.nested(
+            mock.patch.object(self.compute, '_notify_about_instance_usage'),
+            mock.patch.object(self.compute, '_update_resource_tracker')
+        ) as (notify, update_rt):
+            self.compute._complete_deletion(self.context, instance, [],
+                                            None, {})
+        update_rt.assert_called_once_with(self.context, instance)
+
+    def test_run_image_preseed_pass(self):
+        self.flags(auth_strategy='noauth', image_preseed_images=['9'],
+                   image_preseed_popular_count=2)
+        with contextlib.nested(
+            mock.patch.object(instance_obj.InstanceList,
+                              'get_popular_image_refs',
+                              return_value=['9', '3', '2', '1']),
+            mock.patch.object(self.compute.driver, 'preseed_image_cache')
+        ) as (get_popular, preseed):
+            self.compute._run_image_preseed_pass(self.context)
+        get_popular.assert_called_once_with(self.context, 3, use_slave=True)
+        preseed.assert_called_once_with(self.context, ['9', '3', '2'])
+
+    def test_run_image_preseed_pass_keystone_token(self):
+        self.flags(auth_strategy='keystone', image_preseed_popular_count=1,
+                   image_preseed_admin_username='preseed',
+                   image_preseed_admin_password='secret',
+                   image_preseed_admin_tenant_name='service',
+                   image_preseed_admin_auth_url='http://keystone/v2.0')
+        auth_ref = mock.Mock(user_id='user', project_id='project',
+                             role_names=['admin'], auth_token='token')
+        with contextlib.nested(
+            mock.patch.object(manager.keystone_client, 'Client',
+                              return_value=mock.Mock(auth_ref=auth_ref)),
+            mock.patch.object(instance_obj.InstanceList,
+                              'get_popular_image_refs', return_value=['1']),
+            mock.patch.object(self.compute.driver, 'preseed_image_cache')
+        ) as (keystone, get_popular, preseed):
+            self.compute._run_image_preseed_pass(self.context)
+        keystone.assert_called_once_with(
+            username='preseed', password='secret', tenant_name='service',
+            auth_url='http://keystone/v2.0')
+        preseed_context, image_ids = preseed.call_args[0]
+        self.assertEqual(['1'], image_ids)
+        self.assertEqual('user', preseed_context.user_id)
+        self.assertEqual('project', preseed_context.project_id)
+
+        # The glance client downloads with the keystone token
+        with mock.patch.object(glance.glanceclient, 'Client') as client:
+            glance._create_glance_client(preseed_context, 'glance', 9292,
+                                         False)
+        self.assertEqual('token', client.call_args[1]['token'])
+
+    def test_run_image_preseed_pass_keystone_without_credentials(self):
+        self.flags(auth_strategy='keystone')
+        with contextlib.nested(
+            mock.patch.object(instance_obj.InstanceList,
+                              'get_popular_image_refs'),
+            mock.patch.object(self.compute.driver, 'preseed_image_cache')
+        ) as (get_popular, preseed):
+            self.compute._run_image_preseed_pass(self.context)
+        self.assertFalse(get_popular.called)
+        self.assertFalse(preseed.called)
+
     def test_run_pending_deletes(self):
         self.flags(instance_delete_interval=10)
 
@@ -1064,6 +1266,21 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                 self._test_check_can_live_migrate_destination,
                 do_raise=True)
 
+    def test_live_migration_records_event(self):
+        instance = fake_instance.fake_instance_obj(self.context)
+        with contextlib.nested(
+            mock.patch.object(compute_utils, 'EventReporter'),
+            mock.patch.object(self.compute.compute_rpcapi,
+                              'pre_live_migration'),
+            mock.patch.object(self.compute.driver, 'live_migration')
+        ) as (event_reporter, pre_live_migration, live_migration):
+            self.compute.live_migration(self.context, 'dest', instance,
+                                        False, None)
+        event_reporter.assert_called_once_with(
+            self.context, self.compute.conductor_api,
+            'compute_live_migration', instance.uuid)
+        self.assertTrue(live_migration.called)
+
     def test_prepare_for_instance_event(self):
         inst_obj = instance_obj.Instance(uuid='foo')
         result = self.compute.instance_events.prepare_for_instance_event(
@@ -1115,15 +1332,18 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             external_event_obj.InstanceExternalEvent(name='network-changed',
                                                      instance_uuid='uuid1'),
             external_event_obj.InstanceExternalEvent(name='foo',
-                                                     instance_uuid='uuid2')]
+                                                     instance_uuid='uuid2'),
+            external_event_obj.InstanceExternalEvent(name='network-changed',
+                                                     instance_uuid='uuid1')]
 
-        @mock.patch.object(self.compute.network_api, 'get_instance_nw_info')
+        @mock.patch.object(self.compute.network_api,
+                           'get_instance_nw_info_for_instances')
         @mock.patch.object(self.compute, '_process_instance_event')
-        def do_test(_process_instance_event, get_instance_nw_info):
+        def do_test(_process_instance_event, get_nw_info_for_instances):
             self.compute.external_instance_event(self.context,
                                                  instances, events)
-            get_instance_nw_info.assert_called_once_with(self.context,
-                                                         instances[0])
+            get_nw_info_for_instances.assert_called_once_with(
+                self.context, [instances[0]])
             _process_instance_event.assert_called_once_with(instances[1],
                                                             events[1])
         do_test()
@@ -451,6 +451,7 @@ class BaseTrackerTestCase(BaseTestCase):
     def _fake_compute_node_update(self, ctx, compute_node_id, values,
             prune_stats=False):
         self.updated = True
+        self.updated_values = dict(values)
         values['stats'] = [{"key": "num_instances", "value": "1"}]
 
         self.compute.update(values)
@@ -661,6 +662,30 @@ class InstanceClaimTestCase(BaseTrackerTestCase):
         self.assertEqual(0, self.compute["local_gb_used"])
         self.assertEqual(FAKE_VIRT_LOCAL_GB, self.compute["free_disk_gb"])
 
+    def test_claim_and_release(self):
+        flavor = self._fake_flavor_create(
+                memory_mb=3, root_gb=2, ephemeral_gb=0, vcpus=1)
+        instance = self._fake_instance(flavor=flavor)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        self.assertEqual(3 + FAKE_VIRT_MEMORY_OVERHEAD,
+                         self.compute["memory_mb_used"])
+        self.assertEqual(1, self.compute["vcpus_used"])
+
+        # the instance moved to another host
+        instance['host'] = 'otherhost'
+        self.tracker.release_instance(self.context, instance)
+
+        self.assertNotIn(instance['uuid'], self.tracker.tracked_instances)
+        self.assertEqual(0, self.compute["memory_mb_used"])
+        self.assertEqual(FAKE_VIRT_MEMORY_MB, self.compute["free_ram_mb"])
+        self.assertEqual(0, self.compute["local_gb_used"])
+        self.assertEqual(0, self.compute["vcpus_used"])
+
+    def test_release_untracked_instance(self):
+        instance = self._fake_instance()
+        self.tracker.release_instance(self.context, instance)
+        self.assertEqual(0, self.compute["memory_mb_used"])
+
     def test_instance_claim_with_oversubscription(self):
         memory_mb = FAKE_VIRT_MEMORY_MB * 2
         root_gb = ephemeral_gb = FAKE_VIRT_LOCAL_GB
@@ -1044,6 +1069,51 @@ class NoInstanceTypesInSysMetadata(ResizeClaimTestCase):
         self.instance = self._fake_instance(stash=False)
 
 
+class IncrementalUpdateTestCase(BaseTrackerTestCase):
+
+    def test_update_only_changed_fields(self):
+        self.tracker.compute_node['memory_mb_used'] = 3
+        self.tracker._update(self.context, self.tracker.compute_node)
+        self.assertEqual({'memory_mb_used': 3}, self.updated_values)
+
+    def test_update_skipped_without_changes(self):
+        self.updated = False
+        self.tracker._update(self.context, self.tracker.compute_node)
+        self.assertFalse(self.updated)
+
+    def test_forced_update_without_changes(self):
+        self.updated = False
+        self.tracker._update(self.context, self.tracker.compute_node,
+                             force=True)
+        self.assertTrue(self.updated)
+        self.assertEqual({}, self.updated_values)
+
+    def test_audit_interval(self):
+        self.flags(resource_audit_interval=3600)
+        instance = self._fake_instance(memory_mb=3, root_gb=2,
+                                       ephemeral_gb=0)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        self.tracker.driver.memory_mb_used = 3
+
+        with mock.patch.object(self.tracker.conductor_api,
+                'migration_get_in_progress_by_host_and_node') as migrations:
+            self.tracker.update_available_resource(self.context)
+            self.assertFalse(migrations.called)
+
+            # usage from the claim is carried over, not taken from the
+            # hypervisor
+            self._assert(3 + FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+            self._assert(2, 'local_gb_used')
+            self._assert(FAKE_VIRT_MEMORY_MB - 3 - FAKE_VIRT_MEMORY_OVERHEAD,
+                         'free_ram_mb')
+
+            self.tracker.last_audit -= 3600
+            migrations.return_value = []
+            self.tracker.update_available_resource(self.context)
+            self.assertTrue(migrations.called)
+            self._assert(3 + FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+
+
 class OrphanTestCase(BaseTrackerTestCase):
     def _driver(self):
         class OrphanVirtDriver(FakeVirtDriver):
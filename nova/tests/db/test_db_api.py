@@ -1799,6 +1799,18 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         results = db.instance_get_all_hung_in_rebooting(self.ctxt, 10)
         self.assertEqual([], results)
 
+    def test_instance_get_popular_image_refs(self):
+        for image_ref in ['a', 'b', 'b', 'c', 'c', 'c', '']:
+            self.create_instance_with_args(image_ref=image_ref)
+        deleted = self.create_instance_with_args(image_ref='a')
+        self.create_instance_with_args(image_ref='a')
+        db.instance_destroy(self.ctxt, deleted['uuid'])
+
+        self.assertEqual(['c', 'a', 'b'],
+                         db.instance_get_popular_image_refs(self.ctxt, 5))
+        self.assertEqual(['c', 'a'],
+                         db.instance_get_popular_image_refs(self.ctxt, 2))
+
     def test_instance_update_with_expected_vm_state(self):
         instance = self.create_instance_with_args(vm_state='foo')
         db.instance_update(self.ctxt, instance['uuid'], {'host': 'h1',
@@ -3413,6 +3425,74 @@ class FixedIPTestCase(BaseInstanceTypeTestCase):
         fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
         self.assertEqual(fixed_ip['instance_uuid'], instance_uuid)
 
+    def test_fixed_ip_associate_pool_sets_network_and_host(self):
+        instance_uuid = self._create_instance()
+        network = db.network_create_safe(self.ctxt, {})
+
+        address = self.create_fixed_ip()
+        db.fixed_ip_associate_pool(self.ctxt, network['id'], instance_uuid,
+                                   host='fake_host')
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(fixed_ip['instance_uuid'], instance_uuid)
+        self.assertEqual(fixed_ip['network_id'], network['id'])
+        self.assertEqual(fixed_ip['host'], 'fake_host')
+
+    def test_fixed_ip_associate_pool_retries_when_claimed(self):
+        instance_uuid = self._create_instance()
+        other_instance_uuid = self._create_instance()
+        network = db.network_create_safe(self.ctxt, {})
+        addresses = [self.create_fixed_ip(address='192.168.0.%d' % i,
+                                          network_id=network['id'])
+                     for i in (1, 2)]
+        claim = sqlalchemy_api._claim_fixed_ip
+        claimed = []
+
+        def fake_claim(context, fixed_ip_id, *args):
+            if not claimed:
+                # another allocation wins the race for the first candidate
+                fixed_ip = db.fixed_ip_get(context, fixed_ip_id)
+                db.fixed_ip_associate(context, fixed_ip['address'],
+                                      other_instance_uuid,
+                                      network_id=network['id'])
+            claimed.append(claim(context, fixed_ip_id, *args))
+            return claimed[-1]
+
+        self.stubs.Set(sqlalchemy_api, '_claim_fixed_ip', fake_claim)
+        fixed_ip = db.fixed_ip_associate_pool(self.ctxt, network['id'],
+                                              instance_uuid)
+        self.assertEqual([False, True], claimed)
+        self.assertEqual(instance_uuid, fixed_ip['instance_uuid'])
+        owners = [db.fixed_ip_get_by_address(self.ctxt, address)
+                  ['instance_uuid'] for address in addresses]
+        self.assertEqual(set([instance_uuid, other_instance_uuid]),
+                         set(owners))
+
+    def test_fixed_ip_associate_pool_cache(self):
+        self.flags(fixed_ip_allocation_cache=True)
+        self.stubs.Set(sqlalchemy_api, '_free_fixed_ips', {})
+        network = db.network_create_safe(self.ctxt, {})
+        addresses = set(self.create_fixed_ip(address='192.168.0.%d' % i,
+                                             network_id=network['id'])
+                        for i in range(1, 4))
+        reads = []
+        query = sqlalchemy_api._free_fixed_ip_query
+
+        def fake_query(context, network_id, session):
+            reads.append(network_id)
+            return query(context, network_id, session)
+
+        self.stubs.Set(sqlalchemy_api, '_free_fixed_ip_query', fake_query)
+        allocated = set()
+        for i in range(3):
+            fixed_ip = db.fixed_ip_associate_pool(self.ctxt, network['id'],
+                                                  self._create_instance())
+            allocated.add(fixed_ip['address'])
+        self.assertEqual(addresses, allocated)
+        self.assertEqual([network['id']], reads)
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool, self.ctxt,
+                          network['id'], self._create_instance())
+
     def test_fixed_ip_create_same_address(self):
         address = '192.168.1.5'
         params = {'address': address}
@@ -4625,6 +4705,28 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+
+        bmds_values = [{'instance_uuid': uuid1,
+                        'device_name': 'first'},
+                       {'instance_uuid': uuid2,
+                        'device_name': 'second'},
+                       {'instance_uuid': uuid3,
+                        'device_name': 'third'}]
+
+        for bdm in bmds_values:
+            self._create_bdm(bdm)
+
+        bmd = db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, [uuid1, uuid2])
+        self.assertEqual(['first', 'second'],
+                         sorted(b['device_name'] for b in bmd))
+        self.assertEqual([], db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, []))
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
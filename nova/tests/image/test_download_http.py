@@ -0,0 +1,229 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import cStringIO
+import hashlib
+import httplib
+import json
+import os
+
+from eventlet import greenthread
+import mock
+import six.moves.urllib.parse as urlparse
+
+from nova import exception
+from nova.image.download import http
+from nova.openstack.common import units
+from nova import test
+from nova import utils
+
+
+class FakeResponse(object):
+    def __init__(self, status, body='', headers=None):
+        self.status = status
+        self._body = cStringIO.StringIO(body)
+        self._headers = headers or {}
+
+    def getheader(self, name, default=None):
+        return self._headers.get(name, default)
+
+    def read(self, size=-1):
+        return self._body.read(size)
+
+
+class FakeServer(object):
+    """Serves one image, optionally with support for byte ranges."""
+
+    def __init__(self, data, accept_ranges=True):
+        self.data = data
+        self.accept_ranges = accept_ranges
+        self.requests = []
+
+    def connection(self, netloc):
+        server = self
+
+        class FakeConnection(object):
+            def request(self, method, path, headers=None):
+                server.requests.append((method, headers.get('Range')))
+                self.response = server.respond(method, headers)
+
+            def getresponse(self):
+                return self.response
+
+            def close(self):
+                pass
+
+        return FakeConnection()
+
+    def respond(self, method, headers):
+        if method == 'HEAD':
+            resp_headers = {'content-length': str(len(self.data))}
+            if self.accept_ranges:
+                resp_headers['accept-ranges'] = 'bytes'
+            return FakeResponse(httplib.OK, headers=resp_headers)
+        byte_range = headers.get('Range')
+        if byte_range and self.accept_ranges:
+            start, end = byte_range[len('bytes='):].split('-')
+            return FakeResponse(httplib.PARTIAL_CONTENT,
+                                self.data[int(start):int(end) + 1])
+        return FakeResponse(httplib.OK, self.data)
+
+
+class HttpTransferTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HttpTransferTestCase, self).setUp()
+        self.flags(range_size_mb=1, min_ranged_size_mb=1,
+                   group='image_http_url')
+        # 2.5MB, so three ranges of 1MB
+        self.data = 'abcdefghij' * (units.Mi / 4)
+        self.checksum = hashlib.md5(self.data).hexdigest()
+        self.url = urlparse.urlparse('http://example.com/images/fake')
+        self.transfer = http.get_download_handler()
+
+    def _download(self, server, dst_path, checksum=None):
+        with mock.patch.object(httplib, 'HTTPConnection',
+                               side_effect=server.connection):
+            self.transfer.download(None, self.url, dst_path, {},
+                                   image_id='fake',
+                                   checksum=checksum or self.checksum)
+
+    def _check_file(self, dst_path):
+        with open(dst_path) as f:
+            self.assertEqual(self.data, f.read())
+        self.assertFalse(os.path.exists(dst_path + '.part'))
+        self.assertFalse(os.path.exists(dst_path + '.progress'))
+
+    def test_download_ranges(self):
+        server = FakeServer(self.data)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            self._download(server, dst_path)
+            self._check_file(dst_path)
+        self.assertEqual([('GET', 'bytes=0-1048575'),
+                          ('GET', 'bytes=1048576-2097151'),
+                          ('GET', 'bytes=2097152-2621439'),
+                          ('HEAD', None)],
+                         sorted(server.requests))
+
+    def test_download_stream_without_ranges(self):
+        server = FakeServer(self.data, accept_ranges=False)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            self._download(server, dst_path)
+            self._check_file(dst_path)
+        self.assertEqual([('HEAD', None), ('GET', None)], server.requests)
+
+    def test_download_stream_small_image(self):
+        self.flags(min_ranged_size_mb=10, group='image_http_url')
+        server = FakeServer(self.data)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            self._download(server, dst_path)
+            self._check_file(dst_path)
+        self.assertEqual([('HEAD', None), ('GET', None)], server.requests)
+
+    def test_download_resumes(self):
+        server = FakeServer(self.data)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            # The first range was downloaded before a restart
+            with open(dst_path + '.part', 'wb') as f:
+                f.write(self.data[:units.Mi])
+                f.truncate(len(self.data))
+            with open(dst_path + '.progress', 'w') as f:
+                json.dump({'url': self.url.geturl(), 'size': len(self.data),
+                           'done': [0]}, f)
+
+            self._download(server, dst_path)
+            self._check_file(dst_path)
+        self.assertEqual([('GET', 'bytes=1048576-2097151'),
+                          ('GET', 'bytes=2097152-2621439'),
+                          ('HEAD', None)],
+                         sorted(server.requests))
+
+    def test_download_restarts_other_image(self):
+        server = FakeServer(self.data)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            with open(dst_path + '.part', 'wb') as f:
+                f.truncate(len(self.data))
+            with open(dst_path + '.progress', 'w') as f:
+                json.dump({'url': 'http://example.com/other',
+                           'size': len(self.data), 'done': [0]}, f)
+
+            self._download(server, dst_path)
+            self._check_file(dst_path)
+        self.assertEqual(4, len(server.requests))
+
+    def test_download_ranges_checksum_mismatch(self):
+        server = FakeServer(self.data)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            self.assertRaises(exception.ImageChecksumMismatch,
+                              self._download, server, dst_path,
+                              checksum='bogus')
+            self.assertEqual([], os.listdir(tmpdir))
+
+    def test_download_stream_checksum_mismatch(self):
+        server = FakeServer(self.data, accept_ranges=False)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            self.assertRaises(exception.ImageChecksumMismatch,
+                              self._download, server, dst_path,
+                              checksum='bogus')
+            self.assertEqual([], os.listdir(tmpdir))
+
+    def test_download_range_error_keeps_progress(self):
+        server = FakeServer(self.data)
+        respond = server.respond
+
+        def fake_respond(method, headers):
+            if headers.get('Range') == 'bytes=1048576-2097151':
+                return FakeResponse(httplib.SERVICE_UNAVAILABLE)
+            return respond(method, headers)
+
+        server.respond = fake_respond
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            self.assertRaises(exception.ImageDownloadModuleError,
+                              self._download, server, dst_path)
+            with open(dst_path + '.progress') as f:
+                progress = json.load(f)
+            self.assertIn(0, progress['done'])
+            self.assertNotIn(units.Mi, progress['done'])
+
+    def test_download_resumes_after_range_error(self):
+        server = FakeServer(self.data)
+        respond = server.respond
+
+        def fake_respond(method, headers):
+            if headers.get('Range') == 'bytes=0-1048575':
+                # Fail only once the other ranges are in flight
+                greenthread.sleep(0)
+                return FakeResponse(httplib.SERVICE_UNAVAILABLE)
+            return respond(method, headers)
+
+        server.respond = fake_respond
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            self.assertRaises(exception.ImageDownloadModuleError,
+                              self._download, server, dst_path)
+            with open(dst_path + '.progress') as f:
+                progress = json.load(f)
+            self.assertEqual([units.Mi, 2 * units.Mi], progress['done'])
+
+            server = FakeServer(self.data)
+            self._download(server, dst_path)
+            self._check_file(dst_path)
+        self.assertEqual([('GET', 'bytes=0-1048575'), ('HEAD', None)],
+                         sorted(server.requests))
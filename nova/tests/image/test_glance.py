@@ -14,8 +14,10 @@
 #    under the License.
 
 
+import cStringIO
 import datetime
 import filecmp
+import hashlib
 import os
 import random
 import tempfile
@@ -32,6 +34,7 @@ from oslo.config import cfg
 
 from nova import context
 from nova import exception
+from nova.image.download import base as xfer_base
 from nova.image import glance
 from nova import test
 from nova.tests.api.openstack import fakes
@@ -389,6 +392,53 @@ class TestGlanceImageService(test.NoDBTestCase):
 
         self.assertTrue(client.data_called)
 
+    def _checksum_client(self, image_data, checksum, size=None):
+        class MyGlanceStubClient(glance_stubs.StubGlanceClient):
+            """A client that returns chunks of image data."""
+            def get(self, image_id):
+                return type('GlanceImageMeta', (object,),
+                            {'checksum': checksum, 'size': size})
+
+            def data(self, image_id):
+                return [image_data[i:i + 10]
+                        for i in range(0, len(image_data), 10)]
+
+        return MyGlanceStubClient()
+
+    def test_download_verifies_checksum(self):
+        image_data = 'x' * 100
+        client = self._checksum_client(image_data,
+                                       hashlib.md5(image_data).hexdigest())
+        service = self._create_image_service(client)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            service.download(self.context, 1, dst_path=dst_path)
+            with open(dst_path) as f:
+                self.assertEqual(image_data, f.read())
+
+    def test_download_checksum_mismatch(self):
+        client = self._checksum_client('x' * 100, 'bogus')
+        service = self._create_image_service(client)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            self.assertRaises(exception.ImageChecksumMismatch,
+                              service.download, self.context, 1,
+                              dst_path=dst_path)
+            # The corrupt image is not left behind
+            self.assertFalse(os.path.exists(dst_path))
+
+    def test_download_preallocates(self):
+        self.flags(glance_download_preallocate=True)
+        image_data = 'x' * 100
+        client = self._checksum_client(image_data, None, size=100)
+        service = self._create_image_service(client)
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            with mock.patch.object(utils, 'execute') as mock_execute:
+                service.download(self.context, 1, dst_path=dst_path)
+            mock_execute.assert_called_once_with('fallocate', '-n', '-l',
+                                                 100, dst_path)
+
     def test_client_forbidden_converts_to_imagenotauthed(self):
         class MyGlanceStubClient(glance_stubs.StubGlanceClient):
             """A client that raises a Forbidden exception."""
@@ -1199,3 +1249,23 @@ class TestUpdateGlanceImage(test.NoDBTestCase):
         self.mox.ReplayAll()
 
         consumer.start()
+
+
+class TestImageWriter(test.NoDBTestCase):
+
+    def test_write_aligned_blocks(self):
+        data = mock.Mock()
+        writer = xfer_base.ImageWriter('fake-id', data, 5000)
+        # Rounded up to a multiple of the block size
+        self.assertEqual(8192, writer.buffer_size)
+        for i in range(5):
+            writer.write('x' * 3000)
+        writer.close()
+        self.assertEqual([mock.call('x' * 8192), mock.call('x' * 6808)],
+                         data.write.call_args_list)
+
+    def test_checksum_mismatch(self):
+        writer = xfer_base.ImageWriter('fake-id', cStringIO.StringIO(), 4096,
+                                       checksum='bogus')
+        writer.write('data')
+        self.assertRaises(exception.ImageChecksumMismatch, writer.close)
@@ -340,6 +340,21 @@ class ApiTestCase(test.TestCase):
                                                        'fake-addr')
         self.assertIsInstance(fip, fixed_ip_obj.FixedIP)
 
+    def test_get_instance_nw_info_for_instances(self):
+        instances = [{'uuid': 'fake-uuid-1'}, {'uuid': 'fake-uuid-2'}]
+
+        def fake_get_instance_nw_info(context, instance, use_slave=False):
+            self.assertTrue(use_slave)
+            if instance['uuid'] == 'fake-uuid-1':
+                raise test.TestingException()
+            return 'fake-nw-info'
+
+        with mock.patch.object(self.network_api, 'get_instance_nw_info',
+                               side_effect=fake_get_instance_nw_info):
+            nw_infos = self.network_api.get_instance_nw_info_for_instances(
+                self.context, instances, use_slave=True)
+        self.assertEqual({'fake-uuid-2': 'fake-nw-info'}, nw_infos)
+
 
 @mock.patch('nova.network.api.API')
 @mock.patch('nova.db.instance_info_cache_update')
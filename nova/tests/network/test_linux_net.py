@@ -18,6 +18,7 @@ import contextlib
 import datetime
 import os
 
+from eventlet import greenthread
 import mock
 import mox
 from oslo.config import cfg
@@ -28,6 +29,7 @@ from nova import exception
 from nova.network import driver
 from nova.network import linux_net
 from nova.objects import fixed_ip as fixed_ip_obj
+from nova.objects import virtual_interface as vif_obj
 from nova.openstack.common import fileutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
@@ -269,6 +271,8 @@ class LinuxNetworkTestCase(test.NoDBTestCase):
         self.stubs.Set(db, 'virtual_interface_get_by_instance', get_vifs)
         self.stubs.Set(db, 'instance_get', get_instance)
         self.stubs.Set(db, 'network_get_associated_fixed_ips', get_associated)
+        self.stubs.Set(linux_net, '_dhcp_hosts', {})
+        self.stubs.Set(linux_net, '_pending_dhcp_restarts', {})
 
     def _test_add_snat_rule(self, expected):
         def verify_add_rule(chain, rule):
@@ -338,6 +342,135 @@ class LinuxNetworkTestCase(test.NoDBTestCase):
 
         self.driver.update_dhcp(self.context, "eth0", networks[0])
 
+    def _stub_update_dhcp(self):
+        self.writes = []
+        self.restarts = []
+        self.host_lines = []
+
+        def fake_write_to_file(path, data, mode='w'):
+            self.writes.append((data, mode))
+
+        self.stubs.Set(linux_net, 'write_to_file', fake_write_to_file)
+        self.stubs.Set(linux_net, '_get_dhcp_fixed_ips',
+                       lambda context, network_ref: None)
+        self.stubs.Set(linux_net, '_dhcp_host_lines',
+                       lambda fixedips: self.host_lines)
+        self.stubs.Set(linux_net, 'restart_dhcp',
+                       lambda context, dev, network_ref:
+                           self.restarts.append(dev))
+        self.stubs.Set(os.path, 'exists', lambda path: True)
+        self.stubs.Set(linux_net, '_dnsmasq_running', lambda dev: True)
+
+    def test_update_dhcp_writes_changed_hosts(self):
+        self._stub_update_dhcp()
+
+        self.host_lines = ['mac0,host0']
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertEqual([('mac0,host0', 'w')], self.writes)
+        self.assertEqual(['eth0'], self.restarts)
+
+        # new hosts are appended
+        self.host_lines = ['mac1,host1', 'mac0,host0', 'mac2,host2']
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertEqual(('\nmac1,host1\nmac2,host2', 'a'), self.writes[-1])
+        self.assertEqual(['eth0', 'eth0'], self.restarts)
+
+        # nothing changed, nothing written or reloaded
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertEqual(2, len(self.writes))
+        self.assertEqual(2, len(self.restarts))
+
+        # removed hosts make the file be rewritten
+        self.host_lines = ['mac2,host2', 'mac1,host1']
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertEqual(('mac1,host1\nmac2,host2', 'w'), self.writes[-1])
+        self.assertEqual(3, len(self.restarts))
+
+    def test_update_dhcp_restarts_dead_dnsmasq(self):
+        dnsmasq_running = linux_net._dnsmasq_running
+        self._stub_update_dhcp()
+        self.host_lines = ['mac0,host0']
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertEqual(1, len(self.writes))
+        self.assertEqual(['eth0'], self.restarts)
+
+        # the hosts are unchanged, but the pid file is left by a dnsmasq
+        # which died
+        self.stubs.Set(linux_net, '_dnsmasq_running', dnsmasq_running)
+        self.stubs.Set(linux_net, '_dnsmasq_pid_for', lambda dev: 12345)
+        with mock.patch.object(linux_net, '_execute',
+                               return_value=('', '')) as execute:
+            self.driver.update_dhcp(self.context, 'eth0', networks[0])
+            execute.assert_called_once_with('cat', '/proc/12345/cmdline',
+                                            check_exit_code=False)
+        self.assertEqual(1, len(self.writes))
+        self.assertEqual(['eth0', 'eth0'], self.restarts)
+
+    def test_update_dhcp_delays_reload_for_new_hosts(self):
+        self.flags(dhcp_reload_delay=2)
+        self._stub_update_dhcp()
+        spawned = []
+
+        class FakeThread(object):
+            cancelled = False
+
+            def cancel(self):
+                self.cancelled = True
+
+        def fake_spawn_after(seconds, func, *args):
+            self.assertEqual(2, seconds)
+            spawned.append((func, args, FakeThread()))
+            return spawned[-1][2]
+
+        self.stubs.Set(greenthread, 'spawn_after', fake_spawn_after)
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertEqual(['eth0'], self.restarts)
+
+        self.host_lines = ['mac0,host0']
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.host_lines = ['mac0,host0', 'mac1,host1']
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertEqual(1, len(spawned))
+        self.assertEqual(['eth0'], self.restarts)
+        func, args, _thread = spawned[0]
+        func(*args)
+        self.assertEqual(['eth0', 'eth0'], self.restarts)
+
+        # a removal reloads right away and cancels the pending reload
+        self.host_lines = ['mac0,host0', 'mac1,host1', 'mac2,host2']
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.host_lines = ['mac0,host0']
+        self.driver.update_dhcp(self.context, 'eth0', networks[0])
+        self.assertTrue(spawned[1][2].cancelled)
+        self.assertEqual(['eth0', 'eth0', 'eth0'], self.restarts)
+        self.assertEqual({}, linux_net._pending_dhcp_restarts)
+
+    def test_dhcp_opts_lines_remember_default_gateway_vifs(self):
+        fixedips = fixed_ip_obj.FixedIPList.get_by_network(self.context,
+                                                           networks[0])
+        default_gw_vifs = {}
+        with mock.patch.object(
+                vif_obj.VirtualInterfaceList, 'get_by_instance_uuid',
+                side_effect=vif_obj.VirtualInterfaceList.get_by_instance_uuid
+                ) as get_vifs:
+            lines = linux_net._dhcp_opts_lines(self.context, fixedips,
+                                               default_gw_vifs)
+            self.assertEqual(['NW-3,3', 'NW-4,3'], lines)
+            self.assertEqual(2, get_vifs.call_count)
+
+            lines = linux_net._dhcp_opts_lines(self.context, fixedips,
+                                               default_gw_vifs)
+            self.assertEqual(['NW-3,3', 'NW-4,3'], lines)
+            self.assertEqual(2, get_vifs.call_count)
+
+            # an instance whose interfaces on the network changed is
+            # looked up again
+            lines = linux_net._dhcp_opts_lines(self.context, fixedips[:2],
+                                               default_gw_vifs)
+            self.assertEqual(['NW-3,3'], lines)
+            self.assertEqual(3, get_vifs.call_count)
+            self.assertEqual(2, len(default_gw_vifs))
+
     def test_get_dhcp_hosts_for_nw00(self):
         self.flags(use_single_default_gateway=True)
 
@@ -921,6 +1054,62 @@ class LinuxNetworkTestCase(test.NoDBTestCase):
         dup_forward_rules = len(linux_net.iptables_manager.ipv4['nat'].rules)
         self.assertEqual(two_forward_rules, dup_forward_rules)
 
+    def test_ensure_floating_forwards_applies_once(self):
+        manager = linux_net.IptablesManager()
+        self.stubs.Set(linux_net, 'iptables_manager', manager)
+        self.mox.StubOutWithMock(manager, 'apply')
+        self.mox.StubOutWithMock(linux_net, 'ensure_ebtables_rules')
+        manager.apply()
+        linux_net.ensure_ebtables_rules(
+            *linux_net.floating_ebtables_rules('10.0.0.3', {
+                'bridge': 'br100', 'cidr': '10.0.0.0/24'}))
+        self.mox.ReplayAll()
+
+        net = {'bridge': 'br100', 'cidr': '10.0.0.0/24'}
+        nat = manager.ipv4['nat']
+        nat.add_rule('PREROUTING', '-d 10.10.10.10 -j DNAT --to 10.0.0.1')
+        nat.add_rule('PREROUTING', '-d 10.10.10.100 -j DNAT --to 10.0.0.9')
+        linux_net.ensure_floating_forwards([
+            ('10.10.10.10', '10.0.0.3', 'eth0', net),
+            ('10.10.10.11', '10.0.0.10', 'br100', net)])
+
+        rules = [(rule.chain, rule.rule) for rule in nat.rules]
+        self.assertNotIn(
+            ('PREROUTING', '-d 10.10.10.10 -j DNAT --to 10.0.0.1'), rules)
+        self.assertIn(('PREROUTING', '-d 10.10.10.100 -j DNAT --to 10.0.0.9'),
+                      rules)
+        for floating_ip, fixed_ip, device in (
+                ('10.10.10.10', '10.0.0.3', 'eth0'),
+                ('10.10.10.11', '10.0.0.10', 'br100')):
+            for rule in linux_net.floating_forward_rules(floating_ip,
+                                                         fixed_ip, device):
+                self.assertIn(rule, rules)
+
+    def test_bind_floating_ips(self):
+        self.flags(send_arp_for_ha=False)
+        self.mox.StubOutWithMock(linux_net, '_execute')
+        linux_net._execute('ip', '-force', '-batch', '-',
+                           process_input='addr add 10.10.10.10/32 dev eth0\n'
+                                         'addr add 10.10.10.11/32 dev eth1\n',
+                           run_as_root=True, check_exit_code=[0, 1]).\
+            AndReturn(('', 'RTNETLINK answers: File exists\n'
+                           'Command failed -:2\n'))
+        self.mox.ReplayAll()
+        linux_net.bind_floating_ips([('10.10.10.10', 'eth0'),
+                                     ('10.10.10.11', 'eth1')])
+
+    def test_bind_floating_ips_missing_device(self):
+        self.mox.StubOutWithMock(linux_net, '_execute')
+        linux_net._execute('ip', '-force', '-batch', '-',
+                           process_input='addr add 10.10.10.10/32 dev foo\n',
+                           run_as_root=True, check_exit_code=[0, 1]).\
+            AndReturn(('', 'Cannot find device "foo"\n'
+                           'Command failed -:1\n'))
+        self.mox.ReplayAll()
+        self.assertRaises(processutils.ProcessExecutionError,
+                          linux_net.bind_floating_ips,
+                          [('10.10.10.10', 'foo')])
+
     def test_apply_ran(self):
         manager = linux_net.IptablesManager()
         manager.iptables_apply_deferred = False
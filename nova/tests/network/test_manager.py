@@ -1143,7 +1143,8 @@ class VlanNetworkTestCase(test.TestCase):
     @mock.patch('nova.db.floating_ip_get_all_by_host')
     @mock.patch('nova.db.fixed_ip_get')
     def _test_floating_ip_init_host(self, fixed_get, floating_get,
-                                    public_interface, expected_arg):
+                                    public_interface, expected_arg,
+                                    bulk_fails=False):
 
         floating_get.return_value = [
             dict(test_floating_ip.fake_floating_ip,
@@ -1167,14 +1168,26 @@ class VlanNetworkTestCase(test.TestCase):
             raise exception.FixedIpNotFound(id=fixed_ip_id)
         fixed_get.side_effect = fixed_ip_get
 
+        self.mox.StubOutWithMock(self.network.l3driver, 'add_floating_ips')
         self.mox.StubOutWithMock(self.network.l3driver, 'add_floating_ip')
         self.flags(public_interface=public_interface)
-        self.network.l3driver.add_floating_ip(netaddr.IPAddress('1.2.3.5'),
-                                              netaddr.IPAddress('1.2.3.4'),
-                                              expected_arg,
-                                              mox.IsA(network_obj.Network))
+        expected = (netaddr.IPAddress('1.2.3.5'),
+                    netaddr.IPAddress('1.2.3.4'),
+                    expected_arg,
+                    mox.IsA(network_obj.Network))
+        if bulk_fails:
+            self.network.l3driver.add_floating_ips([expected]).AndRaise(
+                processutils.ProcessExecutionError())
+            self.network.l3driver.add_floating_ip(*expected).AndRaise(
+                processutils.ProcessExecutionError())
+        else:
+            self.network.l3driver.add_floating_ips([expected])
         self.mox.ReplayAll()
-        self.network.init_host_floating_ips()
+        if bulk_fails:
+            self.assertRaises(exception.NoFloatingIpInterface,
+                              self.network.init_host_floating_ips)
+        else:
+            self.network.init_host_floating_ips()
         self.mox.UnsetStubs()
         self.mox.VerifyAll()
 
@@ -1186,6 +1199,11 @@ class VlanNetworkTestCase(test.TestCase):
         self._test_floating_ip_init_host(public_interface='fooiface',
                                          expected_arg='fooiface')
 
+    def test_floating_ip_init_host_bulk_failure_finds_interface(self):
+        self._test_floating_ip_init_host(public_interface=False,
+                                         expected_arg='fakeiface',
+                                         bulk_fails=True)
+
     def test_disassociate_floating_ip(self):
         ctxt = context.RequestContext('testuser', 'testproject',
                                       is_admin=False)
@@ -16,6 +16,7 @@
 
 from nova import exception
 from nova.network import model
+from nova.openstack.common import jsonutils
 from nova import test
 from nova.tests import fake_network_cache_model
 from nova.virt import netutils
@@ -511,6 +512,37 @@ class NetworkInfoTests(test.NoDBTestCase):
                  fake_network_cache_model.new_fixed_ip(
                         {'address': '10.10.0.3'})] * 4)
 
+    def _lazy_model(self):
+        vif = fake_network_cache_model.new_vif()
+        vif['network']['subnets'][0]['ips'][0].add_floating_ip(
+            model.IP(address='192.168.1.1', type='floating'))
+        ninfo = model.NetworkInfo([vif, fake_network_cache_model.new_vif(
+            {'address': 'bb:bb:bb:bb:bb:bb'})])
+        return ninfo, model.LazyNetworkInfo.hydrate(ninfo.json())
+
+    def test_lazy_hydrate_defers_vifs(self):
+        ninfo, lazy = self._lazy_model()
+        self.assertEqual(2, len(lazy))
+        self.assertEqual(ninfo.fixed_ips(), lazy.fixed_ips())
+        self.assertEqual(ninfo.floating_ips(), lazy.floating_ips())
+        self.assertFalse(any(isinstance(vif, model.VIF)
+                             for vif in list.__iter__(lazy)))
+
+        self.assertIsInstance(lazy[1], model.VIF)
+        self.assertNotIsInstance(list.__getitem__(lazy, 0), model.VIF)
+        self.assertEqual(ninfo.fixed_ips(), lazy.fixed_ips())
+        self.assertEqual(ninfo.floating_ips(), lazy.floating_ips())
+
+    def test_lazy_hydrate_matches_eager(self):
+        ninfo, lazy = self._lazy_model()
+        self.assertEqual(model.NetworkInfo.hydrate(ninfo.json()), lazy)
+        untouched = model.LazyNetworkInfo.hydrate(ninfo.json())
+        self.assertEqual(jsonutils.loads(ninfo.json()),
+                         jsonutils.loads(untouched.json()))
+        self.assertEqual(list(ninfo), list(lazy))
+        self.assertEqual(ninfo[:1], lazy[:1])
+        self.assertTrue(all(isinstance(vif, model.VIF) for vif in lazy))
+
     def _test_injected_network_template(self, should_inject, use_ipv4=True,
                                         use_ipv6=False, gateway=True):
         """Check that netutils properly decides whether to inject based on
@@ -13,25 +13,33 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 #
+import collections
+import contextlib
 import copy
+import datetime
 import uuid
 
+import mock
 import mox
+from neutronclient import client as neutron_http
 from neutronclient.common import exceptions
 from neutronclient.v2_0 import client
 from oslo.config import cfg
+import requests
 import six
 
 from nova.compute import flavors
 from nova.conductor import api as conductor_api
 from nova import context
 from nova import exception
+from nova.network import base_api
 from nova.network import model
 from nova.network import neutronv2
 from nova.network.neutronv2 import api as neutronapi
 from nova.network.neutronv2 import constants
 from nova.openstack.common import jsonutils
 from nova.openstack.common import local
+from nova.openstack.common import timeutils
 from nova import test
 from nova import utils
 
@@ -145,6 +153,101 @@ class TestNeutronClient(test.TestCase):
                           my_context)
 
 
+class TestNeutronClientPool(test.NoDBTestCase):
+    def setUp(self):
+        super(TestNeutronClientPool, self).setUp()
+        self.flags(neutron_url='http://anyhost/')
+        self.stubs.Set(neutronv2, '_session', None)
+        self.stubs.Set(neutronv2, '_admin_auth', {})
+        self.stubs.Set(neutronv2, '_stats', collections.Counter())
+        self.expires = timeutils.utcnow() + datetime.timedelta(days=1)
+
+        def fake_authenticate(httpclient):
+            token = {'id': 'admin-token%d' % (
+                neutronv2._stats['admin_authentications']),
+                     'expires': timeutils.isotime(self.expires)}
+            httpclient._extract_service_catalog(
+                {'access': {'token': token, 'serviceCatalog': []}})
+        patcher = mock.patch.object(neutron_http.HTTPClient, 'authenticate',
+                                    autospec=True,
+                                    side_effect=fake_authenticate)
+        self.authenticate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _response(self, status_code=200, content='{}'):
+        resp = requests.Response()
+        resp.status_code = status_code
+        resp._content = content
+        return resp
+
+    def test_admin_clients_share_token(self):
+        clients = [neutronv2._get_client() for _i in xrange(3)]
+        for admin_client in clients:
+            admin_client.httpclient.authenticate_and_fetch_endpoint_url()
+            self.assertEqual('admin-token0',
+                             admin_client.httpclient.auth_token)
+        self.assertEqual(1, self.authenticate.call_count)
+        self.assertEqual(1, neutronv2.get_connection_stats()[
+            'admin_authentications'])
+
+    def test_admin_token_refreshed_before_expiry(self):
+        self.flags(neutron_admin_token_refresh=60)
+        self.expires = timeutils.utcnow() + datetime.timedelta(seconds=30)
+        admin_client = neutronv2._get_client()
+        admin_client.httpclient.authenticate_and_fetch_endpoint_url()
+        admin_client.httpclient.authenticate_and_fetch_endpoint_url()
+        self.assertEqual(2, self.authenticate.call_count)
+        self.assertEqual('admin-token1', admin_client.httpclient.auth_token)
+
+        self.expires = timeutils.utcnow() + datetime.timedelta(hours=1)
+        admin_client.httpclient.authenticate_and_fetch_endpoint_url()
+        admin_client.httpclient.authenticate_and_fetch_endpoint_url()
+        self.assertEqual(3, self.authenticate.call_count)
+
+    def test_user_token_clients_share_connections(self):
+        self.flags(neutron_url='http://anyhost')
+        user_clients = [neutronv2._get_client(token='token%d' % i)
+                        for i in xrange(2)]
+        with contextlib.nested(
+            mock.patch.object(requests.Session, 'request',
+                              return_value=self._response()),
+            mock.patch.object(requests, 'request')
+        ) as (session_request, module_request):
+            for user_client in user_clients:
+                # Through the base class, as the neutron client does
+                resp, body = user_client.httpclient.do_request('/ports',
+                                                               'GET')
+                self.assertEqual(200, user_client.get_status_code(resp))
+                self.assertEqual('{}', body)
+        self.assertFalse(module_request.called)
+        self.assertEqual(2, session_request.call_count)
+        self.assertEqual([mock.call('GET', 'http://anyhost/ports',
+                                    data=None, headers=mock.ANY,
+                                    verify=True,
+                                    timeout=CONF.neutron_url_timeout)] * 2,
+                         session_request.call_args_list)
+        headers = session_request.call_args[1]['headers']
+        self.assertEqual('application/json', headers['Accept'])
+        self.assertEqual('token1', headers['X-Auth-Token'])
+        self.assertFalse(self.authenticate.called)
+        stats = neutronv2.get_connection_stats()
+        self.assertEqual(2, stats['requests'])
+        self.assertEqual(0, stats['admin_authentications'])
+
+    def test_request_content_type(self):
+        httpclient = neutronv2._get_client(token='token').httpclient
+        with mock.patch.object(requests.Session, 'request') as request:
+            request.return_value = self._response(status_code=201)
+            resp, body = httpclient.request('http://anyhost/ports', 'POST',
+                                            body='{}',
+                                            content_type='application/xml')
+        self.assertEqual(201, httpclient.get_status_code(resp))
+        headers = request.call_args[1]['headers']
+        self.assertEqual('application/xml', headers['Accept'])
+        self.assertEqual('application/xml', headers['Content-Type'])
+        self.assertEqual(httpclient.USER_AGENT, headers['User-Agent'])
+
+
 class TestNeutronv2Base(test.TestCase):
 
     def setUp(self):
@@ -1921,8 +2024,8 @@ class TestNeutronv2(TestNeutronv2Base):
         fake_ips = [model.IP(x['ip_address']) for x in fake_port['fixed_ips']]
         api = neutronapi.API()
         self.mox.StubOutWithMock(api, '_get_subnets_from_port')
-        api._get_subnets_from_port(self.context, fake_port).AndReturn(
-            [fake_subnet])
+        api._get_subnets_from_port(self.context, fake_port,
+                                   shared=None).AndReturn([fake_subnet])
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
         subnets = api._nw_info_get_subnets(self.context, fake_port, fake_ips)
@@ -2050,8 +2153,8 @@ class TestNeutronv2(TestNeutronv2Base):
                 self.moxed_client, '1.1.1.1', requested_port['id']).AndReturn(
                     [{'floating_ip_address': '10.0.0.1'}])
         for requested_port in requested_ports:
-            api._get_subnets_from_port(self.context, requested_port
-                ).AndReturn(fake_subnets)
+            api._get_subnets_from_port(self.context, requested_port,
+                                       shared=None).AndReturn(fake_subnets)
 
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
@@ -2079,6 +2182,71 @@ class TestNeutronv2(TestNeutronv2Base):
         self.assertEqual(nw_infos[1]['id'], 'port1')
         self.assertEqual(nw_infos[2]['id'], 'port2')
 
+    def test_get_instance_nw_info_for_instances(self):
+        api = neutronapi.API()
+        instances = [{'project_id': 'fake', 'uuid': 'uuid%d' % x,
+                      'display_name': 'inst%d' % x,
+                      'info_cache': {'network_info': []}}
+                     for x in xrange(3)]
+        fake_ports = [
+            {'id': 'port0', 'device_id': 'uuid0', 'tenant_id': 'fake'},
+            # Owned by another tenant, so it should be ignored
+            {'id': 'port1', 'device_id': 'uuid1', 'tenant_id': 'other'},
+            {'id': 'port2', 'device_id': 'uuid1', 'tenant_id': 'fake'},
+            ]
+        neutronv2.get_client(mox.IgnoreArg(), admin=True).AndReturn(
+            self.moxed_client)
+        # One listing for all the instances
+        self.moxed_client.list_ports(
+            device_id=['uuid0', 'uuid1', 'uuid2']).AndReturn(
+                {'ports': fake_ports})
+        neutronv2.get_client(mox.IgnoreArg()).AndReturn(self.moxed_client)
+        self.moxed_client.list_floatingips(
+            port_id=['port0', 'port2']).AndReturn({'floatingips': []})
+
+        self.mox.StubOutWithMock(api, '_get_instance_nw_info')
+        self.mox.StubOutWithMock(base_api,
+                                 'update_instance_cache_with_nw_info')
+        shared = mox.IsA(neutronapi._SharedResources)
+        api._get_instance_nw_info(self.context, instances[0],
+                                  ports=[fake_ports[0]],
+                                  shared=shared).AndReturn('nw0')
+        base_api.update_instance_cache_with_nw_info(
+            api, self.context, instances[0], 'nw0', update_cells=False)
+        api._get_instance_nw_info(self.context, instances[1],
+                                  ports=[fake_ports[2]],
+                                  shared=shared).AndReturn('nw1')
+        base_api.update_instance_cache_with_nw_info(
+            api, self.context, instances[1], 'nw1', update_cells=False)
+        # A failure for one instance does not stop the others
+        api._get_instance_nw_info(self.context, instances[2], ports=[],
+                                  shared=shared).AndRaise(
+                                      test.TestingException)
+
+        self.mox.ReplayAll()
+        neutronv2.get_client('fake')
+        nw_infos = api.get_instance_nw_info_for_instances(self.context,
+                                                          instances)
+        self.assertEqual({'uuid0': 'nw0', 'uuid1': 'nw1'}, nw_infos)
+
+    def test_build_network_info_model_with_ports(self):
+        api = neutronapi.API()
+        fake_inst = {'project_id': 'fake', 'uuid': 'uuid',
+                     'info_cache': {'network_info': []}}
+        neutronv2.get_client(mox.IgnoreArg(), admin=True).AndReturn(
+            self.moxed_client)
+        self.mox.StubOutWithMock(api, '_gather_port_ids_and_networks')
+        api._gather_port_ids_and_networks(
+            self.context, fake_inst, None, None,
+            shared=None).AndReturn(([], []))
+
+        self.mox.ReplayAll()
+        neutronv2.get_client('fake')
+        # Passing the ports in avoids listing them again
+        nw_infos = api._build_network_info_model(self.context, fake_inst,
+                                                 ports=[])
+        self.assertEqual(0, len(nw_infos))
+
     def test_get_all_empty_list_networks(self):
         api = neutronapi.API()
         self.moxed_client.list_networks().AndReturn({'networks': []})
@@ -2143,6 +2311,108 @@ class TestNeutronv2ModuleMethods(test.TestCase):
         self.assertEqual(l, [{'id': 1}, {'id': 2}, {'id': 3}])
 
 
+class CountingNeutronClient(object):
+    """In-memory neutron client that counts the list calls made on it."""
+
+    def __init__(self, networks, subnets, ports, floatingips):
+        self.resources = {'networks': networks, 'subnets': subnets,
+                          'ports': ports, 'floatingips': floatingips}
+        self.calls = collections.Counter()
+
+    def _list(self, collection, **filters):
+        self.calls['list_' + collection] += 1
+
+        def matches(resource):
+            for key, value in filters.items():
+                values = value if isinstance(value, list) else [value]
+                if resource.get(key) not in values:
+                    return False
+            return True
+
+        return {collection: [copy.deepcopy(resource) for resource in
+                             self.resources[collection]
+                             if matches(resource)]}
+
+    def list_networks(self, **filters):
+        return self._list('networks', **filters)
+
+    def list_subnets(self, **filters):
+        return self._list('subnets', **filters)
+
+    def list_ports(self, **filters):
+        return self._list('ports', **filters)
+
+    def list_floatingips(self, **filters):
+        return self._list('floatingips', **filters)
+
+
+class TestNeutronv2BulkNwInfo(test.TestCase):
+
+    def setUp(self):
+        super(TestNeutronv2BulkNwInfo, self).setUp()
+        self.context = context.RequestContext('userid', 'my_tenantid')
+        self.instances = []
+        ports = []
+        floatingips = []
+        for i in xrange(3):
+            address = '10.0.0.%d' % (i + 3)
+            vif = model.VIF(id='port%d' % i,
+                            network=model.Network(id='net-id'))
+            self.instances.append({
+                'uuid': 'uuid%d' % i, 'project_id': 'my_tenantid',
+                'display_name': 'inst%d' % i,
+                'info_cache': {'network_info': model.NetworkInfo([vif])}})
+            ports.append({'id': 'port%d' % i, 'device_id': 'uuid%d' % i,
+                          'tenant_id': 'my_tenantid', 'network_id': 'net-id',
+                          'mac_address': 'de:ad:be:ef:00:0%d' % i,
+                          'admin_state_up': True, 'status': 'ACTIVE',
+                          'fixed_ips': [{'subnet_id': 'subnet-id',
+                                         'ip_address': address}]})
+            floatingips.append({'port_id': 'port%d' % i,
+                                'fixed_ip_address': address,
+                                'floating_ip_address': '172.24.4.%d' % i})
+        ports.append({'id': 'dhcp-port', 'device_id': 'dhcp',
+                      'tenant_id': 'my_tenantid', 'network_id': 'net-id',
+                      'device_owner': 'network:dhcp',
+                      'fixed_ips': [{'subnet_id': 'subnet-id',
+                                     'ip_address': '10.0.0.2'}]})
+        self.client = CountingNeutronClient(
+            networks=[{'id': 'net-id', 'name': 'private',
+                       'tenant_id': 'my_tenantid'}],
+            subnets=[{'id': 'subnet-id', 'network_id': 'net-id',
+                      'cidr': '10.0.0.0/24', 'gateway_ip': '10.0.0.1',
+                      'dns_nameservers': ['8.8.8.8']}],
+            ports=ports, floatingips=floatingips)
+        self.stubs.Set(neutronv2, 'get_client',
+                       lambda context, admin=False: self.client)
+        self.stubs.Set(base_api, 'update_instance_cache_with_nw_info',
+                       lambda *args, **kwargs: None)
+
+    def test_bulk_nw_info_shares_lookups(self):
+        api = neutronapi.API()
+        expected = dict((instance['uuid'],
+                         api.get_instance_nw_info(self.context, instance))
+                        for instance in self.instances)
+        # Every instance asks for its own ports, networks, subnets, DHCP
+        # ports and floating IPs
+        self.assertEqual({'list_ports': 6, 'list_networks': 3,
+                          'list_subnets': 3, 'list_floatingips': 3},
+                         self.client.calls)
+
+        self.client.calls.clear()
+        nw_infos = api.get_instance_nw_info_for_instances(self.context,
+                                                          self.instances)
+        self.assertEqual({'list_ports': 2, 'list_networks': 1,
+                          'list_subnets': 1, 'list_floatingips': 1},
+                         self.client.calls)
+        self.assertEqual(expected, nw_infos)
+        self.assertEqual(['172.24.4.1'],
+                         [ip['address']
+                          for ip in nw_infos['uuid1'].floating_ips()])
+        self.assertEqual('10.0.0.2', nw_infos['uuid1'][0]['network'][
+            'subnets'][0]['meta']['dhcp_server'])
+
+
 class TestNeutronv2Portbinding(TestNeutronv2Base):
 
     def test_allocate_for_instance_portbinding(self):
@@ -217,6 +217,18 @@ class _TestBlockDeviceMappingListObject(object):
                     self.context, 'fake_instance_uuid'))
         self.assertEqual(0, len(bdm_list))
 
+    @mock.patch.object(db, 'block_device_mapping_get_all_by_instance_uuids')
+    def test_get_by_instance_uuids(self, get_all_by_uuids):
+        fakes = [self.fake_bdm(123), self.fake_bdm(456)]
+        get_all_by_uuids.return_value = fakes
+        bdm_list = (
+                block_device_obj.BlockDeviceMappingList.get_by_instance_uuids(
+                    self.context, ['fake-instance', 'other-instance']))
+        get_all_by_uuids.assert_called_once_with(
+            self.context, ['fake-instance', 'other-instance'],
+            use_slave=False)
+        self.assertEqual([123, 456], [bdm.id for bdm in bdm_list])
+
     def test_root_volume_metadata(self):
         fake_volume = {
                 'volume_image_metadata': {'vol_test_key': 'vol_test_value'}}
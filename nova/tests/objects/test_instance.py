@@ -967,6 +967,17 @@ class _TestInstanceListObject(object):
             self.assertEqual(inst_list.objects[i].uuid, fakes[i]['uuid'])
         self.assertRemotes()
 
+    def test_get_popular_image_refs(self):
+        self.mox.StubOutWithMock(db, 'instance_get_popular_image_refs')
+        db.instance_get_popular_image_refs(self.context, 2,
+                                           use_slave=False).AndReturn(
+                                               ['a', 'b'])
+        self.mox.ReplayAll()
+        self.assertEqual(['a', 'b'],
+                         instance.InstanceList.get_popular_image_refs(
+                             self.context, 2))
+        self.assertRemotes()
+
     def test_get_active_by_window_joined(self):
         fakes = [self.fake_instance(1), self.fake_instance(2)]
         # NOTE(mriedem): Send in a timezone-naive datetime since the
@@ -245,3 +245,25 @@ class AvailabilityZoneTestCases(test.TestCase):
 
         self.assertEqual(self.availability_zone,
                 az.get_instance_availability_zone(self.context, fake_inst))
+
+    def test_get_instances_availability_zones(self):
+        host = 'host170'
+        service = self._create_service_with_topic('compute', host)
+        self._add_to_aggregate(service, self.agg)
+        az.update_host_availability_zone_cache(self.context, 'cached-host',
+                                               'cached-az')
+        instances = [fakes.stub_instance(1, uuid='uuid1', host=host),
+                     fakes.stub_instance(2, uuid='uuid2', host=host),
+                     fakes.stub_instance(3, uuid='uuid3', host=self.host),
+                     fakes.stub_instance(4, uuid='uuid4', host='cached-host')]
+
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        azs = az.get_instances_availability_zones(self.context, instances)
+
+        self.assertEqual({'uuid1': self.availability_zone,
+                          'uuid2': self.availability_zone,
+                          'uuid3': self.default_az,
+                          'uuid4': 'cached-az'}, azs)
+        self.assertEqual(self.availability_zone,
+                         az._get_cache().get(az._make_cache_key(host)))
@@ -276,3 +276,99 @@ class IptablesManagerTestCase(test.NoDBTestCase):
                                                self.manager.ipv4['filter'],
                                                'filter')
         self.assertEqual(current_lines, new_lines)
+
+    def test_remove_unwrapped_rules_and_chains(self):
+        current_lines = list(self.sample_filter)
+        current_lines[11:11] = [':unwrapped - [0:0]']
+        current_lines[13:13] = ['[5:10] -A unwrapped -j DROP',
+                                '[5:10] -A FORWARD -j unwrapped']
+        table = self.manager.ipv4['filter']
+        table.add_chain('unwrapped', wrap=False)
+        table.add_rule('unwrapped', '-j DROP', wrap=False)
+        table.add_rule('FORWARD', '-j unwrapped', wrap=False)
+        table.remove_chain('unwrapped', wrap=False)
+        self.assertEqual(2, len(table.remove_rules))
+
+        new_lines = self.manager._modify_rules(current_lines, table, 'filter')
+        self.assertEqual(self.sample_filter, new_lines)
+        self.assertEqual([], table.remove_rules)
+        self.assertEqual(set(), table.remove_chains)
+
+    def test_empty_chain_allows_rules_again(self):
+        table = self.manager.ipv4['filter']
+        table.add_rule('local', '-j DROP')
+        table.empty_chain('local')
+        self.assertNotIn(linux_net.IptablesRule('local', '-j DROP'),
+                         table.rules)
+        table.add_rule('local', '-j DROP')
+        self.assertIn(linux_net.IptablesRule('local', '-j DROP'),
+                      table.rules)
+
+    def _apply(self, current_lines):
+        calls = []
+
+        def fake_execute(*cmd, **kwargs):
+            calls.append((cmd, kwargs.get('process_input')))
+            return '\n'.join(current_lines), ''
+
+        self.manager.execute = fake_execute
+        self.manager.apply()
+        return calls
+
+    def test_apply_noflush_restores_changed_chains(self):
+        self.flags(iptables_restore_noflush=True)
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-j ACCEPT')
+        self.manager.ipv4['nat'].remove_chain('float-snat')
+
+        calls = self._apply(self.sample_filter + self.sample_nat)
+        self.assertEqual(('iptables-save', '-c'), calls[0][0])
+        self.assertEqual(('iptables-restore', '-c', '--noflush'), calls[1][0])
+        lines = calls[1][1].split('\n')
+        self.assertIn('*filter', lines)
+        self.assertIn(':%s-FORWARD - [0:0]' % self.binary_name, lines)
+        self.assertIn('[0:0] -A %s-FORWARD -j ACCEPT' % self.binary_name,
+                      lines)
+        self.assertNotIn(':%s-INPUT - [0:0]' % self.binary_name, lines)
+        self.assertNotIn('-F INPUT', lines)
+        # the snat chain jumped to float-snat and is rewritten without it
+        self.assertIn(':%s-snat - [0:0]' % self.binary_name, lines)
+        self.assertIn('-X %s-float-snat' % self.binary_name, lines)
+        self.assertNotIn(':PREROUTING ACCEPT [3936:762355]', lines)
+        # the mangle table is missing, so all of it gets created
+        self.assertIn('*mangle', lines)
+        self.assertIn('[0:0] -A POSTROUTING -j %s-POSTROUTING' %
+                      self.binary_name, lines)
+
+    def test_apply_noflush_flushes_builtin_chains(self):
+        self.flags(iptables_restore_noflush=True)
+        self.manager.ipv4['filter'].add_rule('INPUT', '-j ACCEPT',
+                                             wrap=False)
+
+        calls = self._apply(self.sample_filter + self.sample_nat)
+        lines = calls[1][1].split('\n')
+        filter_lines = lines[:lines.index('COMMIT') + 1]
+        self.assertEqual('*filter', filter_lines[0])
+        self.assertIn('-F INPUT', filter_lines)
+        self.assertNotIn(':INPUT - [0:0]', filter_lines)
+        self.assertIn('[0:0] -A INPUT -j ACCEPT', filter_lines)
+        self.assertIn('[0:0] -A INPUT -i virbr0 -p udp -m udp --dport 53 '
+                      '-j ACCEPT', filter_lines)
+        self.assertEqual(1, len([l for l in lines if l.startswith('-F ')]))
+
+    def test_apply_noflush_skips_unchanged_tables(self):
+        self.flags(iptables_restore_noflush=True)
+        self.manager.ipv4 = {'filter': self.manager.ipv4['filter'],
+                             'nat': self.manager.ipv4['nat']}
+
+        calls = self._apply(self.sample_filter + self.sample_nat)
+        self.assertEqual(['iptables-save', 'ip6tables-save'],
+                         [c[0][0] for c in calls])
+
+    def test_apply_restores_everything(self):
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-j ACCEPT')
+
+        calls = self._apply(self.sample_filter + self.sample_nat)
+        self.assertEqual(('iptables-restore', '-c'), calls[1][0])
+        lines = calls[1][1].split('\n')
+        self.assertIn(':INPUT ACCEPT [2223527:305688874]', lines)
+        self.assertIn('*nat', lines)
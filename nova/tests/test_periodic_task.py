@@ -0,0 +1,161 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for running periodic tasks."""
+
+from eventlet import event
+from eventlet import greenpool
+from eventlet import greenthread
+import mock
+
+from nova import context
+from nova import manager
+from nova.openstack.common import periodic_task
+from nova import periodic_task_stats
+from nova import test
+
+
+class FakeManager(manager.Manager):
+    def __init__(self):
+        super(FakeManager, self).__init__()
+        self.calls = []
+        self.blocker = None
+
+    @periodic_task.periodic_task
+    def _slow_task(self, context):
+        self.calls.append('slow')
+        if self.blocker is not None:
+            self.blocker.wait()
+
+    @periodic_task.periodic_task
+    def _failing_task(self, context):
+        self.calls.append('failing')
+        raise test.TestingException()
+
+
+class PeriodicTasksTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(PeriodicTasksTestCase, self).setUp()
+        self.stubs.Set(periodic_task_stats, '_task_timings', {})
+        self.context = context.get_admin_context()
+        self.manager = FakeManager()
+
+    def test_run_sequentially(self):
+        self.manager.run_periodic_tasks(self.context)
+        self.assertEqual(['failing', 'slow'], sorted(self.manager.calls))
+
+        timings = periodic_task_stats.get_task_timings()
+        slow = timings['FakeManager._slow_task']
+        self.assertEqual(1, slow['runs'])
+        self.assertEqual(0, slow['failures'])
+        self.assertEqual(1, slow['histogram']['< 0.1s'])
+        failing = timings['FakeManager._failing_task']
+        self.assertEqual(1, failing['runs'])
+        self.assertEqual(1, failing['failures'])
+
+    def test_run_sequentially_raise_on_error(self):
+        self.assertRaises(test.TestingException,
+                          self.manager.run_periodic_tasks, self.context,
+                          raise_on_error=True)
+        timings = periodic_task_stats.get_task_timings()
+        self.assertEqual(1, timings['FakeManager._failing_task']['failures'])
+
+    def test_run_in_pool_skips_running_task(self):
+        self.flags(periodic_task_pool_size=4)
+        self.manager.blocker = event.Event()
+
+        self.manager.run_periodic_tasks(self.context)
+        # Let the spawned tasks start
+        greenthread.sleep(0)
+        self.assertEqual(['failing', 'slow'], sorted(self.manager.calls))
+
+        # The slow task has not finished yet, so it is skipped
+        self.manager.run_periodic_tasks(self.context)
+        greenthread.sleep(0)
+        self.assertEqual(['failing', 'failing', 'slow'],
+                         sorted(self.manager.calls))
+        timings = periodic_task_stats.get_task_timings()
+        self.assertEqual(1, timings['FakeManager._slow_task']['skipped'])
+        self.assertEqual(0, timings['FakeManager._slow_task']['runs'])
+        self.assertEqual(2, timings['FakeManager._failing_task']['failures'])
+
+        self.manager.blocker.send()
+        self.manager._periodic_pool.waitall()
+        self.manager.blocker = None
+        self.manager.run_periodic_tasks(self.context)
+        self.manager._periodic_pool.waitall()
+        self.assertEqual(2, self.manager.calls.count('slow'))
+        timings = periodic_task_stats.get_task_timings()
+        self.assertEqual(2, timings['FakeManager._slow_task']['runs'])
+
+    def test_run_in_pool_raise_on_error(self):
+        self.flags(periodic_task_pool_size=4)
+        self.assertRaises(test.TestingException,
+                          self.manager.run_periodic_tasks, self.context,
+                          raise_on_error=True)
+        self.manager._periodic_pool.waitall()
+        self.assertEqual(['failing', 'slow'], sorted(self.manager.calls))
+        self.assertEqual(1, periodic_task_stats.get_task_timings()[
+            'FakeManager._failing_task']['failures'])
+
+    def test_jitter_does_not_hold_pool_slot(self):
+        self.flags(periodic_task_pool_size=2, periodic_task_jitter=1)
+        real_sleep = greenthread.sleep
+        real_spawn = greenpool.GreenPool.spawn
+        calls = []
+
+        def fake_sleep(seconds):
+            self.assertEqual(0.5, seconds)
+            calls.append('sleep')
+            # Let the other task get to its jitter too
+            while calls.count('sleep') < 2:
+                real_sleep(0)
+
+        def fake_spawn(pool, func, *args, **kwargs):
+            calls.append('spawn')
+            return real_spawn(pool, func, *args, **kwargs)
+
+        self.stubs.Set(greenpool.GreenPool, 'spawn', fake_spawn)
+        with mock.patch.object(manager.random, 'uniform', return_value=0.5):
+            with mock.patch.object(manager.greenthread, 'sleep',
+                                   side_effect=fake_sleep):
+                self.manager.run_periodic_tasks(self.context)
+                while self.manager._periodic_running:
+                    real_sleep(0)
+        # Both tasks waited out their jitter before taking a pool slot
+        self.assertEqual(['sleep', 'sleep', 'spawn', 'spawn'], calls)
+        self.assertEqual(['failing', 'slow'], sorted(self.manager.calls))
+
+
+class TaskTimingsTestCase(test.NoDBTestCase):
+    def test_record(self):
+        timings = periodic_task_stats.TaskTimings()
+        for duration in (0.05, 0.5, 0.7, 400):
+            timings.record(duration)
+        timings.record(5, failed=True)
+
+        result = timings.to_dict()
+        self.assertEqual(5, result['runs'])
+        self.assertEqual(1, result['failures'])
+        self.assertEqual(5, result['last'])
+        self.assertEqual(400, result['longest'])
+        self.assertAlmostEqual(81.25, result['mean'])
+        self.assertEqual({'< 0.1s': 1, '< 1s': 2, '< 10s': 1, '< 60s': 0,
+                          '< 300s': 0, '>= 300s': 1}, result['histogram'])
+
+    def test_report_generator(self):
+        self.stubs.Set(periodic_task_stats, '_task_timings',
+                       {'FakeManager._task':
+                        periodic_task_stats.TaskTimings()})
+        model = periodic_task_stats.PeriodicTaskReportGenerator()()
+        self.assertEqual(0, model['FakeManager._task']['runs'])
+        self.assertIn('FakeManager._task', model.to_text())
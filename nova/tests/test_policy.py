@@ -19,9 +19,12 @@ import os.path
 import StringIO
 import urllib2
 
+import mock
+
 from nova import context
 from nova import exception
 from nova.openstack.common import policy as common_policy
+from nova.openstack.common import timeutils
 from nova import policy
 from nova import test
 from nova.tests import policy_fixture
@@ -57,6 +60,23 @@ class PolicyFileTestCase(test.NoDBTestCase):
             self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
                               self.context, action, self.target)
 
+    def test_policy_file_checked_every_interval(self):
+        self.flags(policy_file_check_interval=10)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        policy.reset()
+        action = "example:test"
+
+        with mock.patch.object(utils, 'read_cached_file',
+                               wraps=utils.read_cached_file) as read:
+            for _i in xrange(3):
+                policy.enforce(self.context, action, self.target, False)
+            self.assertEqual(1, read.call_count)
+
+            timeutils.advance_time_seconds(10)
+            policy.enforce(self.context, action, self.target, False)
+            self.assertEqual(2, read.call_count)
+
 
 class PolicyTestCase(test.NoDBTestCase):
     def setUp(self):
@@ -145,6 +165,61 @@ class PolicyTestCase(test.NoDBTestCase):
         policy.enforce(admin_context, lowercase_action, self.target)
         policy.enforce(admin_context, uppercase_action, self.target)
 
+    def test_role_rule_remembered_for_context(self):
+        rule = mock.Mock(return_value=True)
+        other_context = context.RequestContext('fake', 'fake',
+                                               roles=['member'])
+        with mock.patch.object(policy, '_get_compiled_rule',
+                               return_value=(rule, True)):
+            with mock.patch.object(context.RequestContext,
+                                   'to_dict') as to_dict:
+                for _i in xrange(3):
+                    policy.enforce(self.context, "example:allowed",
+                                   self.target)
+                self.assertEqual(1, rule.call_count)
+                policy.enforce(other_context, "example:allowed",
+                               self.target)
+                self.assertEqual(2, rule.call_count)
+                self.assertFalse(to_dict.called)
+
+    def test_remembered_result_follows_roles(self):
+        action = "example:lowercase_admin"
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, self.target)
+        self.context.roles.append('sysadmin')
+        self.assertTrue(policy.enforce(self.context, action, self.target))
+        self.context.roles.remove('sysadmin')
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, self.target)
+
+    def test_remembered_result_dropped_with_new_rules(self):
+        self.policy.set_rules({"example:rule": "rule:example:inner",
+                               "example:inner": "@"})
+        self.assertTrue(policy.enforce(self.context, "example:rule",
+                                       self.target))
+        self.policy.set_rules({"example:rule": "rule:example:inner",
+                               "example:inner": "!"})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, "example:rule", self.target)
+
+    def test_compiled_rule_ignores_target(self):
+        def compile_rule(rule):
+            return policy._compile(common_policy.parse_rule(rule),
+                                   common_policy._rules, frozenset())
+
+        rule, ignores_target = compile_rule(
+            "rule:example:lowercase_admin or not is_admin:True")
+        self.assertTrue(ignores_target)
+        self.assertTrue(rule(None, {'roles': ['member'], 'is_admin': False}))
+        self.assertFalse(rule(None, {'roles': ['member'], 'is_admin': True}))
+        self.assertTrue(rule(None, {'roles': ['Admin'], 'is_admin': True}))
+
+        rule, ignores_target = compile_rule(
+            "role:admin or project_id:%(project_id)s")
+        self.assertFalse(ignores_target)
+        self.assertTrue(rule({'project_id': 'fake'},
+                             {'roles': [], 'project_id': 'fake'}))
+
 
 class DefaultPolicyTestCase(test.NoDBTestCase):
 
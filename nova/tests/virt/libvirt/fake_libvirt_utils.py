@@ -102,6 +102,10 @@ def copy_image(src, dest):
     pass
 
 
+def clone_image(src, dest):
+    return 'sparse'
+
+
 def resize2fs(path):
     pass
 
@@ -13,10 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
 import os
 import shutil
 import tempfile
 
+import eventlet
+from eventlet import event
 import fixtures
 from oslo.config import cfg
 
@@ -28,6 +31,7 @@ from nova.openstack.common import uuidutils
 from nova import test
 from nova.tests import fake_processutils
 from nova.tests.virt.libvirt import fake_libvirt_utils
+from nova import utils
 from nova.virt.libvirt import imagebackend
 
 CONF = cfg.CONF
@@ -126,7 +130,7 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
         fn = self.mox.CreateMockAnything()
         self.mox.StubOutWithMock(imagebackend.utils.synchronized,
                                  '__call__')
-        self.mox.StubOutWithMock(imagebackend.libvirt_utils, 'copy_image')
+        self.mox.StubOutWithMock(imagebackend.libvirt_utils, 'clone_image')
         self.mox.StubOutWithMock(imagebackend.disk, 'extend')
         return fn
 
@@ -136,6 +140,7 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
             os.path.exists(self.OLD_STYLE_INSTANCE_PATH).AndReturn(False)
         os.path.exists(self.TEMPLATE_DIR).AndReturn(False)
         os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
@@ -168,6 +173,7 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
             os.path.exists(self.OLD_STYLE_INSTANCE_PATH).AndReturn(False)
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
@@ -185,8 +191,8 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
             os.path.exists(self.OLD_STYLE_INSTANCE_PATH).AndReturn(False)
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(True)
         fn = self.mox.CreateMockAnything()
-        fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
 
         image = self.image_class(self.INSTANCE, self.NAME)
@@ -198,7 +204,8 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
     def test_create_image(self):
         fn = self.prepare_mocks()
         fn(target=self.TEMPLATE_PATH, max_size=None, image_id=None)
-        imagebackend.libvirt_utils.copy_image(self.TEMPLATE_PATH, self.PATH)
+        imagebackend.libvirt_utils.clone_image(
+            self.TEMPLATE_PATH, self.PATH).AndReturn('sparse')
         self.mox.ReplayAll()
 
         image = self.image_class(self.INSTANCE, self.NAME)
@@ -219,7 +226,8 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
     def test_create_image_extend(self):
         fn = self.prepare_mocks()
         fn(max_size=self.SIZE, target=self.TEMPLATE_PATH, image_id=None)
-        imagebackend.libvirt_utils.copy_image(self.TEMPLATE_PATH, self.PATH)
+        imagebackend.libvirt_utils.clone_image(
+            self.TEMPLATE_PATH, self.PATH).AndReturn('sparse')
         imagebackend.disk.extend(self.PATH, self.SIZE, use_cow=False)
         self.mox.ReplayAll()
 
@@ -281,6 +289,7 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(False)
         os.path.exists(self.INSTANCES_PATH).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
@@ -315,6 +324,7 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.INSTANCES_PATH).AndReturn(True)
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
@@ -333,8 +343,8 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.INSTANCES_PATH).AndReturn(True)
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(True)
         fn = self.mox.CreateMockAnything()
-        fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
 
         image = self.image_class(self.INSTANCE, self.NAME)
@@ -533,6 +543,7 @@ class LvmTestCase(_ImageTestCase, test.NoDBTestCase):
             os.path.exists(self.OLD_STYLE_INSTANCE_PATH).AndReturn(False)
         os.path.exists(self.TEMPLATE_DIR).AndReturn(False)
         os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
 
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
@@ -566,6 +577,7 @@ class LvmTestCase(_ImageTestCase, test.NoDBTestCase):
             os.path.exists(self.OLD_STYLE_INSTANCE_PATH).AndReturn(False)
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
@@ -686,6 +698,7 @@ class RbdTestCase(_ImageTestCase, test.NoDBTestCase):
         self.mox.StubOutWithMock(image, 'check_image_exists')
         os.path.exists(self.TEMPLATE_DIR).AndReturn(False)
         image.check_image_exists().AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
@@ -704,6 +717,7 @@ class RbdTestCase(_ImageTestCase, test.NoDBTestCase):
         self.mox.StubOutWithMock(image, 'check_image_exists')
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         image.check_image_exists().AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
@@ -735,8 +749,8 @@ class RbdTestCase(_ImageTestCase, test.NoDBTestCase):
         self.mox.StubOutWithMock(image, 'check_image_exists')
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         image.check_image_exists().AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(True)
         fn = self.mox.CreateMockAnything()
-        fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
 
         self.mock_create_image(image)
@@ -807,6 +821,81 @@ class RbdTestCase(_ImageTestCase, test.NoDBTestCase):
         self.assertEqual(image.path, rbd_path)
 
 
+class SharedFetchTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(SharedFetchTestCase, self).setUp()
+        self.started = event.Event()
+        self.finish = event.Event()
+        self.calls = []
+
+    def _fetch(self):
+        self.calls.append(1)
+        self.started.send()
+        return self.finish.wait()
+
+    def _fetch_concurrently(self):
+        leader = eventlet.spawn(imagebackend._fetch_once, '/base/a',
+                                self._fetch)
+        self.started.wait()
+        waiter = eventlet.spawn(imagebackend._fetch_once, '/base/a',
+                                self._fetch)
+        eventlet.sleep(0)
+        return leader, waiter
+
+    def test_fetch_once_shares_result(self):
+        leader, waiter = self._fetch_concurrently()
+        self.finish.send('done')
+        self.assertEqual('done', leader.wait())
+        self.assertEqual('done', waiter.wait())
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual({}, imagebackend._fetches)
+
+    def test_fetch_once_shares_failure(self):
+        leader, waiter = self._fetch_concurrently()
+        self.finish.send_exception(exception.ImageChecksumMismatch(
+            image_id='a', actual='x', expected='y'))
+        self.assertRaises(exception.ImageChecksumMismatch, leader.wait)
+        self.assertRaises(exception.ImageChecksumMismatch, waiter.wait)
+        self.assertEqual(1, len(self.calls))
+
+        # A later call tries again
+        self.assertEqual('again', imagebackend._fetch_once(
+            '/base/a', lambda: 'again'))
+
+    def test_fetch_once_flavor_disk_too_small_not_shared(self):
+        def fetch(max_size):
+            self.calls.append(max_size)
+            self.started.send()
+            self.finish.wait()
+            if max_size < 10:
+                raise exception.FlavorDiskTooSmall()
+            return max_size
+
+        leader = eventlet.spawn(imagebackend._fetch_once, '/base/a',
+                                functools.partial(fetch, 5))
+        self.started.wait()
+        self.started.reset()
+        waiter = eventlet.spawn(imagebackend._fetch_once, '/base/a',
+                                functools.partial(fetch, 20))
+        eventlet.sleep(0)
+        self.finish.send()
+
+        self.assertRaises(exception.FlavorDiskTooSmall, leader.wait)
+        self.assertEqual(20, waiter.wait())
+        self.assertEqual([5, 20], self.calls)
+        self.assertEqual({}, imagebackend._fetches)
+
+    def test_fetch_progress(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'a')
+            shared = imagebackend._SharedFetch(path)
+            self.assertEqual(0, shared.progress())
+            with open(path + '.part', 'w') as f:
+                f.write('x' * 10)
+            self.assertEqual(10, shared.progress())
+
+
 class BackendTestCase(test.NoDBTestCase):
     INSTANCE = {'name': 'fake-instance',
                 'uuid': uuidutils.generate_uuid()}
@@ -21,13 +21,17 @@ import json
 import os
 import time
 
+import fixtures
+import mock
 from oslo.config import cfg
 
 from nova import conductor
+from nova import context
 from nova import db
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import processutils
+from nova.openstack.common import units
 from nova import test
 from nova.tests import fake_instance
 from nova import utils
@@ -455,6 +459,24 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
             self.assertEqual(image_cache_manager.removable_base_files, [])
             self.assertEqual(image_cache_manager.corrupt_base_files, [])
 
+    def test_handle_base_image_preseeded(self):
+        img = '123'
+
+        with utils.tempdir() as tmpdir:
+            fname = os.path.join(tmpdir, hashlib.sha1(img).hexdigest())
+            with open(fname, 'w') as f:
+                f.write('data')
+            os.utime(fname, (-1, time.time() - 3601))
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.unexplained_images = [fname]
+            image_cache_manager.preseeded_images = set([img])
+            image_cache_manager._handle_base_image(img, fname)
+
+            self.assertEqual(image_cache_manager.unexplained_images, [])
+            self.assertEqual(image_cache_manager.removable_base_files, [])
+            self.assertEqual(image_cache_manager.active_base_files, [fname])
+
     def test_handle_base_image_absent(self):
         img = '123'
 
@@ -504,6 +526,9 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
                 f.write(json.dumps(d))
 
             image_cache_manager = imagecache.ImageCacheManager()
+            # The file is checksummed in the background first
+            image_cache_manager.checksummer.get_checksum(fname)
+            image_cache_manager.checksummer.wait()
             image_cache_manager.unexplained_images = [fname]
             image_cache_manager.used_images = {'123': (1, 0, ['banana-42'])}
             image_cache_manager._handle_base_image(img, fname)
@@ -822,9 +847,36 @@ class VerifyChecksumTestCase(test.NoDBTestCase):
     def test_verify_checksum(self):
         with utils.tempdir() as tmpdir:
             image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            # Pending until the file has been checksummed in the background
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertIsNone(res)
+            image_cache_manager.checksummer.wait()
             res = image_cache_manager._verify_checksum(self.img, fname)
             self.assertTrue(res)
 
+    def test_verify_checksum_not_rehashed(self):
+        self.flags(checksum_interval_seconds=0, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            image_cache_manager._verify_checksum(self.img, fname)
+            image_cache_manager.checksummer.wait()
+
+            with mock.patch.object(image_cache_manager.checksummer,
+                                   '_hash') as mock_hash:
+                res = image_cache_manager._verify_checksum(self.img, fname)
+                self.assertTrue(res)
+                # The file did not change, so the cached checksum is used
+                self.assertFalse(mock_hash.called)
+
+            # Changing the file invalidates the cached checksum
+            with open(fname, 'a') as f:
+                f.write('more data')
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertIsNone(res)
+            image_cache_manager.checksummer.wait()
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertFalse(res)
+
     def test_verify_checksum_disabled(self):
         self.flags(checksum_base_images=False, group='libvirt')
         with utils.tempdir() as tmpdir:
@@ -860,6 +912,8 @@ class VerifyChecksumTestCase(test.NoDBTestCase):
             with utils.tempdir() as tmpdir:
                 image_cache_manager, fname = (
                     self._check_body(tmpdir, "csum invalid, valid json"))
+                image_cache_manager._verify_checksum(self.img, fname)
+                image_cache_manager.checksummer.wait()
                 res = image_cache_manager._verify_checksum(self.img, fname)
                 self.assertFalse(res)
                 log = stream.getvalue()
@@ -878,5 +932,187 @@ class VerifyChecksumTestCase(test.NoDBTestCase):
             self.assertIsNone(res)
 
             # Checksum requests for a file with no checksum now have the
-            # side effect of creating the checksum
+            # side effect of creating the checksum, once the file has been
+            # checksummed in the background
+            image_cache_manager.checksummer.wait()
             self.assertTrue(os.path.exists(info_fname))
+
+
+class ChecksummerTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ChecksummerTestCase, self).setUp()
+        self.flags(checksum_read_size_kb=1,
+                   checksum_max_read_mb_per_second=0, group='libvirt')
+        self.checksummer = imagecache.Checksummer()
+        self.data = 'x' * 3000
+        self.digest = hashlib.sha1(self.data).hexdigest()
+
+    def _make_file(self, tmpdir):
+        fname = os.path.join(tmpdir, 'aaa')
+        with open(fname, 'w') as f:
+            f.write(self.data)
+        return fname
+
+    def test_get_checksum_callback(self):
+        results = []
+        with utils.tempdir() as tmpdir:
+            fname = self._make_file(tmpdir)
+            self.assertIsNone(self.checksummer.get_checksum(
+                fname, callback=lambda *args: results.append(args)))
+            self.checksummer.wait()
+            self.assertEqual([(fname, self.digest)], results)
+            self.assertEqual(self.digest,
+                             self.checksummer.get_checksum(fname))
+
+    def test_hash_resumes(self):
+        with utils.tempdir() as tmpdir:
+            fname = self._make_file(tmpdir)
+            with mock.patch.object(imagecache.greenthread, 'sleep',
+                                   side_effect=test.TestingException):
+                self.assertRaises(test.TestingException,
+                                  self.checksummer._hash, fname)
+            self.assertEqual(1024, self.checksummer._progress[fname][1])
+
+            with mock.patch.object(imagecache, 'open', create=True,
+                                   side_effect=open) as mock_open:
+                self.assertEqual(self.digest, self.checksummer._hash(fname))
+            mock_open.assert_called_once_with(fname, 'rb')
+            self.assertEqual({}, self.checksummer._progress)
+
+    def test_hash_restarts_changed_file(self):
+        with utils.tempdir() as tmpdir:
+            fname = self._make_file(tmpdir)
+            self.checksummer._progress[fname] = (('other', 0, 0), 1024,
+                                                 hashlib.sha1('bogus'))
+            self.assertEqual(self.digest, self.checksummer._hash(fname))
+
+    def test_hash_throttled(self):
+        self.flags(checksum_max_read_mb_per_second=1, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            fname = self._make_file(tmpdir)
+            with contextlib.nested(
+                mock.patch.object(imagecache.time, 'time', return_value=0),
+                mock.patch.object(imagecache.greenthread, 'sleep')
+            ) as (mock_time, mock_sleep):
+                self.checksummer._hash(fname)
+            # 1KB, 2KB then 3000 bytes read out of 1MB allowed per second
+            self.assertEqual([mock.call(1024.0 / 1048576),
+                              mock.call(2048.0 / 1048576),
+                              mock.call(3000.0 / 1048576)],
+                             mock_sleep.call_args_list)
+
+
+class ImagePreseedTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ImagePreseedTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.base_dir = self.useFixture(fixtures.TempDir()).path
+        self.flags(image_preseed_max_disk_gb=2,
+                   image_preseed_max_mb_per_second=10)
+        self.image_cache_manager = imagecache.ImageCacheManager()
+        self.sizes = {'a': units.Gi, 'b': 3 * units.Gi, 'c': units.Gi}
+
+    def _base_file(self, image_id):
+        return os.path.join(self.base_dir, hashlib.sha1(image_id).hexdigest())
+
+    def _preseed(self, image_ids, fetched=None):
+        locked = []
+
+        def fake_synchronized(name, external=False, lock_path=None):
+            def wrap(f):
+                def inner(*args, **kwargs):
+                    locked.append(name)
+                    try:
+                        return f(*args, **kwargs)
+                    finally:
+                        locked.remove(name)
+                return inner
+            return wrap
+
+        def fake_fetch(context, image_id, path, user_id, project_id,
+                       max_rate=0):
+            # Throttled downloads must not hold up the boots
+            self.assertEqual([], locked)
+            with open(path, 'w') as f:
+                f.write(image_id)
+            if fetched:
+                fetched(image_id)
+
+        with contextlib.nested(
+            mock.patch.object(self.image_cache_manager, '_get_image_size',
+                              side_effect=lambda c, i: self.sizes[i]),
+            mock.patch.object(imagecache.images, 'fetch_to_raw',
+                              side_effect=fake_fetch),
+            mock.patch.object(imagecache.utils, 'synchronized',
+                              side_effect=fake_synchronized)
+        ) as (mock_size, mock_fetch, mock_synchronized):
+            self.image_cache_manager._preseed(self.context, image_ids,
+                                              self.base_dir)
+        return mock_fetch
+
+    def test_preseed_within_budget(self):
+        mock_fetch = self._preseed(['a', 'b', 'c'])
+        self.assertEqual(
+            [mock.call(self.context, image_id,
+                       self._base_file(image_id) + '.preseed',
+                       None, None, max_rate=10 * units.Mi)
+             for image_id in ['a', 'c']],
+            mock_fetch.call_args_list)
+        self.assertEqual(set(['a', 'c']),
+                         self.image_cache_manager.preseeded_images)
+        with open(self._base_file('a')) as f:
+            self.assertEqual('a', f.read())
+        self.assertFalse(os.path.exists(self._base_file('b')))
+        self.assertEqual(sorted([os.path.basename(self._base_file('a')),
+                                 os.path.basename(self._base_file('c'))]),
+                         sorted(os.listdir(self.base_dir)))
+
+    def test_preseed_image_fetched_by_instance(self):
+        def fetched_by_instance(image_id):
+            # An instance needed the image and fetched it meanwhile
+            with open(self._base_file(image_id), 'w') as f:
+                f.write('instance')
+
+        self._preseed(['a'], fetched=fetched_by_instance)
+        self.assertEqual(set(['a']),
+                         self.image_cache_manager.preseeded_images)
+        with open(self._base_file('a')) as f:
+            self.assertEqual('instance', f.read())
+        self.assertEqual([os.path.basename(self._base_file('a'))],
+                         os.listdir(self.base_dir))
+
+    def test_preseed_cached_image(self):
+        with open(self._base_file('a'), 'w') as f:
+            f.write('a')
+        os.utime(self._base_file('a'), (-1, time.time() - 3600))
+
+        mock_fetch = self._preseed(['a'])
+        self.assertFalse(mock_fetch.called)
+        self.assertEqual(set(['a']),
+                         self.image_cache_manager.preseeded_images)
+        # Touched, so the cache manager keeps it as long as it is wanted
+        self.assertTrue(os.path.getmtime(self._base_file('a')) >
+                        time.time() - 60)
+
+    def test_preseed_failure_skips_image(self):
+        # Not in the image service
+        del self.sizes['a']
+        self._preseed(['a', 'c'])
+        self.assertEqual(set(['c']),
+                         self.image_cache_manager.preseeded_images)
+
+    def test_preseed_single_pass(self):
+        self.flags(instances_path=self.base_dir)
+        with mock.patch.object(self.image_cache_manager,
+                               '_preseed') as mock_preseed:
+            self.image_cache_manager.preseed(self.context, ['a'])
+            thread = self.image_cache_manager._preseed_thread
+            # A pass is still running, so this one is skipped
+            self.image_cache_manager.preseed(self.context, ['a'])
+            thread.wait()
+        mock_preseed.assert_called_once_with(
+            self.context, ['a'],
+            os.path.join(self.base_dir, CONF.image_cache_subdirectory_name))
+        self.assertIsNone(self.image_cache_manager._preseed_thread)
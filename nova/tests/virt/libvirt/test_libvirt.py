@@ -392,6 +392,8 @@ class LibvirtConnTestCase(test.TestCase):
         temp_dir = self.useFixture(fixtures.TempDir()).path
         self.flags(instances_path=temp_dir)
         self.flags(snapshots_directory=temp_dir, group='libvirt')
+        # The tests stub out _conn, so it has to serve the queries too
+        self.flags(read_only_connections=0, group='libvirt')
         self.useFixture(fixtures.MonkeyPatch(
             'nova.virt.libvirt.driver.libvirt_utils',
             fake_libvirt_utils))
@@ -798,6 +800,21 @@ class LibvirtConnTestCase(test.TestCase):
             self.assertTrue(service_mock.disabled)
             conn._get_connection()
 
+    def test_new_connection_invalidates_host_caches(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        conn._caps = 'caps'
+        conn._host_state = mock.Mock()
+        service_mock = mock.MagicMock()
+        service_mock.disabled.return_value = False
+        with contextlib.nested(
+            mock.patch.object(conn, "_connect", return_value=self.conn),
+            mock.patch.object(service_obj.Service, "get_by_compute_host",
+                              return_value=service_mock)):
+            conn._get_connection()
+
+        self.assertIsNone(conn._caps)
+        conn._host_state.invalidate.assert_called_once_with()
+
     def test_close_callback_bad_signature(self):
         '''Validates that a connection to libvirt exist,
            even when registerCloseCallback method has a different
@@ -2083,6 +2100,44 @@ class LibvirtConnTestCase(test.TestCase):
         self.assertEqual(conf.cpu.mode, "host-model")
         self.assertIsNone(conf.cpu.model)
 
+    def test_get_guest_cpu_config_cached(self):
+        self.flags(cpu_mode="custom",
+                   cpu_model="Penryn",
+                   group='libvirt')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+
+        with mock.patch.object(conn, 'has_min_version',
+                               return_value=True) as has_min_version:
+            cpu1 = conn.get_guest_cpu_config()
+            cpu2 = conn.get_guest_cpu_config()
+            self.assertEqual(1, has_min_version.call_count)
+            self.assertIsNot(cpu1, cpu2)
+            self.assertEqual(cpu1.to_xml(), cpu2.to_xml())
+
+            self.flags(cpu_model="Nehalem", group='libvirt')
+            self.assertEqual("Nehalem", conn.get_guest_cpu_config().model)
+            self.assertEqual(2, has_min_version.call_count)
+
+    def test_get_guest_config_unchanged_device_names(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        instance_ref = db.instance_create(self.context, self.test_instance)
+        instance_ref['root_device_name'] = '/dev/vda'
+        instance_ref['default_ephemeral_device'] = '/dev/vdb'
+
+        disk_info = blockinfo.get_disk_info(CONF.libvirt.virt_type,
+                                            instance_ref)
+        with mock.patch.object(conn.virtapi,
+                               'instance_update') as instance_update:
+            conn.get_guest_config(instance_ref,
+                                  _fake_network_info(self.stubs, 1),
+                                  None, disk_info)
+            instance_ref['root_device_name'] = '/dev/sda'
+            conn.get_guest_config(instance_ref,
+                                  _fake_network_info(self.stubs, 1),
+                                  None, disk_info)
+        instance_update.assert_called_once_with(
+            mock.ANY, instance_ref['uuid'], {'root_device_name': '/dev/vda'})
+
     def test_get_guest_cpu_config_default_uml(self):
         self.flags(virt_type="uml",
                    cpu_mode=None,
@@ -4014,6 +4069,121 @@ class LibvirtConnTestCase(test.TestCase):
 
         db.instance_destroy(self.context, instance_ref['uuid'])
 
+    def _test_live_migration_monitor(self, samples):
+        """Run the live migration monitor over (time, job info) samples."""
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        dom = mock.Mock()
+        dom.jobInfo.side_effect = [info for now, info in samples]
+        migration = mock.Mock()
+        type(migration).dead = mock.PropertyMock(
+            side_effect=[False] * len(samples) + [True])
+        times = [0] + [now for now, info in samples]
+        with contextlib.nested(
+                mock.patch.object(greenthread, 'sleep'),
+                mock.patch.object(libvirt_driver, 'time'),
+                mock.patch.object(conn.virtapi, 'instance_update')
+        ) as (mock_sleep, mock_time, mock_update):
+            mock_time.time.side_effect = times
+            conn._live_migration_monitor(self.context, {'uuid': 'fake'},
+                                         dom, migration)
+        return dom, mock_update
+
+    def _job_info(self, processed, remaining):
+        return [2, 0, 0, units.Gi, int(processed * units.Gi),
+                int(remaining * units.Gi)]
+
+    def test_live_migration_downtime_steps(self):
+        self.flags(live_migration_downtime=400,
+                   live_migration_downtime_steps=4,
+                   live_migration_downtime_delay=10, group='libvirt')
+        self.assertEqual([(0, 100), (20, 200), (40, 300), (60, 400)],
+                         libvirt_driver.LibvirtDriver.
+                         _live_migration_downtime_steps(2))
+
+    def test_live_migration_monitor_downtime_and_progress(self):
+        self.flags(live_migration_downtime=300,
+                   live_migration_downtime_steps=3,
+                   live_migration_downtime_delay=10, group='libvirt')
+        dom, mock_update = self._test_live_migration_monitor(
+            [(1, self._job_info(0.25, 0.75)),
+             (11, self._job_info(0.5, 0.5)),
+             (21, self._job_info(0.75, 0.5))])
+        self.assertEqual([mock.call(100, 0), mock.call(200, 0),
+                          mock.call(300, 0)],
+                         dom.migrateSetMaxDowntime.call_args_list)
+        self.assertEqual([mock.call(mock.ANY, 'fake', {'progress': 25}),
+                          mock.call(mock.ANY, 'fake', {'progress': 50})],
+                         mock_update.call_args_list)
+        self.assertFalse(dom.migrateSetMaxSpeed.called)
+        self.assertFalse(dom.abortJob.called)
+
+    def test_live_migration_monitor_raises_bandwidth(self):
+        self.flags(live_migration_bandwidth_max=1000,
+                   live_migration_downtime_steps=1, group='libvirt')
+        dom, mock_update = self._test_live_migration_monitor(
+            [(1, self._job_info(0.1, 0.9)),
+             (2, self._job_info(0.2, 0.9)),
+             (3, self._job_info(0.3, 0.9))])
+        dom.migrateSetMaxSpeed.assert_called_once_with(1000, 0)
+        self.assertFalse(dom.abortJob.called)
+
+    def test_live_migration_monitor_aborts_without_progress(self):
+        self.flags(live_migration_progress_timeout=10, group='libvirt')
+        dom, mock_update = self._test_live_migration_monitor(
+            [(1, self._job_info(0.5, 0.5)),
+             (5, self._job_info(0.6, 0.6)),
+             (12, self._job_info(0.7, 0.6))])
+        dom.abortJob.assert_called_once_with()
+        self.assertFalse(dom.migrateSetMaxSpeed.called)
+
+    def test_live_migration_monitor_survives_failing_calls(self):
+        self.flags(live_migration_downtime_steps=1,
+                   live_migration_progress_timeout=10, group='libvirt')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        dom = mock.Mock()
+        dom.jobInfo.side_effect = [self._job_info(0.5, 0.5),
+                                   self._job_info(0.6, 0.6)]
+        dom.migrateSetMaxDowntime.side_effect = libvirt.libvirtError('ERR')
+        dom.abortJob.side_effect = libvirt.libvirtError('ERR')
+        migration = mock.Mock()
+        migration.dead = False
+        with contextlib.nested(
+                mock.patch.object(greenthread, 'sleep'),
+                mock.patch.object(libvirt_driver, 'time'),
+                mock.patch.object(conn.virtapi, 'instance_update',
+                                  side_effect=test.TestingException)
+        ) as (mock_sleep, mock_time, mock_update):
+            mock_time.time.side_effect = [0, 1, 12]
+            conn._live_migration_monitor(self.context, {'uuid': 'fake'},
+                                         dom, migration)
+        dom.migrateSetMaxDowntime.assert_called_once_with(
+            CONF.libvirt.live_migration_downtime, 0)
+        dom.abortJob.assert_called_once_with()
+
+    def test_live_migration_monitor_failure_does_not_roll_back(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instance = dict(self.test_instance, name='fake')
+        dom = mock.Mock()
+        migration = mock.Mock()
+        post_method = mock.Mock()
+        recover_method = mock.Mock()
+        with contextlib.nested(
+                mock.patch.object(conn, '_lookup_by_name', return_value=dom),
+                mock.patch.object(greenthread, 'spawn',
+                                  return_value=migration),
+                mock.patch.object(conn, '_live_migration_monitor',
+                                  side_effect=test.TestingException),
+                mock.patch.object(conn, 'get_info',
+                                  side_effect=exception.InstanceNotFound(
+                                      instance_id='fake'))
+        ):
+            conn._live_migration(self.context, instance, 'dest',
+                                 post_method, recover_method)
+        migration.wait.assert_called_once_with()
+        self.assertFalse(recover_method.called)
+        post_method.assert_called_once_with(self.context, instance,
+                                            'dest', False, None)
+
     def test_rollback_live_migration_at_destination(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         with mock.patch.object(conn, "destroy") as mock_destroy:
@@ -4991,8 +5161,43 @@ class LibvirtConnTestCase(test.TestCase):
         conn._close_callback(mock_failed_conn, reason=None, opaque=None)
         conn._dispatch_events()
 
+    def test_read_only_connections_round_robin(self):
+        self.flags(read_only_connections=2, group='libvirt')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        ro_conns = [mock.Mock(), mock.Mock()]
+        with contextlib.nested(
+            mock.patch.object(conn, '_connect', side_effect=ro_conns),
+            mock.patch.object(conn, '_test_connection', return_value=True)
+        ) as (mock_connect, mock_test):
+            self.assertEqual(ro_conns + ro_conns[:1],
+                             [conn._ro_conn for i in range(3)])
+        self.assertEqual([mock.call(conn.uri(), True)] * 2,
+                         mock_connect.call_args_list)
+
+    def test_read_only_connection_reopened_when_broken(self):
+        self.flags(read_only_connections=1, group='libvirt')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        ro_conns = [mock.Mock(), mock.Mock()]
+        with contextlib.nested(
+            mock.patch.object(conn, '_connect', side_effect=ro_conns),
+            mock.patch.object(conn, '_test_connection', return_value=False)
+        ) as (mock_connect, mock_test):
+            self.assertEqual(ro_conns[0], conn._ro_conn)
+            self.assertEqual(ro_conns[1], conn._ro_conn)
+        mock_test.assert_called_once_with(ro_conns[0])
+
+    def test_read_only_connections_disabled(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with contextlib.nested(
+            mock.patch.object(libvirt_driver.LibvirtDriver, '_conn',
+                              mock.sentinel.conn),
+            mock.patch.object(conn, '_connect')
+        ) as (mock_conn, mock_connect):
+            self.assertEqual(mock.sentinel.conn, conn._ro_conn)
+        self.assertFalse(mock_connect.called)
+
     def test_immediate_delete(self):
-        def fake_lookup_by_name(instance_name):
+        def fake_lookup_by_name(instance_name, read_only=False):
             raise exception.InstanceNotFound(instance_id=instance_name)
 
         def fake_delete_instance_files(instance):
@@ -6399,6 +6604,20 @@ class LibvirtConnTestCase(test.TestCase):
         self.assertEqual(got_events[0].transition,
                          virtevent.EVENT_LIFECYCLE_STOPPED)
 
+    def test_event_lifecycle_numbered(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        got_events = []
+        conn.register_event_listener(got_events.append)
+        conn._init_events_pipe()
+        dom = FakeVirtDomain(uuidstr="cef19ce0-0ca2-11df-855d-b19fbce37686")
+        for event in (libvirt.VIR_DOMAIN_EVENT_STARTED,
+                      libvirt.VIR_DOMAIN_EVENT_STOPPED):
+            conn._event_lifecycle_callback(conn._conn, dom, event, 0, conn)
+        conn._dispatch_events()
+        self.assertEqual([1, 2], [e.get_sequence() for e in got_events])
+        self.assertEqual([conn._event_generation] * 2,
+                         [e.get_generation() for e in got_events])
+
     def test_set_cache_mode(self):
         self.flags(disk_cachemodes=['file=directsync'], group='libvirt')
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
@@ -6478,7 +6697,7 @@ class LibvirtConnTestCase(test.TestCase):
         self.assertEqual(expect, info)
         dom_mock.info.assert_called_once_with()
         dom_mock.ID.assert_called_once_with()
-        lookup_mock.assert_called_once_with(instance['name'])
+        lookup_mock.assert_called_once_with(instance['name'], read_only=True)
 
     def test_create_domain_define_xml_fails(self):
         """Tests that the xml is logged when defining the domain fails."""
@@ -7180,6 +7399,29 @@ class HostStateTestCase(test.TestCase):
         self.assertEqual(jsonutils.loads(stats["pci_passthrough_devices"]),
                          HostStateTestCase.pci_devices)
 
+    def test_update_status_caches_static_stats(self):
+        driver = self.FakeConnection()
+        with contextlib.nested(
+            mock.patch.object(driver, 'get_cpu_info',
+                              return_value=self.cpu_info),
+            mock.patch.object(driver, 'get_vcpu_used', return_value=0),
+        ) as (get_cpu_info, get_vcpu_used):
+            hs = libvirt_driver.HostState(driver)
+            self.assertIn('static', hs.timings)
+            hs.update_status()
+            self.assertNotIn('static', hs.timings)
+            self.assertEqual(1, get_cpu_info.call_count)
+            self.assertEqual(2, get_vcpu_used.call_count)
+
+            hs.invalidate()
+            stats = hs.get_host_stats(refresh=True)
+            self.assertEqual(2, get_cpu_info.call_count)
+            self.assertEqual(3, get_vcpu_used.call_count)
+        self.assertEqual(self.cpu_info, stats['cpu_info'])
+        self.assertEqual(['disk_available_least', 'local_gb',
+                          'memory_mb_used', 'static', 'vcpus_used'],
+                         sorted(hs.timings))
+
 
 class NWFilterFakes:
     def __init__(self):
@@ -7416,6 +7658,118 @@ class IptablesFirewallTestCase(test.TestCase):
                         "TCP port 80/81 acceptance rule wasn't added")
         db.instance_destroy(admin_ctxt, instance_ref['uuid'])
 
+    def _setup_ipset_groups(self):
+        self.flags(firewall_use_ipset=True)
+        from nova.network import linux_net
+        self.stubs.Set(linux_net, 'iptables_manager',
+                       linux_net.IptablesManager())
+        self.fw = firewall.IptablesFirewallDriver(
+                      fake.FakeVirtAPI(),
+                      get_connection=lambda: self.fake_libvirt_connection)
+        instance_ref = self._create_instance_ref()
+        src_instance_ref = self._create_instance_ref()
+
+        admin_ctxt = context.get_admin_context()
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgroup',
+                                             'description': 'test group'})
+        src_secgroup = db.security_group_create(admin_ctxt,
+                                                {'user_id': 'fake',
+                                                 'project_id': 'fake',
+                                                 'name': 'testsourcegroup',
+                                                 'description': 'src group'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 80,
+                                       'to_port': 81,
+                                       'group_id': src_secgroup['id']})
+        db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                       secgroup['id'])
+        db.instance_add_security_group(admin_ctxt, src_instance_ref['uuid'],
+                                       src_secgroup['id'])
+        instance_ref = db.instance_get(admin_ctxt, instance_ref['id'])
+
+        self.ipset_input = []
+
+        def fake_execute(*cmd, **kwargs):
+            self.assertEqual(('ipset', '-exist', 'restore'), cmd)
+            self.ipset_input.append(kwargs['process_input'].splitlines())
+
+        self.stubs.Set(utils, 'execute', fake_execute)
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+        return instance_ref, src_secgroup['id']
+
+    def _set_member_ips(self, *ips):
+        member_nw_info = network_model.NetworkInfo([network_model.VIF(
+            network=network_model.Network(subnets=[network_model.Subnet(
+                cidr='10.0.0.0/24', ips=[network_model.FixedIP(address=ip)
+                                         for ip in ips])]))])
+        from nova.compute import utils as compute_utils
+        self.stubs.Set(compute_utils, 'get_nw_info_for_instance',
+                       lambda instance: member_nw_info)
+
+    def test_instance_rules_ipset(self):
+        instance_ref, group_id = self._setup_ipset_groups()
+        self._set_member_ips('10.0.0.2', '10.0.0.3')
+        name = 'nova-sg4-%s' % group_id
+
+        network_info = _fake_network_info(self.stubs, 1)
+        ipv4_rules, ipv6_rules = self.fw.instance_rules(instance_ref,
+                                                        network_info)
+        self.assertIn('-j ACCEPT -p tcp -m multiport --dports 80:81 '
+                      '-m set --match-set %s src' % name, ipv4_rules)
+        self.assertFalse([rule for rule in ipv4_rules if '10.0.0.2' in rule])
+        self.assertEqual([['create %s-new hash:ip family inet' % name,
+                           'flush %s-new' % name,
+                           'add %s-new 10.0.0.2' % name,
+                           'add %s-new 10.0.0.3' % name,
+                           'create %s hash:ip family inet' % name,
+                           'swap %s-new %s' % (name, name),
+                           'destroy %s-new' % name]], self.ipset_input)
+        self.assertEqual({name: set(['10.0.0.2', '10.0.0.3'])},
+                         self.fw.ipsets)
+
+    def test_refresh_security_group_members_ipset(self):
+        instance_ref, group_id = self._setup_ipset_groups()
+        self._set_member_ips('10.0.0.2', '10.0.0.3')
+        name = 'nova-sg4-%s' % group_id
+        network_info = _fake_network_info(self.stubs, 1)
+        self.fw.prepare_instance_filter(instance_ref, network_info)
+        self.ipset_input = []
+
+        def fail_refresh(*args, **kwargs):
+            self.fail('instance chains rebuilt')
+
+        self.stubs.Set(self.fw, 'do_refresh_security_group_rules',
+                       fail_refresh)
+        self.stubs.Set(self.fw.iptables, 'apply', fail_refresh)
+        self._set_member_ips('10.0.0.3', '10.0.0.4')
+        self.fw.refresh_security_group_members(group_id)
+        self.assertEqual([['add %s 10.0.0.4' % name,
+                           'del %s 10.0.0.2' % name]], self.ipset_input)
+
+        # nothing is run for groups that no rule on this host refers to
+        self.ipset_input = []
+        self.fw.refresh_security_group_members(group_id + 1)
+        self.assertEqual([], self.ipset_input)
+
+    def test_unfilter_instance_destroys_ipsets(self):
+        instance_ref, group_id = self._setup_ipset_groups()
+        self._set_member_ips('10.0.0.2')
+        network_info = _fake_network_info(self.stubs, 1)
+        self.stubs.Set(self.fw.nwfilter, 'unfilter_instance',
+                       lambda instance, network_info: None)
+        self.fw.prepare_instance_filter(instance_ref, network_info)
+        self.ipset_input = []
+
+        self.fw.unfilter_instance(instance_ref, network_info)
+        self.assertEqual([['destroy nova-sg4-%s' % group_id]],
+                         self.ipset_input)
+        self.assertEqual({}, self.fw.ipsets)
+
     def test_filters_for_instance_with_ip_v6(self):
         self.flags(use_ipv6=True)
         network_info = _fake_network_info(self.stubs, 1)
@@ -8780,7 +9134,7 @@ class LibvirtVolumeUsageTestCase(test.TestCase):
         self.assertEqual(vol_usage, expected_usage)
 
     def test_get_all_volume_usage_device_not_found(self):
-        def fake_lookup(instance_name):
+        def fake_lookup(instance_name, read_only=False):
             raise libvirt.libvirtError('invalid path')
 
         self.stubs.Set(self.conn, '_lookup_by_name', fake_lookup)
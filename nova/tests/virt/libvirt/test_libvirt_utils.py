@@ -22,6 +22,7 @@ from oslo.config import cfg
 
 from nova import exception
 from nova.openstack.common import processutils
+from nova.openstack.common import units
 from nova import test
 from nova import utils
 from nova.virt.libvirt import utils as libvirt_utils
@@ -261,3 +262,54 @@ blah BLAH: bb
             mock.call('scp', 'src', 'host:dest'),
         ])
         self.assertEqual(2, mock_execute.call_count)
+
+    @mock.patch.object(libvirt_utils, '_reflink_unsupported', set())
+    @mock.patch('nova.utils.execute')
+    def test_clone_image_reflink(self, mock_execute):
+        with utils.tempdir() as tmpdir:
+            src = os.path.join(tmpdir, 'src')
+            dest = os.path.join(tmpdir, 'dest')
+            open(src, 'w').close()
+
+            self.assertEqual('reflink', libvirt_utils.clone_image(src, dest))
+        mock_execute.assert_called_once_with('cp', '--reflink=always',
+                                             src, dest)
+
+    @mock.patch.object(libvirt_utils, '_reflink_unsupported', set())
+    @mock.patch('nova.utils.execute')
+    def test_clone_image_sparse(self, mock_execute):
+        mock_execute.side_effect = [
+            processutils.ProcessExecutionError,
+            mock.DEFAULT,
+            mock.DEFAULT,
+        ]
+        with utils.tempdir() as tmpdir:
+            src = os.path.join(tmpdir, 'src')
+            dest = os.path.join(tmpdir, 'dest')
+            open(src, 'w').close()
+
+            self.assertEqual('sparse', libvirt_utils.clone_image(src, dest))
+            # Reflinks are not tried again on the same filesystem
+            self.assertEqual('sparse', libvirt_utils.clone_image(src, dest))
+        mock_execute.assert_has_calls([
+            mock.call('cp', '--reflink=always', src, dest),
+            mock.call('cp', '--sparse=always', src, dest),
+            mock.call('cp', '--sparse=always', src, dest),
+        ])
+        self.assertEqual(3, mock_execute.call_count)
+
+    def test_clone_image_keeps_holes(self):
+        with utils.tempdir() as tmpdir:
+            src = os.path.join(tmpdir, 'src')
+            dest = os.path.join(tmpdir, 'dest')
+            with open(src, 'wb') as f:
+                f.write('canary')
+                f.write('\0' * units.Mi)
+                f.truncate(64 * units.Mi)
+
+            libvirt_utils.clone_image(src, dest)
+
+            with open(dest, 'rb') as f:
+                self.assertEqual('canary', f.read(6))
+            self.assertEqual(64 * units.Mi, os.path.getsize(dest))
+            self.assertTrue(os.stat(dest).st_blocks * 512 < units.Mi)
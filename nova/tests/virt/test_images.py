@@ -12,13 +12,114 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import contextlib
+import os
+
+import mock
 
 from nova import test
+from nova import utils
 from nova.virt import images
 
 
 class QemuTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(QemuTestCase, self).setUp()
+        self.stubs.Set(images, '_info_cache', collections.OrderedDict())
+
     def test_qemu_info_with_bad_path(self):
         image_info = images.qemu_img_info("/path/that/does/not/exist")
         self.assertTrue(image_info)
         self.assertTrue(str(image_info))
+
+    def _write_qcow2(self, path, backing_file=None, nb_snapshots=0):
+        backing_file_offset = backing_file and images.QCOW2_HEADER.size or 0
+        header = images.QCOW2_HEADER.pack(
+            images.QCOW2_MAGIC, 2, backing_file_offset,
+            len(backing_file or ''), 16, 10 * 1024 * 1024, 0, 1, 0x30000,
+            0x10000, 1, nb_snapshots, 0)
+        with open(path, 'wb') as f:
+            f.write(header + (backing_file or ''))
+
+    @mock.patch.object(utils, 'execute')
+    def test_qemu_info_qcow2(self, mock_execute):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self._write_qcow2(path, backing_file='base')
+            image_info = images.qemu_img_info(path)
+        self.assertEqual('qcow2', image_info.file_format)
+        self.assertEqual(10 * 1024 * 1024, image_info.virtual_size)
+        self.assertEqual(65536, image_info.cluster_size)
+        self.assertEqual(os.path.join(tmpdir, 'base'),
+                         image_info.backing_file)
+        self.assertFalse(mock_execute.called)
+
+    @mock.patch.object(utils, 'execute')
+    def test_qemu_info_raw(self, mock_execute):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            with open(path, 'wb') as f:
+                f.truncate(4096)
+            image_info = images.qemu_img_info(path)
+        self.assertEqual('raw', image_info.file_format)
+        self.assertEqual(4096, image_info.virtual_size)
+        self.assertIsNone(image_info.backing_file)
+        self.assertFalse(mock_execute.called)
+
+    @mock.patch.object(utils, 'execute')
+    def test_qemu_info_qcow2_snapshots(self, mock_execute):
+        mock_execute.return_value = ('file format: qcow2\n'
+                                     'virtual size: 1M (1048576 bytes)\n',
+                                     '')
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self._write_qcow2(path, nb_snapshots=1)
+            image_info = images.qemu_img_info(path)
+        self.assertEqual(1048576, image_info.virtual_size)
+        mock_execute.assert_called_once_with('env', 'LC_ALL=C', 'LANG=C',
+                                             'qemu-img', 'info', path)
+
+    @mock.patch.object(utils, 'execute')
+    def test_qemu_info_cached_until_changed(self, mock_execute):
+        mock_execute.return_value = ('file format: vmdk\n'
+                                     'virtual size: 1M (1048576 bytes)\n',
+                                     '')
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            with open(path, 'wb') as f:
+                f.write('KDMV')
+            self.assertEqual('vmdk', images.qemu_img_info(path).file_format)
+            self.assertEqual('vmdk', images.qemu_img_info(path).file_format)
+            self.assertEqual(1, mock_execute.call_count)
+
+            with open(path, 'ab') as f:
+                f.write('more')
+            self.assertEqual('vmdk', images.qemu_img_info(path).file_format)
+            self.assertEqual(2, mock_execute.call_count)
+
+
+class FetchTestCase(test.NoDBTestCase):
+
+    def test_fetch_rate_limited(self):
+        image_service = mock.Mock()
+
+        def fake_download(context, image_id, data=None, dst_path=None):
+            self.assertIsNone(dst_path)
+            for chunk in ['a' * 512, 'b' * 512]:
+                data.write(chunk)
+
+        image_service.download.side_effect = fake_download
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            with contextlib.nested(
+                mock.patch.object(images.glance, 'get_remote_image_service',
+                                  return_value=(image_service, 'fake')),
+                mock.patch.object(images.time, 'time', return_value=0),
+                mock.patch.object(images.time, 'sleep')
+            ) as (mock_service, mock_time, mock_sleep):
+                images.fetch(None, 'fake', path, None, None, max_rate=1024)
+            with open(path) as f:
+                self.assertEqual('a' * 512 + 'b' * 512, f.read())
+        self.assertEqual([mock.call(0.5), mock.call(1.0)],
+                         mock_sleep.call_args_list)
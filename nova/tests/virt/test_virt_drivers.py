@@ -749,6 +749,9 @@ class LibvirtConnTestCase(_VirtDriverTestCase, test.TestCase):
         super(LibvirtConnTestCase, self).setUp()
         self.stubs.Set(self.connection,
                        '_set_host_enabled', mock.MagicMock())
+        # fakelibvirt connections do not share their domains, so the
+        # queries have to run on the read-write connection
+        self.connection._ro_conns = []
         self.useFixture(fixtures.MonkeyPatch(
             'nova.context.get_admin_context',
             self._fake_admin_context))
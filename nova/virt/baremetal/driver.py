@@ -114,6 +114,7 @@ class BareMetalDriver(driver.ComputeDriver):
     capabilities = {
         "has_imagecache": True,
         "supports_recreate": False,
+        "has_numbered_events": False,
         }
 
     def __init__(self, virtapi, read_only=False):
@@ -136,6 +136,7 @@ class ComputeDriver(object):
     capabilities = {
         "has_imagecache": False,
         "supports_recreate": False,
+        "has_numbered_events": False,
         }
 
     def __init__(self, virtapi):
@@ -1108,6 +1109,17 @@ class ComputeDriver(object):
         """
         pass
 
+    def preseed_image_cache(self, context, image_ids):
+        """Download the most used images into the driver's image cache.
+
+        Drivers that cache images on disk can fetch popular images ahead
+        of the first instance that boots them on this host, so that boot
+        does not wait for the download.
+
+        :param image_ids: IDs of the images to download, most wanted first
+        """
+        pass
+
     def add_to_aggregate(self, context, aggregate, host, **kwargs):
         """Add a compute host to an aggregate."""
         #NOTE(jogo) Currently only used for XenAPI-Pool
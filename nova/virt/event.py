@@ -36,17 +36,34 @@ class Event(object):
     information recorded in the base class is a timestamp
     indicating when the event first occurred. The timestamp
     is recorded as fractional seconds since the UNIX epoch.
+
+    Drivers which can guarantee ordered delivery may also
+    stamp each event with a generation and a sequence number.
+    The sequence number increases by one for every event the
+    driver emits, and the generation changes whenever the
+    driver may have lost events (for example after it had to
+    reconnect to the hypervisor). This lets the receiver
+    detect missed events. Both are None for drivers which do
+    not number their events.
     """
 
-    def __init__(self, timestamp=None):
+    def __init__(self, timestamp=None, generation=None, sequence=None):
         if timestamp is None:
             self.timestamp = time.time()
         else:
             self.timestamp = timestamp
+        self.generation = generation
+        self.sequence = sequence
 
     def get_timestamp(self):
         return self.timestamp
 
+    def get_generation(self):
+        return self.generation
+
+    def get_sequence(self):
+        return self.sequence
+
 
 class InstanceEvent(Event):
     """Base class for all instance events.
@@ -57,8 +74,9 @@ class InstanceEvent(Event):
     the UUID associated with the instance.
     """
 
-    def __init__(self, uuid, timestamp=None):
-        super(InstanceEvent, self).__init__(timestamp)
+    def __init__(self, uuid, timestamp=None, generation=None,
+                 sequence=None):
+        super(InstanceEvent, self).__init__(timestamp, generation, sequence)
 
         self.uuid = uuid
 
@@ -76,8 +94,10 @@ class LifecycleEvent(InstanceEvent):
     without need for polling.
     """
 
-    def __init__(self, uuid, transition, timestamp=None):
-        super(LifecycleEvent, self).__init__(uuid, timestamp)
+    def __init__(self, uuid, transition, timestamp=None, generation=None,
+                 sequence=None):
+        super(LifecycleEvent, self).__init__(uuid, timestamp, generation,
+                                             sequence)
 
         self.transition = transition
 
@@ -85,6 +85,7 @@ class FakeDriver(driver.ComputeDriver):
     capabilities = {
         "has_imagecache": True,
         "supports_recreate": True,
+        "has_numbered_events": False,
         }
 
     """Fake hypervisor driver."""
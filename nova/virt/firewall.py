@@ -38,6 +38,11 @@ firewall_opts = [
     cfg.BoolOpt('allow_same_net_traffic',
                 default=True,
                 help='Whether to allow network traffic from same network'),
+    cfg.BoolOpt('firewall_use_ipset',
+                default=False,
+                help='Keep the member IPs of security groups in ipset sets '
+                     'that the iptables rules match on, so membership '
+                     'changes do not rebuild the instance chains'),
 ]
 
 CONF = cfg.CONF
@@ -146,6 +151,12 @@ class IptablesFirewallDriver(FirewallDriver):
         self.network_infos = {}
         self.basically_filtered = False
 
+        self.use_ipset = CONF.firewall_use_ipset
+        # ipset name -> member IPs loaded into it
+        self.ipsets = {}
+        # instance id -> names of the ipsets its rules match on
+        self.instance_ipsets = {}
+
         # Flags for DHCP request rule
         self.dhcp_create = False
         self.dhcp_created = False
@@ -174,6 +185,7 @@ class IptablesFirewallDriver(FirewallDriver):
             self.network_infos.pop(instance['id'])
             self.remove_filters_for_instance(instance)
             self.iptables.apply()
+            self.destroy_unused_ipsets()
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
                      'filtered'), instance=instance)
@@ -331,6 +343,81 @@ class IptablesFirewallDriver(FirewallDriver):
                     '--dports', '%s:%s' % (rule['from_port'],
                                            rule['to_port'])]
 
+    def _get_member_ips(self, ctxt, security_group_id, version):
+        """Return the fixed IPs of the members of a security group."""
+        insts = instance_obj.InstanceList.get_by_security_group_id(
+            ctxt, security_group_id)
+        ips = []
+        for instance in insts:
+            if instance['info_cache']['deleted']:
+                LOG.debug('ignoring deleted cache')
+                continue
+            nw_info = compute_utils.get_nw_info_for_instance(instance)
+
+            ips += [ip['address'] for ip in nw_info.fixed_ips()
+                    if ip['version'] == version]
+            LOG.debug('ips: %r', ips, instance=instance)
+        return ips
+
+    def _ipset_name(self, security_group_id, version):
+        # ipset names are limited to 31 characters
+        return 'nova-sg%d-%s' % (version, security_group_id)
+
+    def _execute_ipset(self, lines):
+        utils.execute('ipset', '-exist', 'restore',
+                      process_input='\n'.join(lines) + '\n',
+                      run_as_root=True)
+
+    def _sync_ipset(self, name, version, ips):
+        """Make the ipset hold exactly the given IPs.
+
+        A set this driver has not loaded yet, for instance one left over
+        from before a restart, is filled under a temporary name and
+        swapped in, so rules matching on it never see it half empty.
+        Afterwards only the differences are added and deleted.
+
+        """
+        ips = set(ips)
+        members = self.ipsets.get(name)
+        if members is None:
+            family = 'inet' if version == 4 else 'inet6'
+            new_name = '%s-new' % name
+            lines = ['create %s hash:ip family %s' % (new_name, family),
+                     'flush %s' % new_name]
+            lines += ['add %s %s' % (new_name, ip) for ip in sorted(ips)]
+            lines += ['create %s hash:ip family %s' % (name, family),
+                      'swap %s %s' % (new_name, name),
+                      'destroy %s' % new_name]
+        else:
+            lines = ['add %s %s' % (name, ip)
+                     for ip in sorted(ips - members)]
+            lines += ['del %s %s' % (name, ip)
+                      for ip in sorted(members - ips)]
+        if lines:
+            self._execute_ipset(lines)
+        self.ipsets[name] = ips
+
+    def destroy_unused_ipsets(self):
+        """Destroy the ipsets no filtered instance matches on anymore.
+
+        Has to be called after the iptables rules referencing them have
+        been applied, the kernel refuses to destroy a set still in use.
+
+        """
+        if not self.ipsets:
+            return
+        in_use = set()
+        for instance_id in self.instance_ipsets.keys():
+            if instance_id in self.instances:
+                in_use |= self.instance_ipsets[instance_id]
+            else:
+                del self.instance_ipsets[instance_id]
+        unused = [name for name in self.ipsets if name not in in_use]
+        if unused:
+            self._execute_ipset(['destroy %s' % name for name in unused])
+            for name in unused:
+                del self.ipsets[name]
+
     def instance_rules(self, instance, network_info):
         ctxt = context.get_admin_context()
         if isinstance(instance, dict):
@@ -341,6 +428,7 @@ class IptablesFirewallDriver(FirewallDriver):
 
         ipv4_rules = []
         ipv6_rules = []
+        ipsets = set()
 
         # Initialize with basic rules
         self._do_basic_rules(ipv4_rules, ipv6_rules, network_info)
@@ -402,21 +490,16 @@ class IptablesFirewallDriver(FirewallDriver):
                     fw_rules += [' '.join(args)]
                 else:
                     if rule['grantee_group']:
-                        insts = (
-                            instance_obj.InstanceList.get_by_security_group(
-                                ctxt, rule['grantee_group']))
-                        for instance in insts:
-                            if instance['info_cache']['deleted']:
-                                LOG.debug('ignoring deleted cache')
-                                continue
-                            nw_info = compute_utils.get_nw_info_for_instance(
-                                    instance)
-
-                            ips = [ip['address']
-                                for ip in nw_info.fixed_ips()
-                                    if ip['version'] == version]
-
-                            LOG.debug('ips: %r', ips, instance=instance)
+                        group_id = rule['grantee_group']['id']
+                        ips = self._get_member_ips(ctxt, group_id, version)
+                        if self.use_ipset:
+                            name = self._ipset_name(group_id, version)
+                            self._sync_ipset(name, version, ips)
+                            ipsets.add(name)
+                            subrule = args + ['-m set --match-set %s src' %
+                                              name]
+                            fw_rules += [' '.join(subrule)]
+                        else:
                             for ip in ips:
                                 subrule = args + ['-s %s' % ip]
                                 fw_rules += [' '.join(subrule)]
@@ -426,14 +509,34 @@ class IptablesFirewallDriver(FirewallDriver):
         ipv4_rules += ['-j $sg-fallback']
         ipv6_rules += ['-j $sg-fallback']
 
+        if self.use_ipset:
+            self.instance_ipsets[instance['id']] = ipsets
+
         return ipv4_rules, ipv6_rules
 
     def instance_filter_exists(self, instance, network_info):
         pass
 
     def refresh_security_group_members(self, security_group):
-        self.do_refresh_security_group_rules(security_group)
-        self.iptables.apply()
+        if self.use_ipset:
+            self.do_refresh_security_group_members(security_group)
+        else:
+            self.do_refresh_security_group_rules(security_group)
+            self.iptables.apply()
+
+    def do_refresh_security_group_members(self, security_group):
+        """Update the ipsets of a security group with its members.
+
+        The rules only reference the sets, so nothing else has to change.
+        Groups none of our instances' rules refer to have no sets here.
+
+        """
+        ctxt = context.get_admin_context()
+        for version in (4, 6):
+            name = self._ipset_name(security_group, version)
+            if name in self.ipsets:
+                ips = self._get_member_ips(ctxt, security_group, version)
+                self._sync_ipset(name, version, ips)
 
     def refresh_security_group_rules(self, security_group):
         self.do_refresh_security_group_rules(security_group)
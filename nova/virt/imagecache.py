@@ -41,6 +41,38 @@ imagecache_opts = [
                help='Unused unresized base images younger than this will not '
                     'be removed',
                deprecated_group='libvirt'),
+    cfg.IntOpt('image_preseed_interval',
+               default=-1,
+               help='Number of seconds between runs of the image pre-seeder, '
+                    'which downloads the images most used in the cell into '
+                    'the image cache ahead of the first boot needing them. '
+                    'A negative value disables it'),
+    cfg.IntOpt('image_preseed_popular_count',
+               default=5,
+               help='Number of the images used by most instances in the cell '
+                    'to pre-seed'),
+    cfg.ListOpt('image_preseed_images',
+                default=[],
+                help='IDs of images to pre-seed ahead of the most used ones'),
+    cfg.IntOpt('image_preseed_max_disk_gb',
+               default=20,
+               help='Maximum disk space, in GB, used by pre-seeded images'),
+    cfg.IntOpt('image_preseed_max_mb_per_second',
+               default=20,
+               help='Maximum rate in MB per second at which images are '
+                    'downloaded for pre-seeding. 0 means unlimited'),
+    cfg.StrOpt('image_preseed_admin_username',
+               help='Username the image pre-seeder authenticates to keystone '
+                    'with, so that glance accepts its downloads. Pre-seeding '
+                    'is skipped with keystone auth when this is not set'),
+    cfg.StrOpt('image_preseed_admin_password',
+               secret=True,
+               help='Password of image_preseed_admin_username'),
+    cfg.StrOpt('image_preseed_admin_tenant_name',
+               help='Tenant name of image_preseed_admin_username'),
+    cfg.StrOpt('image_preseed_admin_auth_url',
+               default='http://localhost:5000/v2.0',
+               help='Keystone URL the image pre-seeder authenticates to'),
     ]
 
 CONF = cfg.CONF
@@ -133,3 +165,7 @@ class ImageCacheManager(object):
         populated in the cached stats will be used for the cache management.
         """
         raise NotImplementedError()
+
+    def preseed(self, context, image_ids):
+        """Download the given images into the cache, most wanted first."""
+        raise NotImplementedError()
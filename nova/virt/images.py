@@ -19,7 +19,12 @@
 Handling of VM disk images.
 """
 
+import collections
+import copy
 import os
+import stat
+import struct
+import time
 
 from oslo.config import cfg
 
@@ -42,14 +47,121 @@ image_opts = [
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
 
+# The qcow2 header fields we need, see docs/specs/qcow2.txt in qemu
+QCOW2_HEADER = struct.Struct('>4sIQIIQIIQQIIQ')
+QCOW2_MAGIC = 'QFI\xfb'
+
+# Magic numbers of the other formats qemu-img can identify.  A file
+# starting with none of these is raw, as qemu-img would report it.
+OTHER_MAGICS = (
+    (0, 'KDMV'),                    # vmdk
+    (0, 'COWD'),                    # vmdk (ESX)
+    (0, '# Disk DescriptorFile'),   # vmdk descriptor
+    (0, 'conectix'),                # vpc
+    (0, 'vhdxfile'),                # vhdx
+    (0, 'QED\x00'),                 # qed
+    (0, 'LUKS\xba\xbe'),             # luks
+    (0, 'WithoutFreeSpace'),        # parallels
+    (0, 'WithouFreSpacExt'),        # parallels
+    (0, 'Bochs Virtual HD Image'),  # bochs
+    (0, '#!/bin/sh\n#V2.0 Format'),  # cloop
+    (64, '\x7f\x10\xda\xbe'),       # vdi
+)
+PROBE_SIZE = 512
+
+# Parsed image headers, by path, along with the (inode, mtime, size) of
+# the file when it was parsed
+_info_cache = collections.OrderedDict()
+_INFO_CACHE_SIZE = 1024
+
+
+def _inspect_image(path, st):
+    """Read the format, size and backing file of a qcow2 or raw image.
+
+    Returns None for images that need qemu-img to be described.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(PROBE_SIZE)
+        if header.startswith(QCOW2_MAGIC):
+            if len(header) < QCOW2_HEADER.size:
+                return None
+            (magic, version, backing_file_offset, backing_file_size,
+             cluster_bits, size, crypt_method, l1_size, l1_table_offset,
+             refcount_table_offset, refcount_table_clusters, nb_snapshots,
+             snapshots_offset) = QCOW2_HEADER.unpack_from(header)
+            if version not in (2, 3) or crypt_method or nb_snapshots:
+                return None
+            backing_file = None
+            if backing_file_offset:
+                f.seek(backing_file_offset)
+                backing_file = f.read(backing_file_size)
+                if not os.path.isabs(backing_file):
+                    backing_file = os.path.join(os.path.dirname(path),
+                                                backing_file)
+            info = imageutils.QemuImgInfo()
+            info.file_format = 'qcow2'
+            info.virtual_size = size
+            info.cluster_size = 1 << cluster_bits
+            info.backing_file = backing_file
+        else:
+            for offset, magic in OTHER_MAGICS:
+                if header[offset:offset + len(magic)] == magic:
+                    return None
+            info = imageutils.QemuImgInfo()
+            info.file_format = 'raw'
+            info.virtual_size = st.st_size
+    info.image = path
+    return info
+
+
+def _cached_img_info(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    key = (st.st_ino, st.st_mtime, st.st_size)
+    cached = _info_cache.get(path)
+    if cached and cached[0] == key:
+        info = cached[1]
+    else:
+        try:
+            info = _inspect_image(path, st)
+        except IOError:
+            info = None
+        if info is None:
+            out, err = utils.execute('env', 'LC_ALL=C', 'LANG=C',
+                                     'qemu-img', 'info', path)
+            info = imageutils.QemuImgInfo(out)
+        _info_cache.pop(path, None)
+        _info_cache[path] = (key, info)
+        if len(_info_cache) > _INFO_CACHE_SIZE:
+            _info_cache.popitem(last=False)
+
+    info = copy.copy(info)
+    # This changes as the instance writes to the disk
+    info.disk_size = st.st_blocks * 512
+    return info
+
 
 def qemu_img_info(path):
-    """Return an object containing the parsed output from qemu-img info."""
+    """Return an object containing the parsed output from qemu-img info.
+
+    The headers of qcow2 and raw images are read directly, and the result
+    for any image is cached until the file changes, so that qemu-img is
+    only run for other formats or for images that have been modified.
+    """
     # TODO(mikal): this code should not be referring to a libvirt specific
     # flag.
     if not os.path.exists(path) and CONF.libvirt.images_type != 'rbd':
         return imageutils.QemuImgInfo()
 
+    info = _cached_img_info(path)
+    if info is not None:
+        return info
+
     out, err = utils.execute('env', 'LC_ALL=C', 'LANG=C',
                              'qemu-img', 'info', path)
     return imageutils.QemuImgInfo(out)
@@ -61,7 +173,28 @@ def convert_image(source, dest, out_format, run_as_root=False):
     utils.execute(*cmd, run_as_root=run_as_root)
 
 
-def fetch(context, image_href, path, _user_id, _project_id, max_size=0):
+class _RateLimitedFile(object):
+    """Wraps a file so that it is written at no more than max_rate bytes
+    per second.
+    """
+
+    def __init__(self, f, max_rate):
+        self.f = f
+        self.max_rate = max_rate
+        self.started = time.time()
+        self.written = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.written += len(data)
+        delay = (float(self.written) / self.max_rate -
+                 (time.time() - self.started))
+        if delay > 0:
+            time.sleep(delay)
+
+
+def fetch(context, image_href, path, _user_id, _project_id, max_size=0,
+          max_rate=0):
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -69,13 +202,21 @@ def fetch(context, image_href, path, _user_id, _project_id, max_size=0):
     (image_service, image_id) = glance.get_remote_image_service(context,
                                                                 image_href)
     with fileutils.remove_path_on_error(path):
-        image_service.download(context, image_id, dst_path=path)
+        if max_rate:
+            # The transfer modules only write to paths, so a rate limited
+            # download always streams from the image service
+            with open(path, 'wb') as f:
+                image_service.download(context, image_id,
+                                       data=_RateLimitedFile(f, max_rate))
+        else:
+            image_service.download(context, image_id, dst_path=path)
 
 
-def fetch_to_raw(context, image_href, path, user_id, project_id, max_size=0):
+def fetch_to_raw(context, image_href, path, user_id, project_id, max_size=0,
+                 max_rate=0):
     path_tmp = "%s.part" % path
     fetch(context, image_href, path_tmp, user_id, project_id,
-          max_size=max_size)
+          max_size=max_size, max_rate=max_rate)
 
     with fileutils.remove_path_on_error(path_tmp):
         data = qemu_img_info(path_tmp)
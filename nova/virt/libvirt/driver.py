@@ -38,10 +38,12 @@ Supports KVM, LXC, QEMU, UML, and XEN.
 
 """
 
+import copy
 import errno
 import eventlet
 import functools
 import glob
+import itertools
 import mmap
 import os
 import shutil
@@ -136,6 +138,13 @@ libvirt_opts = [
                     '(which is dependent on virt_type)',
                deprecated_group='DEFAULT',
                deprecated_name='libvirt_uri'),
+    cfg.IntOpt('read_only_connections',
+               default=2,
+               help='Number of read-only libvirt connections used to query '
+                    'domains, such as for instance info, stats and listing, '
+                    'so that those calls do not queue behind the read-write '
+                    'connection used to change them. 0 runs every call on '
+                    'the read-write connection'),
     cfg.BoolOpt('inject_password',
                 default=False,
                 help='Inject the admin password at boot time, '
@@ -177,6 +186,29 @@ libvirt_opts = [
                default=0,
                help='Maximum bandwidth to be used during migration, in Mbps',
                deprecated_group='DEFAULT'),
+    cfg.IntOpt('live_migration_bandwidth_max',
+               default=0,
+               help='Bandwidth, in Mbps, that a live migration is allowed '
+                    'once the maximum downtime has been reached and the '
+                    'guest still dirties memory faster than it is copied. '
+                    '0 leaves live_migration_bandwidth in place'),
+    cfg.IntOpt('live_migration_downtime',
+               default=500,
+               help='Maximum time, in milliseconds, that the guest may be '
+                    'paused for the final switch over of a live migration'),
+    cfg.IntOpt('live_migration_downtime_steps',
+               default=10,
+               help='Number of steps in which the allowed downtime of a '
+                    'live migration is raised to live_migration_downtime'),
+    cfg.IntOpt('live_migration_downtime_delay',
+               default=75,
+               help='Time to wait, in seconds per GiB of data to migrate, '
+                    'between each raise of the allowed downtime'),
+    cfg.IntOpt('live_migration_progress_timeout',
+               default=150,
+               help='Time, in seconds, after which a live migration that '
+                    'has not reduced the data left to copy is aborted. '
+                    '0 disables the timeout'),
     cfg.StrOpt('snapshot_image_format',
                help='Snapshot image format (valid options are : '
                     'raw, qcow2, vmdk, vdi). '
@@ -328,6 +360,12 @@ LIBVIRT_POWER_STATE = {
     VIR_DOMAIN_PMSUSPENDED: power_state.SUSPENDED,
 }
 
+# virDomainJobType values, from jobInfo()
+VIR_DOMAIN_JOB_NONE = 0
+
+# Seconds between two samples of a live migration's progress
+LIVE_MIGRATION_MONITOR_INTERVAL = 0.5
+
 MIN_LIBVIRT_VERSION = (0, 9, 6)
 # When the above version matches/exceeds this version
 # delete it & corresponding code using it
@@ -353,6 +391,7 @@ class LibvirtDriver(driver.ComputeDriver):
     capabilities = {
         "has_imagecache": True,
         "supports_recreate": True,
+        "has_numbered_events": True,
         }
 
     def __init__(self, virtapi, read_only=False):
@@ -368,7 +407,11 @@ class LibvirtDriver(driver.ComputeDriver):
         self._fc_wwpns = None
         self._wrapped_conn = None
         self._wrapped_conn_lock = threading.Lock()
+        self._ro_conns = [None] * CONF.libvirt.read_only_connections
+        self._ro_conns_lock = threading.Lock()
+        self._ro_conn_counter = itertools.count()
         self._caps = None
+        self._guest_cpu_configs = {}
         self._vcpu_total = 0
         self.read_only = read_only
         self.firewall_driver = firewall.load_driver(
@@ -385,6 +428,12 @@ class LibvirtDriver(driver.ComputeDriver):
         self.dev_filter = pci_whitelist.get_pci_devices_filter()
 
         self._event_queue = None
+        # Lifecycle events are numbered so the compute manager can tell
+        # when some were lost. The generation is bumped on every new
+        # libvirt connection, since events raised while we were
+        # disconnected are never delivered.
+        self._event_generation = 0
+        self._event_sequence = itertools.count(1)
 
         self._disk_cachemode = None
         self.image_cache_manager = imagecache.ImageCacheManager()
@@ -520,7 +569,10 @@ class LibvirtDriver(driver.ComputeDriver):
             transition = virtevent.EVENT_LIFECYCLE_RESUMED
 
         if transition is not None:
-            self._queue_event(virtevent.LifecycleEvent(uuid, transition))
+            self._queue_event(virtevent.LifecycleEvent(
+                uuid, transition,
+                generation=self._event_generation,
+                sequence=next(self._event_sequence)))
 
     def _queue_event(self, event):
         """Puts an event on the queue for dispatch.
@@ -681,6 +733,14 @@ class LibvirtDriver(driver.ComputeDriver):
             self._set_host_enabled(bool(wrapped_conn), disable_reason)
 
         self._wrapped_conn = wrapped_conn
+        self._event_generation += 1
+
+        # libvirt may have been restarted, or upgraded, since the host
+        # capabilities were read
+        self._caps = None
+        self._guest_cpu_configs = {}
+        if self._host_state:
+            self._host_state.invalidate()
 
         try:
             LOG.debug(_("Registering for lifecycle events %s"), self)
@@ -724,6 +784,28 @@ class LibvirtDriver(driver.ComputeDriver):
 
     _conn = property(_get_connection)
 
+    def _get_read_only_connection(self):
+        """Return a read-only connection for querying domains.
+
+        The read-only connections are handed out round robin and are
+        reopened when broken. The read-write connection is returned
+        when there are none, or when the driver itself is read-only.
+        """
+        if self.read_only or not self._ro_conns:
+            return self._conn
+        with self._ro_conns_lock:
+            index = next(self._ro_conn_counter) % len(self._ro_conns)
+            conn = self._ro_conns[index]
+            if not conn or not self._test_connection(conn):
+                LOG.debug(_('Opening read-only connection %(index)d to '
+                            'libvirt: %(uri)s'),
+                          {'index': index, 'uri': self.uri()})
+                conn = self._connect(self.uri(), True)
+                self._ro_conns[index] = conn
+        return conn
+
+    _ro_conn = property(_get_read_only_connection)
+
     def _close_callback(self, conn, reason, opaque):
         close_info = {'conn': conn, 'reason': reason}
         self._queue_event(close_info)
@@ -797,21 +879,22 @@ class LibvirtDriver(driver.ComputeDriver):
 
     def get_num_instances(self):
         """Efficient override of base get_num_instances method."""
-        return self._conn.numOfDomains()
+        return self._ro_conn.numOfDomains()
 
     def instance_exists(self, instance):
         """Efficient override of base instance_exists method."""
         try:
-            self._lookup_by_name(instance['name'])
+            self._lookup_by_name(instance['name'], read_only=True)
             return True
         except exception.NovaException:
             return False
 
     # TODO(Shrews): Remove when libvirt Bugzilla bug # 836647 is fixed.
     def list_instance_ids(self):
-        if self._conn.numOfDomains() == 0:
+        conn = self._ro_conn
+        if conn.numOfDomains() == 0:
             return []
-        return self._conn.listDomainsID()
+        return conn.listDomainsID()
 
     def list_instances(self):
         names = []
@@ -819,14 +902,14 @@ class LibvirtDriver(driver.ComputeDriver):
             try:
                 # We skip domains with ID 0 (hypervisors).
                 if domain_id != 0:
-                    domain = self._lookup_by_id(domain_id)
+                    domain = self._lookup_by_id(domain_id, read_only=True)
                     names.append(domain.name())
             except exception.InstanceNotFound:
                 # Ignore deleted instance while listing
                 continue
 
         # extend instance list to contain also defined domains
-        names.extend([vm for vm in self._conn.listDefinedDomains()
+        names.extend([vm for vm in self._ro_conn.listDefinedDomains()
                     if vm not in names])
 
         return names
@@ -837,16 +920,17 @@ class LibvirtDriver(driver.ComputeDriver):
             try:
                 # We skip domains with ID 0 (hypervisors).
                 if domain_id != 0:
-                    domain = self._lookup_by_id(domain_id)
+                    domain = self._lookup_by_id(domain_id, read_only=True)
                     uuids.add(domain.UUIDString())
             except exception.InstanceNotFound:
                 # Ignore deleted instance while listing
                 continue
 
         # extend instance list to contain also defined domains
-        for domain_name in self._conn.listDefinedDomains():
+        for domain_name in self._ro_conn.listDefinedDomains():
             try:
-                uuids.add(self._lookup_by_name(domain_name).UUIDString())
+                domain = self._lookup_by_name(domain_name, read_only=True)
+                uuids.add(domain.UUIDString())
             except exception.InstanceNotFound:
                 # Ignore deleted instance while listing
                 continue
@@ -2898,6 +2982,16 @@ class LibvirtDriver(driver.ComputeDriver):
         return guestcpu
 
     def get_guest_cpu_config(self):
+        """Returns the CPU config of guests, which only depends on the
+           configuration and on the host, as a new object each time.
+        """
+        key = (CONF.libvirt.cpu_mode, CONF.libvirt.cpu_model,
+               CONF.libvirt.virt_type)
+        if key not in self._guest_cpu_configs:
+            self._guest_cpu_configs[key] = self._get_guest_cpu_config()
+        return copy.deepcopy(self._guest_cpu_configs[key])
+
+    def _get_guest_cpu_config(self):
         mode = CONF.libvirt.cpu_mode
         model = CONF.libvirt.cpu_model
 
@@ -2962,6 +3056,14 @@ class LibvirtDriver(driver.ComputeDriver):
                                   inst_type['extra_specs'],
                                   self.get_hypervisor_version())
 
+    def _update_device_name(self, instance, field, device_name):
+        # The device names rarely change after the first boot, so save the
+        # update when the instance already has them
+        if instance.get(field) != device_name:
+            self.virtapi.instance_update(
+                nova_context.get_admin_context(), instance['uuid'],
+                {field: device_name})
+
     def get_guest_storage_config(self, instance, image_meta,
                                  disk_info,
                                  rescue, block_device_info,
@@ -3006,10 +3108,9 @@ class LibvirtDriver(driver.ComputeDriver):
                                                            disk_mapping,
                                                            inst_type)
                     devices.append(disklocal)
-                    self.virtapi.instance_update(
-                        nova_context.get_admin_context(), instance['uuid'],
-                        {'default_ephemeral_device':
-                             block_device.prepend_dev(disklocal.target_dev)})
+                    self._update_device_name(
+                        instance, 'default_ephemeral_device',
+                        block_device.prepend_dev(disklocal.target_dev))
 
                 for idx, eph in enumerate(
                     driver.block_device_info_get_ephemerals(
@@ -3026,10 +3127,9 @@ class LibvirtDriver(driver.ComputeDriver):
                                                           disk_mapping,
                                                           inst_type)
                     devices.append(diskswap)
-                    self.virtapi.instance_update(
-                        nova_context.get_admin_context(), instance['uuid'],
-                        {'default_swap_device': block_device.prepend_dev(
-                            diskswap.target_dev)})
+                    self._update_device_name(
+                        instance, 'default_swap_device',
+                        block_device.prepend_dev(diskswap.target_dev))
 
                 for vol in block_device_mapping:
                     connection_info = vol['connection_info']
@@ -3132,9 +3232,8 @@ class LibvirtDriver(driver.ComputeDriver):
         if root_device_name:
             # NOTE(yamahata):
             # for nova.api.ec2.cloud.CloudController.get_metadata()
-            self.virtapi.instance_update(
-                nova_context.get_admin_context(), instance['uuid'],
-                {'root_device_name': root_device_name})
+            self._update_device_name(instance, 'root_device_name',
+                                     root_device_name)
 
         guest.os_type = vm_mode.get_from_instance(instance)
 
@@ -3457,15 +3556,17 @@ class LibvirtDriver(driver.ComputeDriver):
                   {'xml': xml}, instance=instance)
         return xml
 
-    def _lookup_by_id(self, instance_id):
+    def _lookup_by_id(self, instance_id, read_only=False):
         """Retrieve libvirt domain object given an instance id.
 
         All libvirt error handling should be handled in this method and
-        relevant nova exceptions should be raised in response.
+        relevant nova exceptions should be raised in response. A domain
+        looked up with read_only can only be queried, not changed.
 
         """
         try:
-            return self._conn.lookupByID(instance_id)
+            conn = self._ro_conn if read_only else self._conn
+            return conn.lookupByID(instance_id)
         except libvirt.libvirtError as ex:
             error_code = ex.get_error_code()
             if error_code == libvirt.VIR_ERR_NO_DOMAIN:
@@ -3478,15 +3579,17 @@ class LibvirtDriver(driver.ComputeDriver):
                       'ex': ex})
             raise exception.NovaException(msg)
 
-    def _lookup_by_name(self, instance_name):
+    def _lookup_by_name(self, instance_name, read_only=False):
         """Retrieve libvirt domain object given an instance name.
 
         All libvirt error handling should be handled in this method and
-        relevant nova exceptions should be raised in response.
+        relevant nova exceptions should be raised in response. A domain
+        looked up with read_only can only be queried, not changed.
 
         """
         try:
-            return self._conn.lookupByName(instance_name)
+            conn = self._ro_conn if read_only else self._conn
+            return conn.lookupByName(instance_name)
         except libvirt.libvirtError as ex:
             error_code = ex.get_error_code()
             if error_code == libvirt.VIR_ERR_NO_DOMAIN:
@@ -3507,7 +3610,7 @@ class LibvirtDriver(driver.ComputeDriver):
         libvirt error is.
 
         """
-        virt_dom = self._lookup_by_name(instance['name'])
+        virt_dom = self._lookup_by_name(instance['name'], read_only=True)
         dom_info = virt_dom.info()
         return {'state': LIBVIRT_POWER_STATE[dom_info[0]],
                 'max_mem': dom_info[1],
@@ -4101,7 +4204,7 @@ class LibvirtDriver(driver.ComputeDriver):
     def block_stats(self, instance_name, disk):
         """Note that this function takes an instance name."""
         try:
-            domain = self._lookup_by_name(instance_name)
+            domain = self._lookup_by_name(instance_name, read_only=True)
             return domain.blockStats(disk)
         except libvirt.libvirtError as e:
             errcode = e.get_error_code()
@@ -4116,7 +4219,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
     def interface_stats(self, instance_name, interface):
         """Note that this function takes an instance name."""
-        domain = self._lookup_by_name(instance_name)
+        domain = self._lookup_by_name(instance_name, read_only=True)
         return domain.interfaceStats(interface)
 
     def get_console_pool_info(self, console_type):
@@ -4470,10 +4573,20 @@ class LibvirtDriver(driver.ComputeDriver):
             logical_sum = reduce(lambda x, y: x | y, flagvals)
 
             dom = self._lookup_by_name(instance["name"])
-            dom.migrateToURI(CONF.libvirt.live_migration_uri % dest,
-                             logical_sum,
-                             None,
-                             CONF.libvirt.live_migration_bandwidth)
+            # migrateToURI only returns once the migration is over, so it
+            # runs in its own thread while this one steers it
+            migration = greenthread.spawn(
+                dom.migrateToURI, CONF.libvirt.live_migration_uri % dest,
+                logical_sum, None, CONF.libvirt.live_migration_bandwidth)
+            try:
+                self._live_migration_monitor(context, instance, dom,
+                                             migration)
+            except Exception as e:
+                # Only the outcome of migrateToURI tells whether the guest
+                # still runs here, so a failing monitor must not roll back
+                LOG.warn(_("Unable to monitor the live migration: %s"), e,
+                         instance=instance)
+            migration.wait()
 
         except Exception as e:
             with excutils.save_and_reraise_exception():
@@ -4496,6 +4609,123 @@ class LibvirtDriver(driver.ComputeDriver):
         timer.f = wait_for_live_migration
         timer.start(interval=0.5).wait()
 
+    @staticmethod
+    def _live_migration_downtime_steps(data_gb):
+        """Return the (delay, downtime) steps of a live migration.
+
+        The allowed downtime, in milliseconds, is raised in equal steps to
+        live_migration_downtime, each step live_migration_downtime_delay
+        seconds per GiB of data after the previous one.
+        """
+        downtime = CONF.libvirt.live_migration_downtime
+        steps = max(CONF.libvirt.live_migration_downtime_steps, 1)
+        delay = CONF.libvirt.live_migration_downtime_delay * data_gb
+        return [(delay * i, downtime * (i + 1) // steps)
+                for i in range(steps)]
+
+    def _live_migration_monitor(self, context, instance, dom, migration):
+        """Steer a live migration until it finishes, or abort it.
+
+        Samples the job info of the migration, raises the allowed
+        downtime in steps, raises the bandwidth once the downtime is at
+        its maximum if the guest still dirties memory faster than it is
+        copied, and aborts the migration when the data left to copy has
+        not gone down for live_migration_progress_timeout seconds. The
+        progress is saved on the instance as the percentage of the data
+        copied.
+        """
+        start = time.time()
+        downtime_steps = None
+        last = None
+        lowest_remaining = None
+        progress_time = start
+        progress = None
+        bandwidth_raised = False
+
+        while True:
+            greenthread.sleep(LIVE_MIGRATION_MONITOR_INTERVAL)
+            if migration.dead:
+                break
+            try:
+                info = dom.jobInfo()
+            except libvirt.libvirtError as e:
+                LOG.debug(_("Unable to get the live migration job info: "
+                            "%s"), e, instance=instance)
+                continue
+            job_type, data_total, data_processed, data_remaining = (
+                info[0], info[3], info[4], info[5])
+            if job_type == VIR_DOMAIN_JOB_NONE or not data_total:
+                continue
+            now = time.time()
+
+            if downtime_steps is None:
+                downtime_steps = self._live_migration_downtime_steps(
+                    float(data_total) / units.Gi)
+            while downtime_steps and now - start >= downtime_steps[0][0]:
+                delay, downtime = downtime_steps.pop(0)
+                LOG.info(_("Raising the allowed downtime of the live "
+                           "migration to %dms"), downtime, instance=instance)
+                try:
+                    dom.migrateSetMaxDowntime(downtime, 0)
+                except libvirt.libvirtError as e:
+                    LOG.warn(_("Unable to raise the allowed downtime of the "
+                               "live migration: %s"), e, instance=instance)
+
+            throughput = dirty_rate = 0
+            if last is not None and now > last[0]:
+                elapsed = now - last[0]
+                throughput = (data_processed - last[1]) / elapsed
+                dirty_rate = throughput - (last[2] - data_remaining) / elapsed
+            last = (now, data_processed, data_remaining)
+
+            bandwidth_max = CONF.libvirt.live_migration_bandwidth_max
+            if (not downtime_steps and not bandwidth_raised and
+                    bandwidth_max and dirty_rate >= throughput > 0):
+                LOG.info(_("The guest dirties memory faster than the live "
+                           "migration copies it, raising its bandwidth to "
+                           "%dMbps"), bandwidth_max, instance=instance)
+                try:
+                    dom.migrateSetMaxSpeed(bandwidth_max, 0)
+                except libvirt.libvirtError as e:
+                    LOG.warn(_("Unable to raise the bandwidth of the live "
+                               "migration: %s"), e, instance=instance)
+                bandwidth_raised = True
+
+            if lowest_remaining is None or data_remaining < lowest_remaining:
+                lowest_remaining = data_remaining
+                progress_time = now
+            timeout = CONF.libvirt.live_migration_progress_timeout
+            if timeout and now - progress_time > timeout:
+                LOG.warn(_("Live migration made no progress in %(timeout)ds, "
+                           "%(remaining)d bytes left to copy; aborting"),
+                         {'timeout': timeout, 'remaining': data_remaining},
+                         instance=instance)
+                try:
+                    dom.abortJob()
+                except libvirt.libvirtError as e:
+                    LOG.warn(_("Unable to abort the live migration: %s"), e,
+                             instance=instance)
+                break
+
+            # A busy guest can make the data left to copy grow again,
+            # so never report less than the best progress so far
+            new_progress = int(100 * (data_total - lowest_remaining) /
+                               data_total)
+            if new_progress != progress:
+                progress = new_progress
+                LOG.debug(_("Live migration %(progress)d%% done, "
+                            "%(throughput)d bytes/s copied, %(dirty)d "
+                            "bytes/s dirtied"),
+                          {'progress': progress, 'throughput': throughput,
+                           'dirty': max(dirty_rate, 0)}, instance=instance)
+                try:
+                    self.virtapi.instance_update(
+                        nova_context.get_admin_context(), instance['uuid'],
+                        {'progress': progress})
+                except Exception as e:
+                    LOG.warn(_("Unable to save the live migration progress: "
+                               "%s"), e, instance=instance)
+
     def _fetch_instance_kernel_ramdisk(self, context, instance):
         """Download kernel and ramdisk for instance in instance directory."""
         instance_dir = libvirt_utils.get_instance_path(instance)
@@ -4848,6 +5078,10 @@ class LibvirtDriver(driver.ComputeDriver):
         """Manage the local cache of images."""
         self.image_cache_manager.update(context, all_instances)
 
+    def preseed_image_cache(self, context, image_ids):
+        """Download the given images into the local image cache."""
+        self.image_cache_manager.preseed(context, image_ids)
+
     def _cleanup_remote_migration(self, dest, inst_base, inst_base_resize,
                                   shared_storage=False):
         """Used only for cleanup in case migrate_disk_and_power_off fails."""
@@ -5099,7 +5333,7 @@ class LibvirtDriver(driver.ComputeDriver):
                             result[key].append(child.get('dev'))
             return result
 
-        domain = self._lookup_by_name(instance['name'])
+        domain = self._lookup_by_name(instance['name'], read_only=True)
         output = {}
         # get cpu time, might launch an exception if the method
         # is not supported by the underlying hypervisor being
@@ -5230,6 +5464,8 @@ class HostState(object):
     def __init__(self, driver):
         super(HostState, self).__init__()
         self._stats = {}
+        self._static_stats = None
+        self.timings = {}
         self.driver = driver
         self.update_status()
 
@@ -5242,6 +5478,34 @@ class HostState(object):
             self.update_status()
         return self._stats
 
+    def invalidate(self):
+        """Forget the stats that only change when libvirt is restarted."""
+        self._static_stats = None
+
+    def _get_static_stats(self):
+        """Return the stats that do not change while libvirt is running.
+
+        These come from the host capabilities and the node devices, which
+        are only read again after a reconnection to libvirt.
+        """
+        data = {}
+        #NOTE(dprince): calling capabilities before getVersion works around
+        # an initialization issue with some versions of Libvirt (1.0.5.5).
+        # See: https://bugzilla.redhat.com/show_bug.cgi?id=1000116
+        # See: https://bugs.launchpad.net/nova/+bug/1215593
+        data["supported_instances"] = \
+            self.driver.get_instance_capabilities()
+
+        data["vcpus"] = self.driver.get_vcpu_total()
+        data["memory_mb"] = self.driver.get_memory_mb_total()
+        data["hypervisor_type"] = self.driver.get_hypervisor_type()
+        data["hypervisor_version"] = self.driver.get_hypervisor_version()
+        data["hypervisor_hostname"] = self.driver.get_hypervisor_hostname()
+        data["cpu_info"] = self.driver.get_cpu_info()
+        data['pci_passthrough_devices'] = \
+            self.driver.get_pci_passthrough_devices()
+        return data
+
     def update_status(self):
         """Retrieve status info from libvirt."""
         def _get_disk_available_least():
@@ -5261,32 +5525,33 @@ class HostState(object):
             available_least = disk_free_gb * units.Gi - disk_over_committed
             return (available_least / units.Gi)
 
-        LOG.debug(_("Updating host stats"))
-        disk_info_dict = self.driver.get_local_gb_info()
-        data = {}
+        timings = {}
 
-        #NOTE(dprince): calling capabilities before getVersion works around
-        # an initialization issue with some versions of Libvirt (1.0.5.5).
-        # See: https://bugzilla.redhat.com/show_bug.cgi?id=1000116
-        # See: https://bugs.launchpad.net/nova/+bug/1215593
-        data["supported_instances"] = \
-            self.driver.get_instance_capabilities()
+        def timed(section, func):
+            start = time.time()
+            result = func()
+            timings[section] = time.time() - start
+            return result
 
-        data["vcpus"] = self.driver.get_vcpu_total()
-        data["memory_mb"] = self.driver.get_memory_mb_total()
+        LOG.debug(_("Updating host stats"))
+        if self._static_stats is None:
+            self._static_stats = timed('static', self._get_static_stats)
+        data = dict(self._static_stats)
+
+        disk_info_dict = timed('local_gb', self.driver.get_local_gb_info)
         data["local_gb"] = disk_info_dict['total']
-        data["vcpus_used"] = self.driver.get_vcpu_used()
-        data["memory_mb_used"] = self.driver.get_memory_mb_used()
         data["local_gb_used"] = disk_info_dict['used']
-        data["hypervisor_type"] = self.driver.get_hypervisor_type()
-        data["hypervisor_version"] = self.driver.get_hypervisor_version()
-        data["hypervisor_hostname"] = self.driver.get_hypervisor_hostname()
-        data["cpu_info"] = self.driver.get_cpu_info()
-        data['disk_available_least'] = _get_disk_available_least()
-
-        data['pci_passthrough_devices'] = \
-            self.driver.get_pci_passthrough_devices()
+        data["vcpus_used"] = timed('vcpus_used', self.driver.get_vcpu_used)
+        data["memory_mb_used"] = timed('memory_mb_used',
+                                       self.driver.get_memory_mb_used)
+        data['disk_available_least'] = timed('disk_available_least',
+                                             _get_disk_available_least)
 
         self._stats = data
+        self.timings = timings
+        sections = ', '.join('%s: %.2fs' % timing
+                             for timing in sorted(timings.items()))
+        LOG.debug(_("Updated host stats in %(total).2fs (%(sections)s)"),
+                  {'total': sum(timings.values()), 'sections': sections})
 
         return data
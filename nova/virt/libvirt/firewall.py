@@ -304,6 +304,7 @@ class IptablesFirewallDriver(base_firewall.IptablesFirewallDriver):
             self.network_infos.pop(instance['id'])
             self.remove_filters_for_instance(instance)
             self.iptables.apply()
+            self.destroy_unused_ipsets()
             self.nwfilter.unfilter_instance(instance, network_info)
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
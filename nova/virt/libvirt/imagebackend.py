@@ -15,8 +15,12 @@
 
 import abc
 import contextlib
+import functools
 import os
+import sys
 
+import eventlet
+from eventlet import event
 import six
 
 from oslo.config import cfg
@@ -88,6 +92,70 @@ CONF.import_opt('preallocate_images', 'nova.virt.driver')
 
 LOG = logging.getLogger(__name__)
 
+# Seconds between the progress reports of callers waiting on a fetch
+FETCH_PROGRESS_INTERVAL = 10
+
+# Base image path -> the _SharedFetch in progress for it
+_fetches = {}
+
+
+class _SharedFetch(object):
+    """A fetch of a base image that concurrent callers wait on together."""
+
+    def __init__(self, path):
+        self.path = path
+        self.event = event.Event()
+
+    def progress(self):
+        """Return the number of bytes fetched so far."""
+        # Downloads are written to a .part file, then renamed
+        for path in (self.path + '.part', self.path):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                pass
+        return 0
+
+    def wait(self):
+        """Wait for the fetch to finish, raising its exception if it failed.
+        """
+        while True:
+            with eventlet.Timeout(FETCH_PROGRESS_INTERVAL, False):
+                return self.event.wait()
+            LOG.info(_('Waiting for %(path)s to be fetched, %(bytes)d bytes '
+                       'so far'),
+                     {'path': self.path, 'bytes': self.progress()})
+
+
+def _fetch_once(path, fetch):
+    """Run fetch for path, unless it is running already.
+
+    Callers that ask for the same path while it is being fetched wait for
+    that fetch and share its result, or its exception, instead of each
+    taking the file lock in turn and checking the base image again.  A
+    FlavorDiskTooSmall failure only applies to the flavor of the caller
+    which fetched, so the waiters then fetch again with their own.
+    """
+    shared = _fetches.get(path)
+    if shared is not None:
+        LOG.debug(_('Waiting for the fetch of %s in progress'), path)
+        try:
+            return shared.wait()
+        except exception.FlavorDiskTooSmall:
+            return _fetch_once(path, fetch)
+
+    shared = _fetches[path] = _SharedFetch(path)
+    try:
+        result = fetch()
+    except Exception:
+        shared.event.send_exception(*sys.exc_info())
+        raise
+    else:
+        shared.event.send(result)
+        return result
+    finally:
+        del _fetches[path]
+
 
 @six.add_metaclass(abc.ABCMeta)
 class Image(object):
@@ -178,9 +246,20 @@ class Image(object):
         :size: Size of created image in bytes (optional)
         """
         @utils.synchronized(filename, external=True, lock_path=self.lock_path)
-        def fetch_func_sync(target, *args, **kwargs):
+        def fetch_func_locked(target, *args, **kwargs):
+            # Another compute node sharing the base directory may have
+            # fetched it while we waited for the lock
+            if target == base and os.path.exists(target):
+                return
             fetch_func(target=target, *args, **kwargs)
 
+        def fetch_func_sync(target, *args, **kwargs):
+            if target != base:
+                # Generated in place for this instance, nothing to share
+                return fetch_func_locked(target, *args, **kwargs)
+            return _fetch_once(base, functools.partial(
+                fetch_func_locked, target, *args, **kwargs))
+
         base_dir = os.path.join(CONF.instances_path,
                                 CONF.image_cache_subdirectory_name)
         if not os.path.exists(base_dir):
@@ -331,7 +410,9 @@ class Raw(Image):
 
         @utils.synchronized(filename, external=True, lock_path=self.lock_path)
         def copy_raw_image(base, target, size):
-            libvirt_utils.copy_image(base, target)
+            method = libvirt_utils.clone_image(base, target)
+            LOG.debug(_('Copied %(base)s to %(target)s using %(method)s'),
+                      {'base': base, 'target': target, 'method': method})
             if size:
                 # class Raw is misnamed, format may not be 'raw' in all cases
                 use_cow = self.driver_format == 'qcow2'
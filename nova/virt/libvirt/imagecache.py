@@ -26,15 +26,20 @@ import os
 import re
 import time
 
+from eventlet import greenthread
 from oslo.config import cfg
 
+from nova import exception
+from nova.image import glance
 from nova.openstack.common import fileutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import processutils
+from nova.openstack.common import units
 from nova import utils
 from nova.virt import imagecache
+from nova.virt import images
 from nova.virt.libvirt import utils as virtutils
 
 LOG = logging.getLogger(__name__)
@@ -66,12 +71,22 @@ imagecache_opts = [
                default=3600,
                help='How frequently to checksum base images',
                deprecated_group='DEFAULT'),
+    cfg.IntOpt('checksum_read_size_kb',
+               default=1024,
+               help='Size in KB of each read done when checksumming base '
+                    'images'),
+    cfg.IntOpt('checksum_max_read_mb_per_second',
+               default=50,
+               help='Maximum rate in MB per second at which base images '
+                    'are read for checksumming. 0 means unlimited'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(imagecache_opts, 'libvirt')
 CONF.import_opt('instances_path', 'nova.compute.manager')
 CONF.import_opt('image_cache_subdirectory_name', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_max_disk_gb', 'nova.virt.imagecache')
+CONF.import_opt('image_preseed_max_mb_per_second', 'nova.virt.imagecache')
 
 
 def get_cache_fname(images, key):
@@ -216,13 +231,130 @@ def write_stored_info(target, field=None, value=None):
 
 def _hash_file(filename):
     """Generate a hash for the contents of a file."""
+    read_size = CONF.libvirt.checksum_read_size_kb * 1024
     checksum = hashlib.sha1()
-    with open(filename) as f:
-        for chunk in iter(lambda: f.read(32768), b''):
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(read_size), b''):
             checksum.update(chunk)
     return checksum.hexdigest()
 
 
+def _file_key(filename):
+    """Return a key that changes whenever the file's contents may have."""
+    st = os.stat(filename)
+    return (st.st_ino, st.st_size, st.st_mtime)
+
+
+class Checksummer(object):
+    """Checksums base images in a background green thread.
+
+    Files are read in chunks of checksum_read_size_kb, at no more than
+    checksum_max_read_mb_per_second.  Results are cached by the inode,
+    size and modification time of the file, so an unchanged file is only
+    hashed once.  If hashing a file is interrupted, it resumes where it
+    stopped the next time the file is queued, as long as the file did not
+    change in the meantime.
+    """
+
+    def __init__(self):
+        # path -> (file key, hex digest)
+        self._results = {}
+        # path -> (file key, bytes hashed so far, sha1 object)
+        self._progress = {}
+        # path -> callbacks to run with the digest once it is known
+        self._pending = {}
+        self._queue = []
+        self._thread = None
+
+    def get_checksum(self, filename, callback=None):
+        """Return the SHA-1 of a file, or None if it is not known yet.
+
+        If it is not known, the file is queued for hashing, and callback
+        (if given) is called with the file name and digest once it is done.
+        """
+        key = _file_key(filename)
+        result = self._results.get(filename)
+        if result is not None and result[0] == key:
+            return result[1]
+
+        callbacks = self._pending.setdefault(filename, [])
+        if callback is not None:
+            callbacks.append(callback)
+        if filename not in self._queue:
+            self._queue.append(filename)
+        if self._thread is None:
+            self._thread = greenthread.spawn(self._run)
+        return None
+
+    def wait(self):
+        """Wait until all the queued files have been hashed."""
+        if self._thread is not None:
+            self._thread.wait()
+
+    def _run(self):
+        try:
+            while self._queue:
+                filename = self._queue[0]
+                try:
+                    digest = self._hash(filename)
+                except (IOError, OSError) as e:
+                    LOG.warning(_('Failed to checksum %(filename)s: '
+                                  '%(error)s'),
+                                {'filename': filename, 'error': e})
+                    digest = None
+                self._queue.remove(filename)
+                callbacks = self._pending.pop(filename, [])
+                if digest is None:
+                    continue
+                for callback in callbacks:
+                    try:
+                        callback(filename, digest)
+                    except Exception:
+                        LOG.exception(_('Error handling the checksum of '
+                                        '%s'), filename)
+        finally:
+            self._thread = None
+
+    def _hash(self, filename):
+        key = _file_key(filename)
+        progress = self._progress.get(filename)
+        if progress is not None and progress[0] == key:
+            _key, offset, checksum = progress
+            LOG.debug(_('Resuming checksum of %(filename)s at byte '
+                        '%(offset)d'),
+                      {'filename': filename, 'offset': offset})
+        else:
+            offset, checksum = 0, hashlib.sha1()
+
+        read_size = CONF.libvirt.checksum_read_size_kb * 1024
+        max_rate = CONF.libvirt.checksum_max_read_mb_per_second * 1024 * 1024
+        started = time.time()
+        read = 0
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            for chunk in iter(lambda: f.read(read_size), b''):
+                checksum.update(chunk)
+                offset += len(chunk)
+                read += len(chunk)
+                self._progress[filename] = (key, offset, checksum)
+
+                # Stay under the read rate limit, and give other
+                # threads a chance to run in any case
+                delay = 0
+                if max_rate > 0:
+                    delay = float(read) / max_rate - (time.time() - started)
+                greenthread.sleep(max(delay, 0))
+
+        del self._progress[filename]
+        if _file_key(filename) != key:
+            # The file changed while we were reading it, hash it again
+            # next time it is asked for
+            return None
+        digest = checksum.hexdigest()
+        self._results[filename] = (key, digest)
+        return digest
+
+
 def read_stored_checksum(target, timestamped=True):
     """Read the checksum.
 
@@ -240,6 +372,10 @@ class ImageCacheManager(imagecache.ImageCacheManager):
     def __init__(self):
         super(ImageCacheManager, self).__init__()
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        self.checksummer = Checksummer()
+        # IDs of the images kept in the cache by the last pre-seeding pass
+        self.preseeded_images = set()
+        self._preseed_thread = None
         self._reset_state()
 
     def _reset_state(self):
@@ -382,14 +518,21 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                         CONF.libvirt.checksum_interval_seconds):
                     return True
 
+                current_checksum = self.checksummer.get_checksum(base_file)
+                if current_checksum is None:
+                    LOG.info(_('image %(id)s at (%(base_file)s): image '
+                               'verification pending, checksumming in the '
+                               'background'),
+                             {'id': img_id,
+                              'base_file': base_file})
+                    return None
+
                 # NOTE(mikal): If there is no timestamp, then the checksum was
                 # performed by a previous version of the code.
                 if not stored_timestamp:
                     write_stored_info(base_file, field='sha1',
                                       value=stored_checksum)
 
-                current_checksum = _hash_file(base_file)
-
                 if current_checksum != stored_checksum:
                     LOG.error(_('image %(id)s at (%(base_file)s): image '
                                 'verification failed'),
@@ -413,10 +556,18 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                     LOG.info(_('%(id)s (%(base_file)s): generating checksum'),
                              {'id': img_id,
                               'base_file': base_file})
-                    write_stored_checksum(base_file)
+                    current_checksum = self.checksummer.get_checksum(
+                        base_file, callback=store_checksum)
+                    if current_checksum is not None:
+                        write_stored_info(base_file, field='sha1',
+                                          value=current_checksum)
 
                 return None
 
+        @utils.synchronized(lock_name, external=True, lock_path=self.lock_path)
+        def store_checksum(filename, checksum):
+            write_stored_info(filename, field='sha1', value=checksum)
+
         return inner_verify_checksum()
 
     def _remove_base_file(self, base_file):
@@ -501,6 +652,15 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                                  'base_file': base_file,
                                  'instance_list': ' '.join(instances)})
 
+        if (not image_in_use and img_id in self.preseeded_images and
+                base_file and os.path.basename(base_file) ==
+                hashlib.sha1(img_id).hexdigest()):
+            image_in_use = True
+            LOG.info(_('image %(id)s at (%(base_file)s): pre-seeded'),
+                     {'id': img_id,
+                      'base_file': base_file})
+            self.active_base_files.append(base_file)
+
         if image_bad:
             self.corrupt_base_files.append(base_file)
 
@@ -523,8 +683,12 @@ class ImageCacheManager(imagecache.ImageCacheManager):
 
     def _age_and_verify_cached_images(self, context, all_instances, base_dir):
         LOG.debug(_('Verify base images'))
-        # Determine what images are on disk because they're in use
-        for img in self.used_images:
+        # Determine what images are on disk because they're in use, or
+        # because they were pre-seeded
+        wanted_images = list(self.used_images)
+        wanted_images.extend(img for img in self.preseeded_images
+                             if img not in self.used_images)
+        for img in wanted_images:
             fingerprint = hashlib.sha1(img).hexdigest()
             LOG.debug(_('Image id %(id)s yields fingerprint %(fingerprint)s'),
                       {'id': img,
@@ -601,3 +765,93 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         self.instance_names = running['instance_names']
         # perform the aging and image verification
         self._age_and_verify_cached_images(context, all_instances, base_dir)
+
+    def _get_image_size(self, context, image_id):
+        """Return the size of an active image in the image service."""
+        image_service, image_id = glance.get_remote_image_service(context,
+                                                                  image_id)
+        image = image_service.show(context, image_id)
+        if image.get('status') != 'active':
+            raise exception.ImageNotActive(image_id=image_id)
+        return image.get('size') or 0
+
+    def _fetch_preseed_image(self, context, image_id, base_file):
+        """Download an image into the cache, unless an instance did.
+
+        The throttled download goes to a file of its own, so that an
+        instance which needs the image meanwhile fetches it at full speed
+        instead of waiting on the lock of the base image.
+        """
+        max_rate = CONF.image_preseed_max_mb_per_second * units.Mi
+        preseed_file = base_file + '.preseed'
+        if os.path.exists(base_file):
+            return
+
+        LOG.info(_('Pre-seeding image %(id)s to %(base_file)s'),
+                 {'id': image_id, 'base_file': base_file})
+        with fileutils.remove_path_on_error(preseed_file):
+            images.fetch_to_raw(context, image_id, preseed_file,
+                                context.user_id, context.project_id,
+                                max_rate=max_rate)
+
+        # The same lock as the image backends take to fetch base images
+        @utils.synchronized(os.path.basename(base_file), external=True,
+                            lock_path=self.lock_path)
+        def install():
+            if os.path.exists(base_file):
+                fileutils.delete_if_exists(preseed_file)
+            else:
+                os.rename(preseed_file, base_file)
+
+        install()
+
+    def _preseed(self, context, image_ids, base_dir):
+        budget = CONF.image_preseed_max_disk_gb * units.Gi
+        preseeded = set()
+        for image_id in image_ids:
+            base_file = os.path.join(base_dir,
+                                     hashlib.sha1(image_id).hexdigest())
+            try:
+                if os.path.exists(base_file):
+                    size = os.path.getsize(base_file)
+                else:
+                    size = self._get_image_size(context, image_id)
+                if size > budget:
+                    LOG.info(_('Not pre-seeding image %(id)s, its %(size)d '
+                               'bytes do not fit in the %(budget)d bytes '
+                               'left'),
+                             {'id': image_id, 'size': size, 'budget': budget})
+                    continue
+                self._fetch_preseed_image(context, image_id, base_file)
+                # A converted image can be larger than the one downloaded
+                size = max(size, os.path.getsize(base_file))
+            except Exception:
+                LOG.exception(_('Failed to pre-seed image %s'), image_id)
+                continue
+            # Keep it young for the cache manager, as if it was in use,
+            # and keep it from being removed while the pass goes on
+            os.utime(base_file, None)
+            budget -= size
+            preseeded.add(image_id)
+            self.preseeded_images.add(image_id)
+        self.preseeded_images = preseeded
+
+    def preseed(self, context, image_ids):
+        if self._preseed_thread is not None:
+            LOG.debug(_('Previous pre-seeding pass still running'))
+            return
+        if not image_ids:
+            self.preseeded_images = set()
+            return
+        base_dir = os.path.join(CONF.instances_path,
+                                CONF.image_cache_subdirectory_name)
+        fileutils.ensure_tree(base_dir)
+
+        def run():
+            try:
+                self._preseed(context, image_ids, base_dir)
+            finally:
+                self._preseed_thread = None
+
+        # Downloads take long, so they do not hold up other periodic tasks
+        self._preseed_thread = greenthread.spawn(run)
@@ -516,6 +516,37 @@ def copy_image(src, dest, host=None):
             execute('rsync', '--sparse', '--compress', src, dest)
 
 
+# (source device, destination device) pairs that reflinks failed between
+_reflink_unsupported = set()
+
+
+def clone_image(src, dest):
+    """Copy a local disk image without writing the space it does not use
+
+    Where the filesystem supports reflinks (btrfs, OCFS2, XFS with
+    reflink=1) dest shares the blocks of src until either is written.
+    Otherwise holes in src, and any blocks of zeros, are left as holes
+    in dest.
+
+    :param src: Source image
+    :param dest: Destination path
+    :returns: the method used, 'reflink' or 'sparse'
+    """
+    devices = (os.stat(src).st_dev,
+               os.stat(os.path.dirname(os.path.abspath(dest))).st_dev)
+    if devices not in _reflink_unsupported:
+        try:
+            execute('cp', '--reflink=always', src, dest)
+            return 'reflink'
+        except processutils.ProcessExecutionError:
+            # Don't try again for every image on these filesystems
+            _reflink_unsupported.add(devices)
+            if os.path.exists(dest):
+                os.unlink(dest)
+    execute('cp', '--sparse=always', src, dest)
+    return 'sparse'
+
+
 def write_to_file(path, contents, umask=None):
     """Write the given contents to a file
 
@@ -88,6 +88,7 @@ class VMwareESXDriver(driver.ComputeDriver):
     capabilities = {
         "has_imagecache": True,
         "supports_recreate": False,
+        "has_numbered_events": False,
         }
 
     # VMwareAPI has both ESXi and vCenter API sets.
@@ -45,6 +45,9 @@ class Dom0IptablesFirewallDriver(firewall.IptablesFirewallDriver):
         from nova.network import linux_net
         super(Dom0IptablesFirewallDriver, self).__init__(virtapi, **kwargs)
         self._session = xenapi_session
+        # NOTE: ipset would have to run in dom0 too, which the plugin
+        # does not allow, so group members are always listed in the rules
+        self.use_ipset = False
         # Create IpTablesManager with executor through plugin
         self.iptables = linux_net.IptablesManager(self._plugin_execute)
         self.iptables.ipv4['filter'].add_chain('sg-fallback')
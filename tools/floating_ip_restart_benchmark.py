@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Time programming a network host's floating IPs at restart.
+
+Sets up the same floating IPs the way init_host_floating_ips used to, one
+add_floating_ip per address, and with LinuxNetL3.add_floating_ips. Every
+command goes to a synthetic execute that counts the calls and sleeps for
+--exec-latency milliseconds to stand in for rootwrap. Nothing is run as
+root and the host network is never touched.
+
+    tools/floating_ip_restart_benchmark.py --floating-ips 2000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import netaddr
+from oslo.config import cfg
+
+from nova.network import l3
+from nova.network import linux_net
+
+
+CONF = cfg.CONF
+
+
+class FakeExecute(object):
+    """Counts commands and plays iptables-save back from the last restore."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.saved = {}
+        self.calls = 0
+
+    def __call__(self, *cmd, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if cmd[0].endswith('-save'):
+            return self.saved.get(cmd[0][:-len('-save')], ''), ''
+        if cmd[0].endswith('-restore') and '--noflush' not in cmd:
+            self.saved[cmd[0][:-len('-restore')]] = kwargs['process_input']
+        return '', ''
+
+
+def floating_ips(count):
+    network = {'bridge': 'br100', 'cidr': '10.0.0.0/16'}
+    fixed = netaddr.IPNetwork(network['cidr']).iter_hosts()
+    floating = netaddr.IPNetwork('172.16.0.0/16').iter_hosts()
+    return [(str(next(floating)), str(next(fixed)), 'eth0', network)
+            for _i in xrange(count)]
+
+
+def timed_setup(add, count, latency):
+    execute = FakeExecute(latency)
+    linux_net._execute = execute
+    linux_net.iptables_manager = linux_net.IptablesManager(execute=execute)
+    linux_net.iptables_manager.apply()
+    execute.calls = 0
+    to_add = floating_ips(count)
+    began = time.time()
+    add(to_add)
+    return time.time() - began, execute.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--floating-ips', type=int, default=2000)
+    parser.add_argument('--exec-latency', type=float, default=5.0,
+                        help='milliseconds each command takes')
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+    CONF.set_override('use_ipv6', False)
+    CONF.set_override('send_arp_for_ha', False)
+    lock_path = tempfile.mkdtemp()
+    CONF.set_override('lock_path', lock_path)
+
+    driver = l3.LinuxNetL3()
+
+    def one_by_one(to_add):
+        for floating_ip, fixed_ip, interface, network in to_add:
+            driver.add_floating_ip(floating_ip, fixed_ip, interface, network)
+
+    try:
+        print('%d floating ips, %.1fms per command' %
+              (args.floating_ips, args.exec_latency))
+        for name, add in (('add_floating_ip loop', one_by_one),
+                          ('add_floating_ips', driver.add_floating_ips)):
+            elapsed, calls = timed_setup(add, args.floating_ips,
+                                         args.exec_latency / 1000.0)
+            print('%-22s %8.2fs  %7d commands' % (name + ':', elapsed, calls))
+    finally:
+        shutil.rmtree(lock_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare single-request and ranged image downloads over http.
+
+Serves a random image from a local HTTP server that limits the bandwidth of
+each connection, which is how most object stores and web servers behave, and
+times nova.image.download.http fetching it with one request and with byte
+ranges.
+
+    tools/image_download_benchmark.py --size-mb 64 --connection-mb 16
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import BaseHTTPServer
+import hashlib
+import os
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from oslo.config import cfg
+import six.moves.urllib.parse as urlparse
+
+from nova.image.download import http
+from nova.openstack.common import units
+
+
+CONF = cfg.CONF
+CHUNK = 64 * units.Ki
+
+
+def make_handler(data, bytes_per_second):
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _headers(self, status, start, end):
+            self.send_response(status)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+
+        def do_HEAD(self):
+            self._headers(200, 0, len(data) - 1)
+
+        def do_GET(self):
+            byte_range = self.headers.getheader('Range')
+            if byte_range:
+                start, end = byte_range[len('bytes='):].split('-')
+                start, end = int(start), int(end)
+                self._headers(206, start, end)
+            else:
+                start, end = 0, len(data) - 1
+                self._headers(200, start, end)
+            began = time.time()
+            sent = 0
+            for offset in xrange(start, end + 1, CHUNK):
+                chunk = data[offset:min(offset + CHUNK, end + 1)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                delay = began + float(sent) / bytes_per_second - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+    return Handler
+
+
+class ThreadingServer(SocketServer.ThreadingMixIn,
+                      BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def timed_download(transfer, url, dst_dir, checksum):
+    dst_path = os.path.join(dst_dir, 'image')
+    began = time.time()
+    transfer.download(None, urlparse.urlparse(url), dst_path, {},
+                      image_id='benchmark', checksum=checksum)
+    elapsed = time.time() - began
+    os.unlink(dst_path)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--connection-mb', type=float, default=16,
+                        help='bandwidth of each connection, in MB/s')
+    parser.add_argument('--range-size-mb', type=int, default=8)
+    parser.add_argument('--range-workers', type=int, default=4)
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+    CONF.set_override('range_size_mb', args.range_size_mb, 'image_http_url')
+    CONF.set_override('range_workers', args.range_workers, 'image_http_url')
+
+    data = os.urandom(args.size_mb * units.Mi)
+    checksum = hashlib.md5(data).hexdigest()
+    handler = make_handler(data, args.connection_mb * units.Mi)
+    server = ThreadingServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/image' % server.server_address[1]
+
+    transfer = http.get_download_handler()
+    dst_dir = tempfile.mkdtemp()
+    try:
+        CONF.set_override('min_ranged_size_mb', args.size_mb + 1,
+                          'image_http_url')
+        single = timed_download(transfer, url, dst_dir, checksum)
+        CONF.set_override('min_ranged_size_mb', 0, 'image_http_url')
+        ranged = timed_download(transfer, url, dst_dir, checksum)
+    finally:
+        shutil.rmtree(dst_dir)
+        server.shutdown()
+
+    print('%d MB image, %.0f MB/s per connection' %
+          (args.size_mb, args.connection_mb))
+    print('single request: %6.2fs' % single)
+    print('%d ranges of %d MB, %d workers: %6.2fs (%.1fx)' %
+          ((args.size_mb + args.range_size_mb - 1) // args.range_size_mb,
+           args.range_size_mb, args.range_workers, ranged, single / ranged))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure policy enforcement throughput.
+
+Enforces the rules of a policy file the way nova.policy.enforce used to,
+reading the file cache and walking the parsed check tree on every call,
+and with nova.policy.enforce. Each request context enforces every action
+--per-request times, as a server create does.
+
+    tools/policy_enforce_benchmark.py --policy-file etc/nova/policy.json
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from oslo.config import cfg
+
+from nova import context
+from nova.openstack.common import policy as common_policy
+from nova import policy
+from nova import utils
+
+
+CONF = cfg.CONF
+
+
+def uncompiled_enforce(ctxt, action, target, do_raise):
+    utils.read_cached_file(policy._POLICY_PATH, policy._POLICY_CACHE,
+                           reload_func=policy._set_rules)
+    return common_policy.check(action, target, ctxt.to_dict())
+
+
+def timed_enforce(enforce, actions, requests, per_request):
+    began = time.time()
+    calls = 0
+    for _i in xrange(requests):
+        ctxt = context.RequestContext('fake', 'fake', roles=['member'],
+                                      is_admin=False)
+        target = {'project_id': ctxt.project_id, 'user_id': ctxt.user_id}
+        for action in actions * per_request:
+            enforce(ctxt, action, target, False)
+            calls += 1
+    return calls / (time.time() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--policy-file', default='etc/nova/policy.json')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--per-request', type=int, default=5,
+                        help='times each action is enforced per request')
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+    CONF.set_override('policy_file', os.path.abspath(args.policy_file))
+    policy.init()
+    actions = sorted(policy.get_rules().keys())
+
+    print('%d actions, %d requests, each action %d times per request' %
+          (len(actions), args.requests, args.per_request))
+    for name, enforce in (('tree walk', uncompiled_enforce),
+                          ('compiled', policy.enforce)):
+        rate = timed_enforce(enforce, actions, args.requests,
+                             args.per_request)
+        print('%-10s %10.0f checks/s' % (name + ':', rate))
+
+
+if __name__ == '__main__':
+    main()